@@ -0,0 +1,156 @@
+# library/src/anguis/arena.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any
+
+import functools
+
+import numpy as np
+
+# The moves corresponding to each of the 2-bit move codes (see also
+# anguis.engine.move_codes)
+moves = ((0, -1), (0, 1), (1, -1), (1, 1))
+
+class Arena:
+    """
+    Precomputed connectivity of the cells of an arena of a given shape,
+    so that the neighbours of a cell and the cell reached by each move
+    are looked up rather than recalculated from the flattened position
+    wherever they are needed (in the game engine, the bots and the
+    renderer). Arena objects for a given shape should be obtained with
+    getArena(), which creates each one only once.
+
+    Positions are flattened as for GameState, with the position
+    (i0, i1) corresponding to the flattened index i0 * n1 + i1.
+
+    The neighbours of each cell are always listed in the order: the
+    cell reached by the move (1, -1), then (1, 1), then (0, -1), then
+    (0, 1), omitting those outside the arena. The bots rely on this
+    order for reproducibility.
+
+    Attributes:
+        shape (2-tuple of ints): the dimensions of the arena
+        length (int): the number of cells in the arena
+        coords (2D numpy int array): coords[idx] gives the position
+            (i0, i1) of the flattened position idx
+        nbr_indptr (1D numpy int array): together with nbr_indices,
+            the neighbours of each cell in compressed sparse row form,
+            with the neighbours of cell idx being
+            nbr_indices[nbr_indptr[idx]:nbr_indptr[idx + 1]]
+        nbr_indices (1D numpy int array): see nbr_indptr
+        neighbour_table (2D numpy int array): the neighbours of each
+            cell as a row of 4 entries, padded with the value length
+            (so that arrays indexed by it may have an extra final
+            entry representing the outside of the arena)
+        neighbours (tuple of tuples of ints): the neighbours of each
+            cell, for use from Python code
+        move_neighbours (tuple of tuples of 2-tuples): for each cell,
+            the moves that remain within the arena each paired with
+            the neighbour they reach
+        next_table (2D numpy int array): next_table[i, idx] gives the
+            cell reached from cell idx by the move moves[i], or -1 if
+            that move leaves the arena
+        next_cells (dict): for each move, including the stationary
+            move (0, 0), a tuple giving the cell reached from each
+            cell by that move, or -1 if the move leaves the arena
+    """
+    def __init__(self, shape: Tuple[int, int]):
+        self.shape = tuple(shape)
+        n0, n1 = self.shape
+        self.length = n0 * n1
+
+        self.coords = np.stack(np.divmod(np.arange(self.length), n1), axis=1)
+        inds0, inds1 = self.coords[:, 0], self.coords[:, 1]
+        strides = (n1, 1)
+        bounds = (n0, n1)
+        next_table = np.full((len(moves), self.length), -1, dtype=np.intp)
+        for i, (axis, step) in enumerate(moves):
+            coord2 = (inds1 if axis else inds0) + step
+            ok = (coord2 >= 0) & (coord2 < bounds[axis])
+            next_table[i, ok] = np.flatnonzero(ok) + step * strides[axis]
+        self.next_table = next_table
+
+        nbr_order = [moves.index(mv) for mv in ((1, -1), (1, 1), (0, -1), (0, 1))]
+        self.neighbour_table = next_table[nbr_order].T.copy()
+        ok = self.neighbour_table >= 0
+        self.neighbour_table[~ok] = self.length
+        self.nbr_indptr = np.zeros(self.length + 1, dtype=np.intp)
+        np.cumsum(ok.sum(axis=1), out=self.nbr_indptr[1:])
+        self.nbr_indices = self.neighbour_table[ok]
+
+        nbr_moves = [moves[i] for i in nbr_order]
+        rows = self.neighbour_table.tolist()
+        self.neighbours = tuple(tuple(idx2 for idx2 in row if idx2 != self.length)\
+                for row in rows)
+        self.move_neighbours = tuple(tuple((mv, idx2) for mv, idx2 in zip(nbr_moves, row)\
+                if idx2 != self.length) for row in rows)
+        self.next_cells = {mv: tuple(row) for mv, row in zip(moves, next_table.tolist())}
+        self.next_cells[(0, 0)] = tuple(range(self.length))
+
+        self._screen_positions = {}
+        self._symmetries = None
+
+    @property
+    def symmetries(self) -> np.ndarray:
+        """
+        The symmetries of the arena (reflections and rotations mapping
+        the arena onto itself), being the 8 dihedral symmetries for a
+        square arena and otherwise the 4 symmetries generated by the
+        reflections in each axis, with the identity first.
+
+        2D numpy int array, where entry [s, idx] gives the flattened
+        position that the flattened position idx is mapped to by
+        symmetry s.
+        """
+        res = self._symmetries
+        if res is None:
+            n0, n1 = self.shape
+            i0, i1 = self.coords[:, 0], self.coords[:, 1]
+            r0, r1 = n0 - 1 - i0, n1 - 1 - i1
+            images = [(i0, i1), (r0, i1), (i0, r1), (r0, r1)]
+            if n0 == n1:
+                images.extend([(i1, i0), (r1, i0), (i1, r0), (r1, r0)])
+            res = np.stack([a * n1 + b for a, b in images])
+            self._symmetries = res
+        return res
+
+    def screenPositions(self, cell_size: int, topleft: Tuple[int, int]=(0, 0)) -> Tuple[Tuple[int, int]]:
+        """
+        Gives the screen position of the top left corner of every cell
+        when the arena is drawn with square cells of side cell_size
+        with its top left corner at topleft.
+
+        Args:
+            cell_size (int): the side length of the cells in pixels
+            topleft (2-tuple of ints), optional: the screen position of
+                the top left corner of the arena. Default: (0, 0)
+
+        Returns:
+        Tuple of 2-tuples of ints giving the screen position of each
+        flattened position.
+        """
+        key = (cell_size, tuple(topleft))
+        res = self._screen_positions.get(key)
+        if res is None:
+            pos = self.coords * cell_size + np.asarray(topleft, dtype=np.intp)
+            res = tuple(map(tuple, pos.tolist()))
+            self._screen_positions[key] = res
+        return res
+
+@functools.lru_cache(maxsize=None)
+def _getArena(shape: Tuple[int, int]) -> Arena:
+    return Arena(shape)
+
+def getArena(shape: Tuple[int, int]) -> Arena:
+    """
+    Gives the Arena object for arenas of the given shape, creating it
+    only the first time it is requested.
+
+    Args:
+        shape (2-tuple of ints): the dimensions of the arena
+
+    Returns:
+    Arena object for the given shape.
+    """
+    return _getArena(tuple(shape))
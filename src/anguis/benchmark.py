@@ -0,0 +1,388 @@
+# library/src/anguis/benchmark.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Iterable, TextIO
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from anguis.bots import TailChaserBot
+from anguis.sim import playBotGame, bot_classes
+from anguis.utils import randomSampleWithoutReplacement, randomDistinctIntegers,\
+        randomKSubset, randomDistinctIntegersMany
+
+default_shapes = ((10, 10), (20, 20), (50, 50), (100, 100))
+default_fruit_counts = (1, 3)
+default_search_depths = (2, 4)
+
+# The metrics of each configuration compared by compareBenchmarks(),
+# each with whether larger values are better
+compared_metrics = (
+    ("completion_rate", True),
+    ("mean_length", True),
+    ("mean_moves_to_finish", False),
+    ("latency_ms_p50", False),
+    ("latency_ms_p95", False),
+    ("latency_ms_max", False),
+)
+
+def _playBenchmarkGame(kwargs: Dict[str, Any]) -> Tuple[Dict[str, Any], np.ndarray]:
+    move_times = []
+    res = playBotGame(move_times=move_times, **kwargs)
+    return res, np.array(move_times, dtype=np.float64)
+
+def summariseGames(results: List[Dict[str, Any]], move_times: np.ndarray) -> Dict[str, Any]:
+    """
+    Calculates the benchmark metrics of a set of games played with the
+    same configuration.
+
+    Args:
+        results (list of dicts): the results of the games (see
+            anguis.sim.playBotGame())
+        move_times (1D numpy float array): the time in seconds taken
+            by the bot to choose each move, over all of the games
+
+    Returns:
+    Dictionary with the keys "games", "outcomes" (the number of games
+    with each outcome), "completion_rate" (the proportion of games in
+    which the snake filled the arena), "mean_length" (the mean final
+    length of the snake), "mean_moves_to_finish" (the mean number of
+    moves taken in the games that were completed, or None if there
+    were none), "mean_moves", "latency_ms_p50", "latency_ms_p95" and
+    "latency_ms_max" (the median, 95th percentile and maximum time
+    taken to choose a move in milliseconds, or None if no moves were
+    made).
+    """
+    n = len(results)
+    outcomes = {}
+    for res in results:
+        outcomes[res["outcome"]] = outcomes.get(res["outcome"], 0) + 1
+    won_moves = [res["moves"] for res in results if res["outcome"] == "won"]
+    if move_times.size:
+        p50, p95 = np.percentile(move_times, (50, 95)) * 1000
+        latency = (float(p50), float(p95), float(move_times.max()) * 1000)
+    else: latency = (None, None, None)
+    return {
+        "games": n,
+        "outcomes": outcomes,
+        "completion_rate": len(won_moves) / n if n else None,
+        "mean_length": sum(res["score"] + 1 for res in results) / n if n else None,
+        "mean_moves_to_finish": sum(won_moves) / len(won_moves) if won_moves else None,
+        "mean_moves": sum(res["moves"] for res in results) / n if n else None,
+        "latency_ms_p50": latency[0],
+        "latency_ms_p95": latency[1],
+        "latency_ms_max": latency[2],
+    }
+
+def benchmarkConfigurations(
+    shapes: Iterable[Tuple[int, int]]=default_shapes,
+    fruit_counts: Iterable[int]=default_fruit_counts,
+    search_depths: Iterable[int]=default_search_depths,
+    bots: Iterable[str]=("tail-chaser",),
+) -> List[Dict[str, Any]]:
+    """
+    Gives the configurations covered by a benchmark, being every
+    combination of the given bots, arena shapes, fruit counts and
+    search depths, except that bots other than TailChaserBot (which
+    ignore the search depth) are only included once for each arena
+    shape and fruit count, with search depth None.
+
+    Returns:
+    List of dictionaries with the keys "bot", "arena_shape", "n_fruit"
+    and "search_depth".
+    """
+    res = []
+    for bot in bots:
+        depths = tuple(search_depths) if bot_classes[bot] is TailChaserBot else (None,)
+        for shape in shapes:
+            for n_fruit in fruit_counts:
+                for depth in depths:
+                    res.append({"bot": bot, "arena_shape": tuple(shape),\
+                            "n_fruit": n_fruit, "search_depth": depth})
+    return res
+
+def runBenchmark(
+    configs: List[Dict[str, Any]],
+    n_games: int=3,
+    base_seed: int=0,
+    max_moves: Optional[int]=None,
+    max_seconds: Optional[float]=None,
+    n_workers: int=1,
+    progress_func: Optional[Callable[[Dict[str, Any]], None]]=None,
+) -> Dict[str, Any]:
+    """
+    Plays n_games seeded headless games (with seeds base_seed to
+    base_seed + n_games - 1, so that every configuration and every
+    run of the benchmark plays the same games) for each configuration
+    and summarises the results.
+
+    Per-move latencies are affected by other processes running at the
+    same time, so n_workers should be left at 1 unless only the
+    quality of play is of interest.
+
+    Args:
+        configs (list of dicts): the configurations (see
+            benchmarkConfigurations())
+        n_games (int), optional: the number of games played for each
+            configuration. Default: 3
+        base_seed (int), optional: the seed of the first game of each
+            configuration. Default: 0
+        max_moves (int), optional: the number of moves after which
+            each game is abandoned (see anguis.sim.playBotGame())
+        max_seconds (float), optional: if given, the number of seconds
+            after which each game is abandoned
+        n_workers (int), optional: the number of worker processes,
+            with 1 meaning that games are played in this process.
+            Default: 1
+        progress_func (callable), optional: if given, called with the
+            result of each configuration as it completes
+
+    Returns:
+    Dictionary with the keys "metadata" (describing the environment in
+    which the benchmark was run) and "results" (a list with, for each
+    configuration, a dictionary containing the configuration, the
+    summary of its games (see summariseGames()) and, under the key
+    "game_results", the result of each game).
+    """
+    params = {"n_games": n_games, "base_seed": base_seed,\
+            "max_moves": max_moves, "max_seconds": max_seconds}
+    executor = None if n_workers == 1 else\
+            concurrent.futures.ProcessPoolExecutor(max_workers=n_workers)
+    results = []
+    try:
+        for config in configs:
+            kwargs_lst = [{
+                "arena_shape": config["arena_shape"],
+                "n_fruit": config["n_fruit"],
+                "search_depth": 4 if config["search_depth"] is None else config["search_depth"],
+                "bot": config["bot"],
+                "seed": base_seed + i,
+                "max_moves": max_moves,
+                "max_seconds": max_seconds,
+            } for i in range(n_games)]
+            if executor is None:
+                games = [_playBenchmarkGame(kwargs) for kwargs in kwargs_lst]
+            else:
+                games = list(executor.map(_playBenchmarkGame, kwargs_lst))
+            game_results = [res for res, _ in games]
+            move_times = np.concatenate([times for _, times in games])
+            res = {
+                **config,
+                "arena_shape": list(config["arena_shape"]),
+                **summariseGames(game_results, move_times),
+                "game_results": game_results,
+            }
+            results.append(res)
+            if progress_func is not None:
+                progress_func(res)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return {"metadata": benchmarkMetadata(params), "results": results}
+
+def benchmarkMetadata(params: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        anguis_version = version("anguis")
+    except PackageNotFoundError:
+        anguis_version = None
+    return {
+        "anguis_version": anguis_version,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "params": params,
+    }
+
+def _configKey(res: Dict[str, Any]) -> Tuple[Any]:
+    return (res["bot"], tuple(res["arena_shape"]), res["n_fruit"], res["search_depth"])
+
+def compareBenchmarks(old: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Compares the results of two runs of the benchmark (as returned by
+    runBenchmark() or read from its JSON output) for each
+    configuration present in both.
+
+    Returns:
+    List with, for each configuration present in both runs, a
+    dictionary containing the configuration and, for each of the
+    metrics in compared_metrics, the key of the metric mapped to a
+    dictionary with the keys "old", "new", "change" (the relative
+    change, or None if it cannot be calculated) and "better" (whether
+    the new value is better, or None if they are equal or either is
+    missing).
+    """
+    old_results = {_configKey(res): res for res in old["results"]}
+    comparison = []
+    for res in new["results"]:
+        key = _configKey(res)
+        if key not in old_results.keys(): continue
+        res0 = old_results[key]
+        row = {"bot": key[0], "arena_shape": list(key[1]), "n_fruit": key[2], "search_depth": key[3]}
+        for metric, larger_better in compared_metrics:
+            v0, v1 = res0.get(metric), res.get(metric)
+            change = better = None
+            if v0 is not None and v1 is not None:
+                if v0: change = (v1 - v0) / abs(v0)
+                if v0 != v1: better = (v1 > v0) == larger_better
+            row[metric] = {"old": v0, "new": v1, "change": change, "better": better}
+        comparison.append(row)
+    return comparison
+
+default_sampling_cases = ((100, 1), (100, 10), (10000, 10), (10000, 100), (10 ** 6, 1000), (10 ** 12, 1000))
+
+def benchmarkSampling(cases: Iterable[Tuple[int, int]]=default_sampling_cases,\
+        n_samples: int=1000, seed: int=0) -> List[Dict[str, Any]]:
+    """
+    Times drawing n_samples samples of k distinct integers from
+    range(n) for each (n, k) in cases, with each of
+    randomSampleWithoutReplacement(), randomDistinctIntegers() and
+    randomKSubset() called once per sample and with
+    randomDistinctIntegersMany() drawing all of the samples in one
+    call (where n is within the range of numpy ints).
+
+    Returns:
+    List with, for each case and function, a dictionary with the keys
+    "n", "k", "function" and "us_per_sample" (the mean time per sample
+    in microseconds).
+    """
+    funcs = {
+        "randomSampleWithoutReplacement": randomSampleWithoutReplacement,
+        "randomDistinctIntegers": randomDistinctIntegers,
+        "randomKSubset": randomKSubset,
+    }
+    res = []
+    for n, k in cases:
+        for name, func in funcs.items():
+            rng = random.Random(seed)
+            t0 = time.perf_counter()
+            for _ in range(n_samples):
+                func(n, k, rng=rng)
+            dt = time.perf_counter() - t0
+            res.append({"n": n, "k": k, "function": name, "us_per_sample": dt / n_samples * 1e6})
+        if n < 2 ** 63:
+            rng = np.random.default_rng(seed)
+            t0 = time.perf_counter()
+            randomDistinctIntegersMany(n, k, n_samples, rng=rng)
+            dt = time.perf_counter() - t0
+            res.append({"n": n, "k": k, "function": "randomDistinctIntegersMany",\
+                    "us_per_sample": dt / n_samples * 1e6})
+    return res
+
+def _formatSummary(res: Dict[str, Any]) -> str:
+    def fmt(v: Optional[float], spec: str) -> str:
+        return "-" if v is None else format(v, spec)
+    shape = "x".join(map(str, res["arena_shape"]))
+    depth = "-" if res["search_depth"] is None else res["search_depth"]
+    return (f"{res['bot']:<12} {shape:>8} fruits={res['n_fruit']} depth={depth} "
+            f"completion={fmt(res['completion_rate'], '.2f')} "
+            f"length={fmt(res['mean_length'], '.1f')} "
+            f"moves_to_finish={fmt(res['mean_moves_to_finish'], '.0f')} "
+            f"latency_ms p50={fmt(res['latency_ms_p50'], '.3f')} "
+            f"p95={fmt(res['latency_ms_p95'], '.3f')} "
+            f"max={fmt(res['latency_ms_max'], '.3f')}")
+
+def main(argv: Optional[List[str]]=None) -> None:
+    parser = argparse.ArgumentParser(prog="anguis-bench",\
+            description="Benchmarks the quality of play and the per-move "
+            "latency of the bots over a matrix of arena shapes, fruit "
+            "counts and search depths, writing the results as JSON.")
+    # Given as for anguis-sim, repeated for each shape
+    parser.add_argument("--shape", type=int, nargs=2, action="append",\
+            default=None, dest="shapes", metavar=("WIDTH", "HEIGHT"),\
+            help="arena shape, which may be given more than once (default: "
+            "10 10, 20 20, 50 50 and 100 100)")
+    parser.add_argument("--fruits", type=int, nargs="+",\
+            default=list(default_fruit_counts), help="fruit counts (default: 1 3)")
+    parser.add_argument("--depths", type=int, nargs="+",\
+            default=list(default_search_depths),\
+            help="search depths of TailChaserBot (default: 2 4)")
+    parser.add_argument("--bots", nargs="+", choices=tuple(bot_classes.keys()),\
+            default=["tail-chaser"], help="bots to benchmark (default: tail-chaser)")
+    parser.add_argument("-n", "--games", type=int, default=3,\
+            help="number of games per configuration (default: 3)")
+    parser.add_argument("--seed", type=int, default=0,\
+            help="seed of the first game of each configuration (default: 0)")
+    parser.add_argument("--max-moves", type=int, default=None,\
+            help="moves after which a game is abandoned (default: 100 "
+            "times the arena area)")
+    parser.add_argument("--max-seconds", type=float, default=60.,\
+            help="seconds after which a game is abandoned, with 0 for no "
+            "limit (default: 60)")
+    parser.add_argument("-j", "--workers", type=int, default=1,\
+            help="number of worker processes, which affects the measured "
+            "latencies (default: 1)")
+    parser.add_argument("-o", "--output", default="-",\
+            help="output JSON file, or - for stdout (default: -)")
+    parser.add_argument("--compare", default=None, metavar="BASELINE",\
+            help="JSON output of a previous run, against which the "
+            "results are compared (written to stderr)")
+    parser.add_argument("--sampling", action="store_true",\
+            help="instead of the bots, benchmark the random sampling "
+            "functions of anguis.utils against each other")
+    parser.add_argument("--samples", type=int, default=1000,\
+            help="number of samples per case of the sampling benchmark "
+            "(default: 1000)")
+    args = parser.parse_args(argv)
+
+    if args.sampling:
+        res = {"metadata": benchmarkMetadata({"n_samples": args.samples, "seed": args.seed}),\
+                "results": benchmarkSampling(n_samples=args.samples, seed=args.seed)}
+        for row in res["results"]:
+            print(f"n={row['n']:<14} k={row['k']:<5} {row['function']:<32} "
+                    f"{row['us_per_sample']:10.2f} us/sample", file=sys.stderr)
+        if args.output == "-":
+            json.dump(res, sys.stdout, indent=1)
+            sys.stdout.write("\n")
+        else:
+            with open(args.output, "w") as f:
+                json.dump(res, f, indent=1)
+        return
+
+    shapes = default_shapes if args.shapes is None else [tuple(shape) for shape in args.shapes]
+    configs = benchmarkConfigurations(shapes, args.fruits, args.depths, args.bots)
+    res = runBenchmark(
+        configs,
+        n_games=args.games,
+        base_seed=args.seed,
+        max_moves=args.max_moves,
+        max_seconds=args.max_seconds or None,
+        n_workers=args.workers,
+        progress_func=lambda res: print(_formatSummary(res), file=sys.stderr, flush=True),
+    )
+    if args.output == "-":
+        json.dump(res, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for row in compareBenchmarks(baseline, res):
+            shape = "x".join(map(str, row["arena_shape"]))
+            changes = []
+            for metric, _ in compared_metrics:
+                d = row[metric]
+                if d["change"] is None: continue
+                mark = "" if d["better"] is None else (" (better)" if d["better"] else " (worse)")
+                changes.append(f"{metric} {d['change']:+.1%}{mark}")
+            print(f"{row['bot']} {shape} fruits={row['n_fruit']} "
+                    f"depth={row['search_depth']}: " + ", ".join(changes), file=sys.stderr)
+    return
+
+if __name__ == "__main__":
+    main()
@@ -5,89 +5,171 @@ from __future__ import annotations
 from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Generator, TYPE_CHECKING
 
 from collections import deque
+import heapq
 import random
+import threading
+import time
 
+import numpy as np
+
+from anguis.arena import getArena
+from anguis.engine import GameState, cell_empty, cell_fruit, cell_body, cell_head
+from anguis.hamiltonian import loadHamiltonianCycle
+from anguis.regions import RegionEvaluator
+from anguis.transposition import ZobristHasher, TranspositionTable
 from anguis.utils import UnionFind
 
+class SearchTimeout(Exception):
+    """
+    Raised within a bot search when its deadline has passed
+    """
+    pass
+
 class TailChaserBot:
-    def __init__(self, shape: Tuple[int], head_idx: int, head_direct: Tuple[int], fruits: Set[int], snake_qu: Optional[deque]=None):
+    def __init__(self, shape: Tuple[int], head_idx: int, head_direct: Tuple[int], fruits: Set[int], snake_qu: Optional[deque]=None, rng: Optional[random.Random]=None, grid: Optional[bytearray]=None, tt_size_log2: Optional[int]=15):
         self.shape = shape
+        self.arena = getArena(shape)
+        # Evaluations of the moves from positions reached in the search
+        # are stored in a transposition table, keyed by the Zobrist
+        # hash of the position folded over the symmetries of the arena,
+        # so that they are not recalculated when the same position (or
+        # a reflection or rotation of it) is reached again, including
+        # in later searches. The evaluations depend only on the
+        # position, so entries never become invalid. If tt_size_log2
+        # is None, no table is used.
+        if tt_size_log2 is None:
+            self.hasher = self.tt = None
+        else:
+            self.hasher = ZobristHasher(self.arena)
+            self.tt = TranspositionTable(tt_size_log2)
+        self._snake_hashes = None
+        # Source of randomness for breaking ties between equally good
+        # moves, which may be given a seed for reproducibility
+        self.rng = random if rng is None else rng
         self.length = shape[0] * shape[1]
         #self.head_idx = head_idx
         self.head_direct = head_direct
-        if snake_qu is None:
-            self.snake_qu = deque([head_idx])
-            self.in_snake = {head_idx}
+        # If given a grid (e.g. GameState.grid), the bot reads the
+        # snake and the occupied cells directly from the game, which
+        # (rather than the bot) is responsible for updating the grid
+        # and snake_qu, and the effects of each move on the bot's
+        # other records are applied at the start of the next call to
+        # addFruitFindMoveAndUpdate(). In this case snake_qu must be
+        # the game's own deque of snake positions.
+        self.shares_state = grid is not None
+        self._pending_update = None
+        if self.shares_state:
+            self.snake_qu = snake_qu
+            self.grid = grid
         else:
-            self.snake_qu = deque(snake_qu)
-            self.in_snake = set(snake_qu)
+            self.snake_qu = deque([head_idx] if snake_qu is None else snake_qu)
+            self.grid = bytearray(self.length)
+            for idx in self.snake_qu:
+                self.grid[idx] = cell_body
+            self.grid[self.snake_qu[-1]] = cell_head
         
-        self.fruit_dist_arrs = {}
+        # Distance (in moves through unoccupied cells) from each cell
+        # to the nearest fruit, with dist_inf for cells from which no
+        # fruit can be reached. Accessed in the search through the
+        # memoryview fruit_dist_view, which is faster for reading and
+        # writing single elements than the array itself
+        self.dist_inf = self.length
+        self.fruits = set()
+        self.fruit_dist = np.full(self.length, self.dist_inf, dtype=np.int32)
+        self.fruit_dist_view = memoryview(self.fruit_dist)
         for fruit in fruits:
             self.addFruit(fruit)
         
+        # The depth reached by the most recent search
+        self.last_search_depth = 0
+        # The sequence of moves (each as the move and the resulting head
+        # position) leading to the best outcome found by the most
+        # recent call of findMove(), starting with the chosen move
+        self.principal_variation = []
+        
     
     def possibleMoveGenerator(self, head_idx: int, direct: Optional[Tuple[int]]=None)\
             -> Generator[Tuple[Tuple[int], int], None, None]:
         direct_opp = (direct[0], -direct[1]) if direct else None
-        step = 1
-        inds = divmod(head_idx, self.shape[1])
         tail_end_idx = self.snake_qu[0] if self.snake_qu else None
-        for i in reversed(range(2)):
-            for mv, idx2, edge_func in (((i, -1), head_idx - step, (lambda x: x > 0)), ((i, 1), head_idx + step, (lambda x: x < self.shape[i] - 1))):
-                if mv != direct_opp and edge_func(inds[i]) and (idx2 == tail_end_idx or idx2 not in self.in_snake):
-                    yield (mv, idx2)
-            step *= self.shape[i]
+        grid = self.grid
+        for mv, idx2 in self.arena.move_neighbours[head_idx]:
+            if mv != direct_opp and (idx2 == tail_end_idx or grid[idx2] < cell_body):
+                yield (mv, idx2)
         return
     
-    def possibleNextPositionGenerator(self, idx: int, in_snake: Optional[Set[int]]=None)\
+    def possibleNextPositionGenerator(self, idx: int, grid: Optional[bytearray]=None)\
             -> Generator[int, None, None]:
-        if in_snake is None:
-            in_snake = self.in_snake
-        step = 1
-        inds = divmod(idx, self.shape[1])
-        for i in reversed(range(2)):
-            for idx2, edge_func in ((idx - step, (lambda x: x > 0)), (idx + step, (lambda x: x < self.shape[i] - 1))):
-                if edge_func(inds[i]) and idx2 not in in_snake:
-                    yield idx2
-            step *= self.shape[i]
+        if grid is None:
+            grid = self.grid
+        for idx2 in self.arena.neighbours[idx]:
+            if grid[idx2] < cell_body:
+                yield idx2
         return
                 
     
-    def createFruitDistanceArray(self, fruit_idx: int) -> List[Union[int, float]]:
-        arr = [float("inf")] * self.length
-        qu = deque([fruit_idx])
-        arr[fruit_idx] = 0
-        for d in range(1, self.length):
-            if not qu: break
-            for _ in range(len(qu)):
-                idx = qu.popleft()
-                for idx2 in self.possibleNextPositionGenerator(idx):
-                    if d >= arr[idx2]: continue
-                    arr[idx2] = d
-                    qu.append(idx2)
-        return arr
+    def createFruitDistanceField(self, fruits: Set[int], grid: Optional[bytes]=None) -> np.ndarray:
+        """
+        Finds the distance from each cell to the nearest of the given
+        fruits by breadth first search from all of the fruits at once,
+        with the whole frontier at each distance expanded together.
+
+        Args:
+            fruits (set of ints): the flattened positions of the fruits
+            grid (bytes-like), optional: the state of each cell (see
+                GameState.grid) through which the distances are found.
+                If not given or given as None, uses the bot's grid.
+
+        Returns:
+        1D numpy int array giving the distance for each flattened
+        position, with dist_inf for positions from which none of the
+        fruits can be reached.
+        """
+        if grid is None:
+            grid = self.grid
+        res = np.full(self.length + 1, self.dist_inf, dtype=np.int32)
+        passable = np.zeros(self.length + 1, dtype=bool)
+        passable[:-1] = np.frombuffer(grid, dtype=np.uint8) < cell_body
+        frontier = np.fromiter(fruits, dtype=np.intp, count=len(fruits))
+        res[frontier] = 0
+        passable[frontier] = False
+        d = 0
+        while frontier.size:
+            d += 1
+            frontier = self.arena.neighbour_table[frontier].ravel()
+            frontier = np.unique(frontier[passable[frontier]])
+            res[frontier] = d
+            passable[frontier] = False
+        return res[:-1]
     
-    def updateFruitDistanceArray(self, arr: List[Union[int, float]], snake_add: int, snake_rm: Optional[int]) -> None:
-        # Assumes self.in_snake has been updated already
+    def updateFruitDistanceField(self, snake_add: int, snake_rm: Optional[int]) -> None:
+        # Assumes self.grid has been updated already. Any cell whose
+        # distance may have depended on snake_add is reset, and the
+        # distances of those cells are then found again from their
+        # neighbours
+        arr = self.fruit_dist_view
+        inf = self.dist_inf
         qu1 = deque([(snake_add, arr[snake_add])])
-        arr[snake_add] = float("inf")
+        arr[snake_add] = inf
         qu2 = deque()
         while qu1:
             #print("qu1")
             #print(f"qu1 = {qu1}")
             idx, val = qu1.popleft()
             for idx2 in self.possibleNextPositionGenerator(idx):
-                if isinstance(arr[idx2], float): continue
+                if arr[idx2] == inf: continue
                 if arr[idx2] == val + 1:
                     qu1.append((idx2, arr[idx2]))
-                    arr[idx2] = float("inf")
+                    arr[idx2] = inf
                 elif arr[idx2] <= val:
                     qu2.append(idx2)
-        if snake_rm is not None:
+        # The vacated cell only becomes passable if the snake has not
+        # moved straight back into it (i.e. the head following the end
+        # of the tail)
+        if snake_rm is not None and snake_rm != snake_add and self.grid[snake_rm] < cell_body:
             idx2_set = set(self.possibleNextPositionGenerator(snake_rm))
-            val = min(arr[idx2] for idx2 in idx2_set) if idx2_set else float("inf")
-            if isinstance(val, int):
+            val = min(arr[idx2] for idx2 in idx2_set) if idx2_set else inf
+            if val < inf:
                 arr[snake_rm] = val + 1
                 qu2.append(snake_rm)
         while qu2:
@@ -102,118 +184,274 @@ class TailChaserBot:
         return arr
     
     def addFruit(self, add_fruit: int) -> None:
-        self.fruit_dist_arrs[add_fruit] = self.createFruitDistanceArray(add_fruit)
+        if not self.shares_state:
+            self.grid[add_fruit] = cell_fruit
+        self.fruits.add(add_fruit)
+        # Distances can only decrease, so the new distance of each
+        # cell is the smaller of its previous distance and its
+        # distance to the new fruit
+        np.minimum(self.fruit_dist, self.createFruitDistanceField({add_fruit}),\
+                out=self.fruit_dist)
         return
         
     def removeFruit(self, rm_fruit: int) -> None:
-        self.fruit_dist_arrs.pop(rm_fruit)
+        # The distances are updated once the position of the fruit is
+        # occupied by the snake (see update())
+        self.fruits.remove(rm_fruit)
         return
     
-    def update(self, head_idx: int, head_direct: Tuple[int], rm_fruit: Optional[int], rm_tail_end: bool=True) -> None:
-        
+    def resync(self, fruits: Set[int], head_direct: Tuple[int]) -> None:
+        """
+        Brings the bot's records up to date with a game whose state
+        has been changed other than by the bot's moves (e.g. by
+        GameState.restoreSnapshot()), keeping the transposition table,
+        whose entries depend only on the position and so remain valid.
+        The bot must share its grid and snake with the game (see
+        shares_state), which should already have been changed.
+
+        Args:
+            fruits (set of ints): the flattened positions of the
+                fruits
+            head_direct (2-tuple of ints): the most recent move
+        """
+        self._pending_update = None
+        self.head_idx = self.snake_qu[-1]
+        self.head_direct = tuple(head_direct)
+        self.fruits = set(fruits)
+        self.fruit_dist[:] = self.createFruitDistanceField(self.fruits)
+        return
+    
+    def update(self, head_idx: int, head_direct: Tuple[int], rm_fruit: Optional[int], rm_tail_end: bool=True, rm_tail_idx: Optional[int]=None) -> None:
+        # If the bot shares its grid with the game, this should be
+        # called after the game has made the move, with rm_tail_idx
+        # the position vacated by the end of the tail (if any)
         self.head_idx = head_idx
         self.head_direct = head_direct
-        if rm_tail_end:
-            rm_tail_idx = self.snake_qu.popleft()
-            self.in_snake.remove(rm_tail_idx)
-        else: rm_tail_idx = None
-        self.in_snake.add(head_idx)
-        self.snake_qu.append(head_idx)
+        if self.shares_state:
+            if not rm_tail_end: rm_tail_idx = None
+        else:
+            self.grid[self.snake_qu[-1]] = cell_body
+            if rm_tail_end:
+                rm_tail_idx = self.snake_qu.popleft()
+                self.grid[rm_tail_idx] = cell_empty
+            else: rm_tail_idx = None
+            self.grid[head_idx] = cell_head
+            self.snake_qu.append(head_idx)
         if rm_fruit is not None:
             self.removeFruit(rm_fruit)
-        for arr in self.fruit_dist_arrs.values():
-            self.updateFruitDistanceArray(arr, head_idx, rm_tail_idx)
+        self.updateFruitDistanceField(head_idx, rm_tail_idx)
         return
     
+    @property
+    def region_union_find(self) -> UnionFind:
+        # Union-find over the cells of the arena used by moveGroups(),
+        # which rolls back its unions so that every cell is again in
+        # its own set on return, rather than one being created for
+        # each position searched
+        res = getattr(self, "_region_union_find", None)
+        if res is None:
+            res = UnionFind(self.arena.length)
+            self._region_union_find = res
+        return res
+    
     def moveGroups(self) -> Tuple[Dict[int, int]]:
         idx_prev = self.snake_qu[-2] if len(self.snake_qu) >= 2 else None
         head_idx = self.snake_qu[-1]
         tail_idx = self.snake_qu.popleft()
-        self.in_snake.remove(tail_idx)
-        idx_lst = [idx for idx in self.possibleNextPositionGenerator(head_idx, in_snake=self.in_snake) if idx != idx_prev]
-        uf = UnionFind(len(idx_lst))
+        tail_cell = self.grid[tail_idx]
+        self.grid[tail_idx] = cell_empty
+        idx_lst = [idx for idx in self.possibleNextPositionGenerator(head_idx) if idx != idx_prev]
+        uf = self.region_union_find
+        checkpoint = uf.checkpoint()
         seen = {}
         tail_connected = set()
         qu = deque()
-        group_sizes = []#[1] * len(idx_lst)
         for i, idx in enumerate(idx_lst):
             if idx == tail_idx:
-                #print("hello")
-                group_sizes.append(0)
                 tail_connected.add(i)
-                #print(i, idx)
                 continue
-            group_sizes.append(1)
             qu.append(idx)
             seen[idx] = i
         while qu:
             idx = qu.popleft()
             i = seen[idx]
-            for idx2 in self.possibleNextPositionGenerator(idx, in_snake=self.in_snake):
+            for idx2 in self.possibleNextPositionGenerator(idx):
                 if idx2 == tail_idx:
                     tail_connected.add(i)
-                elif idx2 in seen.keys():
-                    uf.union(i, seen[idx2])
-                    #if len(uf.group_sizes) == 1: break
-                else:
+                    continue
+                if idx2 not in seen.keys():
                     seen[idx2] = i
-                    group_sizes[i] += 1
                     qu.append(idx2)
-            else: continue
-            break
+                uf.union(idx, idx2)
         self.snake_qu.appendleft(tail_idx)
-        self.in_snake.add(tail_idx)
-        group_size_dict = {}
-        for i, sz in enumerate(group_sizes):
-            i2 = uf.find(i)
-            idx2 = idx_lst[i2]
-            group_size_dict[idx2] = group_size_dict.get(idx2, 0) + sz
-        tail_connected = {idx_lst[uf.find(i)] for i in tail_connected}
+        self.grid[tail_idx] = tail_cell
+        # Each region is labelled by the first of the cells adjacent
+        # to the head in that region, with the end of the tail (which
+        # is never joined to a region) in a region of size 0
+        labels = {}
+        group_rep_dict = {}
+        for idx in idx_lst:
+            group_rep_dict[idx] = labels.setdefault(uf.find(idx), idx)
+        group_size_dict = {idx: 0 if idx == tail_idx else uf.groupSize(idx)\
+                for idx in labels.values()}
+        tail_connected = {group_rep_dict[idx_lst[i]] for i in tail_connected}
+        uf.rollback(checkpoint)
         
-        res = ({idx: idx_lst[uf.find(i)] for i, idx in enumerate(idx_lst)}, group_size_dict, tail_connected, seen)
+        res = (group_rep_dict, group_size_dict, tail_connected, seen)
         #print(res)
         return res
     
-    def findMove(self, search_depth: int=1) -> Tuple[int]:
+    def _makeMove(self, idx: int, fruits_remain: Set[int]) -> Tuple[Optional[int]]:
+        # Moves the head of the snake to idx during the search,
+        # returning the information needed by _unmakeMove() to undo
+        # the move
+        grid = self.grid
+        if idx in fruits_remain:
+            fruits_remain.remove(idx)
+            tail_idx, tail_cell = None, None
+        else:
+            tail_idx = self.snake_qu.popleft()
+            tail_cell = grid[tail_idx]
+            grid[tail_idx] = cell_empty
+        idx_cell = grid[idx]
+        grid[idx] = cell_body
+        self.snake_qu.append(idx)
+        if self._snake_hashes is not None:
+            self._snake_hashes = self.hasher.toggle(self._snake_hashes, idx)
+            if tail_idx is not None:
+                self._snake_hashes = self.hasher.toggle(self._snake_hashes, tail_idx)
+        return (idx, idx_cell, tail_idx, tail_cell)
+    
+    def _unmakeMove(self, undo: Tuple[Optional[int]], fruits_remain: Set[int]) -> None:
+        idx, idx_cell, tail_idx, tail_cell = undo
+        if self._snake_hashes is not None:
+            self._snake_hashes = self.hasher.toggle(self._snake_hashes, idx)
+            if tail_idx is not None:
+                self._snake_hashes = self.hasher.toggle(self._snake_hashes, tail_idx)
+        self.snake_qu.pop()
+        self.grid[idx] = idx_cell
+        if tail_idx is None:
+            fruits_remain.add(idx)
+        else:
+            self.snake_qu.appendleft(tail_idx)
+            self.grid[tail_idx] = tail_cell
+        return
+    
+    def findMove(self, search_depth: int=1, deadline: Optional[float]=None, pv: Optional[List[Tuple[Tuple[int], int]]]=None) -> Tuple[int]:
+        """
+        Searches search_depth moves ahead for the move that keeps the
+        largest area accessible to the head (preferring areas that
+        the end of the tail can be reached from), then collects the
+        most fruits and then gets closest to a fruit.
+
+        Args:
+            search_depth (int), optional: the number of moves to search
+                ahead. Default: 1
+            deadline (float), optional: if given, the value of
+                time.perf_counter() after which the search is abandoned
+                by raising SearchTimeout
+            pv (list of 2-tuples), optional: if given, a sequence of
+                moves (each as the move and the resulting head
+                position) to search first, e.g. the principal
+                variation found by a shallower search. At each depth
+                along this sequence, its move is searched before the
+                other moves, which are searched in the usual order.
+
+        Returns:
+        2-tuple whose index 0 is the chosen move and index 1 the
+        flattened position of the head after that move. The sequence
+        of moves leading to the best outcome found is recorded in
+        principal_variation.
+
+        Raises:
+            SearchTimeout: if the deadline passes during the search
+        """
         #print(f"search depth = {search_depth}")
         orig_mv = self.head_direct
         best = [-1, False, (-1, 0, -float("inf")), None]
         #mv, idx = None, None
-        fruits_remain = set(self.fruit_dist_arrs.keys())
+        # The moves from the root to the position being searched, and
+        # the moves leading to the best outcome found so far
+        line, best_line = [], []
+        fruits_remain = set(self.fruits)
         n_fruits = len(fruits_remain)
+        # Once fruits have been eaten during the search, the distances
+        # to the remaining fruits are found from the grid at the start
+        # of the search, as for the fruit distance field
+        dist_inf = self.dist_inf
+        grid0 = bytes(self.grid) if n_fruits > 1 else None
+        tt, hasher = self.tt, self.hasher
+        if tt is not None:
+            self._snake_hashes = hasher.hashCells(self.snake_qu)
+        dist_views = {n_fruits: self.fruit_dist_view}
+        def fruitDistanceView() -> memoryview:
+            key = frozenset(fruits_remain) if len(fruits_remain) < n_fruits else n_fruits
+            res = dist_views.get(key)
+            if res is None:
+                res = memoryview(self.createFruitDistanceField(fruits_remain, grid=grid0))
+                dist_views[key] = res
+            return res
         #print()
-        def recur(prev_mv: Tuple[int], depth: int=1) -> bool:
+        def recur(prev_mv: Tuple[int], depth: int=1, on_pv: bool=False) -> bool:
             head_idx = self.snake_qu[-1]
             groups = [{}, {}]
+            # The regions available after each move are found together
+            # on evaluating the first move (see RegionEvaluator), unless
+            # the evaluations of the moves from this position have
+            # already been stored
+            evaluator = None
+            tt_entry, tt_new = None, None
+            if tt is not None and len(self.snake_qu) >= 3:
+                tt_key, sym = hasher.positionKey(self._snake_hashes, head_idx,\
+                        self.snake_qu[0], self.snake_qu[1], fruits_remain)
+                tt_entry = tt.get(tt_key)
+                if tt_entry is None:
+                    tt_new = {}
+                sym_map, sym_inv = hasher.symmetry_tuples[sym], hasher.inverse_tuples[sym]
             # Finding the appropriate order
             for mv, idx in self.possibleMoveGenerator(head_idx, prev_mv):
-                if idx in fruits_remain:
-                    is_fruit = True
-                    fruits_remain.remove(idx)
-                    if len(self.snake_qu) + len(self.fruit_dist_arrs) == self.length:
-                        best[0] = float("inf")
-                        if depth == 1:
-                            best[3] = (mv, idx)
-                        #print("endgame")
-                        #print(f"depth = {depth}")
-                        #print(best)
-                        return True
+                # Checked before evaluating each move, as evaluation
+                # involves a search of the free space
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise SearchTimeout()
+                if idx in fruits_remain and len(self.snake_qu) + n_fruits == self.length:
+                    best[0] = float("inf")
+                    if depth == 1:
+                        best[3] = (mv, idx)
+                    best_line[:] = line + [(mv, idx)]
+                    #print("endgame")
+                    #print(f"depth = {depth}")
+                    #print(best)
+                    return True
+                if tt_entry is not None:
+                    # The sizes of the candidate regions, each with one
+                    # of the cells adjacent to the head in that region
+                    tail_connected, members = tt_entry[sym_map[idx]]
+                    members = [(sz, sym_inv[idx2]) for sz, idx2 in members]
+                    undo = self._makeMove(idx, fruits_remain)
                 else:
-                    is_fruit = False
-                    tail_idx = self.snake_qu.popleft()
-                    self.in_snake.remove(tail_idx)
-                self.snake_qu.append(idx)
-                self.in_snake.add(idx)
-                group_rep_dict, group_size_dict, tail_connected_group_reps, seen = self.moveGroups()
-                candidate_reps = tail_connected_group_reps if tail_connected_group_reps else group_size_dict.keys()
-                tail_connected = bool(tail_connected_group_reps)
+                    if len(self.snake_qu) >= 3:
+                        if evaluator is None:
+                            evaluator = RegionEvaluator(self.arena, self.grid, self.snake_qu)
+                        group_rep_dict, group_size_dict, tail_connected_group_reps =\
+                                evaluator.moveGroups(idx, idx in fruits_remain)
+                        undo = self._makeMove(idx, fruits_remain)
+                    else:
+                        undo = self._makeMove(idx, fruits_remain)
+                        group_rep_dict, group_size_dict, tail_connected_group_reps, seen = self.moveGroups()
+                    candidate_reps = tail_connected_group_reps if tail_connected_group_reps else group_size_dict.keys()
+                    tail_connected = bool(tail_connected_group_reps)
+                    members = [(group_size_dict[idx3], idx2) for idx2, idx3 in group_rep_dict.items()\
+                            if idx3 in candidate_reps]
+                    if tt_new is not None:
+                        tt_new[sym_map[idx]] = (tail_connected,\
+                                tuple((sz, sym_map[idx2]) for sz, idx2 in members))
                 mx = (0, -float("inf"))
-                for idx2, idx3 in group_rep_dict.items():
-                    if idx3 not in candidate_reps: continue
-                    sz = group_size_dict[idx3]
+                fruit_dist = fruitDistanceView() if fruits_remain else None
+                for sz, idx2 in members:
                     if sz < mx[0]: continue
-                    dist = min(self.fruit_dist_arrs[k][idx2] for k in fruits_remain) if fruits_remain else float("inf")
-                    mx = max(mx, (sz, -dist))
+                    dist = fruit_dist[idx2] if fruits_remain else dist_inf
+                    mx = max(mx, (sz, -dist if dist < dist_inf else -float("inf")))
                 fruits_collected = n_fruits - len(fruits_remain)
                 tup = (mx[0] + fruits_collected, fruits_collected, mx[1] + (search_depth - depth))
                 # Note- by exiting early here, may miss larger available areas that open
@@ -222,20 +460,15 @@ class TailChaserBot:
                 if best[0] != search_depth or not best[1] or (tail_connected and tup > best[2]):
                     #print(f"depth = {depth}")
                     #print(f"tup = {tup}")
-                    #print(f"snake lengths = {len(self.in_snake)}, {len(self.snake_qu)}")
+                    #print(f"snake length = {len(self.snake_qu)}")
                     #print(f"snake = {self.snake_qu}")
                     #print(group_rep_dict, group_size_dict)
                     #print(f"number seen = {len(seen)}")
-                    #extra = self.in_snake.intersection(seen.keys())
-                    #print(f"extra: {extra}")
                     groups[tail_connected].setdefault(tup, [])
                     groups[tail_connected][tup].append((mv, idx))
-                self.in_snake.remove(self.snake_qu.pop())
-                if is_fruit:
-                    fruits_remain.add(idx)
-                else:
-                    self.snake_qu.appendleft(tail_idx)
-                    self.in_snake.add(tail_idx)
+                self._unmakeMove(undo, fruits_remain)
+            if tt_new is not None:
+                tt.put(tt_key, tt_new)
             if not groups[0] and not groups[1]: return False
             if depth == search_depth:
                 #print(groups)
@@ -247,44 +480,49 @@ class TailChaserBot:
                 best[1] = tail_connected
                 best[2] = tup
                 if depth == 1:
-                    best[3] = random.choice(groups[tail_connected][tup])
+                    best[3] = self.rng.choice(groups[tail_connected][tup])
+                    best_line[:] = [best[3]]
+                else: best_line[:] = line + [groups[tail_connected][tup][0]]
                 return True
             groups2 = dict(groups[0])
             for k, v in groups[1].items():
                 groups2.setdefault(k, [])
                 groups2[k].extend(v)
+            # On the principal variation given, its move from this
+            # position is searched first, whichever group it is in
+            pv_move = pv[depth - 1] if on_pv and depth <= len(pv) else None
+            pv_tup = None
+            if pv_move is not None:
+                pv_tup = next((tup for tup, lst in groups2.items() if pv_move in lst), None)
+            def childGenerator() -> Generator[Tuple[Any], None, None]:
+                if pv_tup is not None:
+                    yield (pv_tup, pv_move, True)
+                for tup in reversed(sorted(groups2.keys())):
+                    if best[0] >= search_depth and best[1] and tup <= best[2]: return
+                    lst = groups2[tup]
+                    self.rng.shuffle(lst)
+                    for mv_idx in lst:
+                        if pv_tup is None or mv_idx != pv_move:
+                            yield (tup, mv_idx, False)
             res = False
-            for tup in reversed(sorted(groups2.keys())):
-                if best[0] >= search_depth and best[1] and tup <= best[2]: break
-                lst = groups2[tup]
-                random.shuffle(lst)
-                for (mv, idx) in lst:
-                    if idx in fruits_remain:
-                        is_fruit = True
-                        fruits_remain.remove(idx)
-                    else:
-                        is_fruit = False
-                        tail_idx = self.snake_qu.popleft()
-                        self.in_snake.remove(tail_idx)
-                    self.snake_qu.append(idx)
-                    self.in_snake.add(idx)
-                    ans = recur(mv, depth=depth + 1)
-                    self.in_snake.remove(self.snake_qu.pop())
-                    if is_fruit:
-                        fruits_remain.add(idx)
-                    else:
-                        self.snake_qu.appendleft(tail_idx)
-                        self.in_snake.add(tail_idx)
-                    
-                    if ans:
-                        res = True
-                        if depth == 1:
-                            best[3] = (mv, idx)
-                        if not isinstance(best[0], int):
-                            return True
-                        if best[1] and tup <= best[2]: break
-                else: continue
-                break
+            for tup, (mv, idx), is_pv in childGenerator():
+                undo = self._makeMove(idx, fruits_remain)
+                line.append((mv, idx))
+                try:
+                    ans = recur(mv, depth=depth + 1, on_pv=is_pv)
+                finally:
+                    line.pop()
+                    self._unmakeMove(undo, fruits_remain)
+                
+                if ans:
+                    res = True
+                    if depth == 1:
+                        best[3] = (mv, idx)
+                        if best_line[:1] != [best[3]]:
+                            best_line[:] = [best[3]]
+                    if not isinstance(best[0], int):
+                        return True
+                    if best[1] and tup <= best[2] and not is_pv: break
             
             if not res and depth >= best[0]:
                 tail_connected = bool(groups[1])
@@ -294,28 +532,712 @@ class TailChaserBot:
                 best[0] = depth
                 best[1] = tail_connected
                 best[2] = tup
-                best[3] = random.choice(groups[tail_connected][tup])
+                best[3] = self.rng.choice(groups[tail_connected][tup])
+                best_line[:] = line + [best[3]]
             return True
-        res = recur(self.head_direct, depth=1)
+        res = recur(self.head_direct, depth=1, on_pv=bool(pv))
         #print(res, best)
         #print()
         if res:
+            self.principal_variation = best_line
             return best[3]
         mv = self.head_direct
         step = 1 if mv[0] == 0 else self.shape[1]
-        return (mv, self.snake_qu[-1] + step * mv[1])
+        res = (mv, self.snake_qu[-1] + step * mv[1])
+        self.principal_variation = [res]
+        return res
     
-    def addFruitFindMoveAndUpdate(self, add_fruit: Optional[int]=None, search_depth: int=2) -> Tuple[int]:
+    def findMoveIterativeDeepening(self, max_depth: int, time_budget_ms: float) -> Tuple[int]:
+        """
+        Anytime version of findMove(), which searches to depth 1, 2, 3,
+        ... in turn until either max_depth is reached or time_budget_ms
+        milliseconds have passed, and returns the result of the deepest
+        search that was completed. Each search tries first the
+        principal variation found by the previous search (see
+        findMove()). The search to depth 1 is always completed, even
+        if it exceeds the time budget. The depth of the
+        deepest search completed is recorded in last_search_depth.
+
+        Args:
+            max_depth (int): the maximum number of moves to search ahead
+            time_budget_ms (float): the time in milliseconds after which
+                no further searches are started and any search in
+                progress is abandoned
+
+        Returns:
+        2-tuple whose index 0 is the chosen move and index 1 the
+        flattened position of the head after that move.
+        """
+        deadline = time.perf_counter() + time_budget_ms / 1000
+        res = self.findMove(search_depth=1)
+        self.last_search_depth = 1
+        for depth in range(2, max_depth + 1):
+            try:
+                res = self.findMove(search_depth=depth, deadline=deadline,\
+                        pv=self.principal_variation)
+            except SearchTimeout:
+                break
+            self.last_search_depth = depth
+        return res
+    
+    def addFruitFindMoveAndUpdate(self, add_fruit: Optional[int]=None, search_depth: int=2, time_budget_ms: Optional[float]=None) -> Tuple[int]:
+        """
+        Applies any changes to the game since the previous call, then
+        finds the next move (see findMove()) and updates the bot's
+        records for that move.
+
+        Args:
+            add_fruit (int), optional: the flattened position of a
+                fruit spawned since the previous call, if any
+            search_depth (int), optional: the number of moves to search
+                ahead, which is increased to 16 when fewer than 10
+                empty cells remain. Default: 2
+            time_budget_ms (float), optional: if given, the search
+                deepens iteratively up to the search depth until this
+                many milliseconds have passed (see
+                findMoveIterativeDeepening()). Otherwise, the search
+                is always to the full search depth.
+
+        Returns:
+        2-tuple of ints giving the chosen move.
+        """
+        if self._pending_update is not None:
+            self.update(*self._pending_update)
+            self._pending_update = None
         if add_fruit is not None:
             self.addFruit(add_fruit)
-        n_space = self.length - len(self.fruit_dist_arrs) - len(self.snake_qu)
+        n_space = self.length - len(self.fruits) - len(self.snake_qu)
         if n_space < 10:
             search_depth = 16#4 * self.length if n_space <= 2 else 16
             
             #print(f"search depth increased to {search_depth}")
-        mv, head_idx = self.findMove(search_depth=search_depth)
-        rm_fruit, rm_tail_end = (head_idx, False) if head_idx in self.fruit_dist_arrs.keys() else (None, True)
+        if time_budget_ms is None:
+            mv, head_idx = self.findMove(search_depth=search_depth)
+            self.last_search_depth = search_depth
+        else:
+            mv, head_idx = self.findMoveIterativeDeepening(search_depth, time_budget_ms)
+        rm_fruit, rm_tail_end = (head_idx, False) if head_idx in self.fruits else (None, True)
         #print(f"rm_fruit = {rm_fruit}")
         if 0 <= head_idx < self.length:
-            self.update(head_idx, mv, rm_fruit, rm_tail_end=rm_tail_end)
+            if self.shares_state:
+                # Applied once the game has made the move
+                self._pending_update = (head_idx, mv, rm_fruit, rm_tail_end, self.snake_qu[0])
+            else:
+                self.update(head_idx, mv, rm_fruit, rm_tail_end=rm_tail_end)
         return mv
+
+class HamiltonianCycleBot:
+    """
+    Bot that follows a fixed Hamiltonian cycle of the arena (see
+    anguis.hamiltonian), taking shortcuts towards the nearest fruit
+    that are guaranteed to be safe. Unlike TailChaserBot, which may
+    die, this bot always fills the arena (which must have an even
+    number of cells), and choosing each move takes constant time
+    (after the cycle has been constructed or read from the on-disk
+    cache), so it can play on arenas of any size.
+
+    The shortcuts rely on the following invariant: going round the
+    cycle starting from the end of the tail, the cells of the snake
+    are passed in order from the end of the tail to the head, and all
+    the cells passed after the head (before returning to the end of
+    the tail) are unoccupied. Moving the head to any neighbouring cell
+    no further round the cycle from the head than the end of the tail
+    preserves this, and the next cell round the cycle is always such
+    a cell, so the snake can never be trapped. Of these moves, the bot
+    chooses the one that goes furthest round the cycle without passing
+    the nearest fruit (measured round the cycle), so the distance to
+    that fruit decreases with every move and no fruit is ever skipped.
+
+    The invariant holds for a snake consisting of a single cell, as at
+    the start of a game. If the bot is created for a longer snake not
+    satisfying it, moves are not guaranteed to be safe.
+
+    Has the same interface as TailChaserBot, with the search depth and
+    time budget being accepted and ignored.
+
+    Args:
+        shape (2-tuple of ints): the dimensions of the arena
+        head_idx (int): the flattened position of the head
+        head_direct (2-tuple of ints): the most recent move
+        fruits (set of ints): the flattened positions of the fruits
+        snake_qu (deque of ints), optional: the flattened positions
+            occupied by the snake, in order from the end of the tail
+            to the head. If not given, the snake consists only of the
+            head.
+        rng (random.Random), optional: unused, as the bot makes no
+            random choices
+        grid (bytearray), optional: if given, the grid of the game
+            (see GameState.grid), with snake_qu the game's own deque
+            of snake positions, which the bot reads rather than
+            keeping its own record of the snake (see TailChaserBot)
+        cache_dir (str), optional: the directory in which Hamiltonian
+            cycles are cached (see anguis.hamiltonian.cacheDirectory())
+
+    Raises:
+        ValueError: if the arena has no Hamiltonian cycle
+    """
+    def __init__(self, shape: Tuple[int], head_idx: int, head_direct: Tuple[int], fruits: Set[int], snake_qu: Optional[deque]=None, rng: Optional[random.Random]=None, grid: Optional[bytearray]=None, cache_dir: Optional[str]=None):
+        self.shape = shape
+        self.arena = getArena(shape)
+        self.length = shape[0] * shape[1]
+        cycle = loadHamiltonianCycle(shape, cache_dir=cache_dir)
+        # The position of each cell round the cycle
+        cycle_pos = np.empty(self.length, dtype=np.intp)
+        cycle_pos[cycle] = np.arange(self.length)
+        self.cycle = tuple(cycle.tolist())
+        self.cycle_pos = tuple(cycle_pos.tolist())
+        self.head_direct = head_direct
+        self.shares_state = grid is not None
+        self.snake_qu = snake_qu if self.shares_state else\
+                deque([head_idx] if snake_qu is None else snake_qu)
+        self.fruits = set(fruits)
+        self.last_search_depth = 0
+
+    def findMove(self) -> Tuple[Tuple[int], int]:
+        """
+        Finds the next move.
+
+        Returns:
+        2-tuple whose index 0 is the chosen move and index 1 the
+        flattened position of the head after that move.
+        """
+        length = self.length
+        cycle_pos = self.cycle_pos
+        head_idx = self.snake_qu[-1]
+        h = cycle_pos[head_idx]
+        # The distance round the cycle from the head to the end of the
+        # tail (the whole cycle if the snake is a single cell) and to
+        # the nearest fruit
+        tail_dist = (cycle_pos[self.snake_qu[0]] - h) % length or length
+        fruit_dist = min(((cycle_pos[idx] - h) % length for idx in self.fruits), default=1)
+        res = None
+        best = 0
+        for mv, idx in self.arena.move_neighbours[head_idx]:
+            d = (cycle_pos[idx] - h) % length
+            if best < d <= fruit_dist and d <= tail_dist:
+                res = (mv, idx)
+                best = d
+        if res is None:
+            # Only possible if the invariant did not hold initially
+            mv = self.head_direct
+            res = (mv, self.arena.next_cells[mv][head_idx])
+        return res
+
+    def update(self, head_idx: int, head_direct: Tuple[int]) -> None:
+        self.head_direct = head_direct
+        hit_fruit = head_idx in self.fruits
+        if hit_fruit:
+            self.fruits.remove(head_idx)
+        if not self.shares_state:
+            self.snake_qu.append(head_idx)
+            if not hit_fruit:
+                self.snake_qu.popleft()
+        return
+
+    def addFruitFindMoveAndUpdate(self, add_fruit: Optional[int]=None, search_depth: int=2, time_budget_ms: Optional[float]=None) -> Tuple[int]:
+        """
+        Records any fruit spawned since the previous call, then finds
+        the next move (see findMove()) and updates the bot's records
+        for that move.
+
+        Args:
+            add_fruit (int), optional: the flattened position of a
+                fruit spawned since the previous call, if any
+            search_depth (int), optional: ignored
+            time_budget_ms (float), optional: ignored
+
+        Returns:
+        2-tuple of ints giving the chosen move.
+        """
+        if add_fruit is not None:
+            self.fruits.add(add_fruit)
+        mv, head_idx = self.findMove()
+        if 0 <= head_idx < self.length:
+            self.update(head_idx, mv)
+        return mv
+
+class SafePathBot:
+    """
+    Bot that plans a shortest path to the nearest fruit with A* search
+    (using the Manhattan distance to the nearest fruit as heuristic)
+    and takes it only if, once the snake has followed that path and
+    eaten the fruit, the head can still reach the end of the tail.
+    Otherwise, the bot follows its tail, which keeps the snake alive
+    while the tail moves out of the way. A path found to be safe is
+    followed to the fruit without further searches, so each fruit
+    costs about two path searches (plus up to three for each move spent
+    following the tail) rather than the search over sequences of moves
+    of TailChaserBot, making the bot fast enough for large arenas,
+    though it may die without reaching a fruit. If following the tail
+    returns the snake to a position it has already been in, the bot
+    instead makes random safe moves to change the shape of the snake
+    until a fruit can be reached safely, and after too many such moves
+    takes the shortest path to a fruit even if that is not safe, so
+    that the game cannot continue indefinitely.
+
+    Has the same interface as TailChaserBot, with the search depth and
+    time budget being accepted and ignored.
+
+    Args:
+        shape (2-tuple of ints): the dimensions of the arena
+        head_idx (int): the flattened position of the head
+        head_direct (2-tuple of ints): the most recent move
+        fruits (set of ints): the flattened positions of the fruits
+        snake_qu (deque of ints), optional: the flattened positions
+            occupied by the snake, in order from the end of the tail
+            to the head. If not given, the snake consists only of the
+            head.
+        rng (random.Random), optional: source of randomness for
+            choosing between moves while breaking out of a cycle (see
+            findMove()), which may be given a seed for
+            reproducibility
+        grid (bytearray), optional: if given, the grid of the game
+            (see GameState.grid), with snake_qu the game's own deque
+            of snake positions, which the bot reads rather than
+            keeping its own record of the snake (see TailChaserBot)
+    """
+    def __init__(self, shape: Tuple[int], head_idx: int, head_direct: Tuple[int], fruits: Set[int], snake_qu: Optional[deque]=None, rng: Optional[random.Random]=None, grid: Optional[bytearray]=None):
+        self.shape = shape
+        self.arena = getArena(shape)
+        self.rng = random if rng is None else rng
+        self.length = shape[0] * shape[1]
+        self.coords = tuple(map(tuple, self.arena.coords.tolist()))
+        self.head_direct = head_direct
+        self.shares_state = grid is not None
+        if self.shares_state:
+            self.snake_qu = snake_qu
+            self.grid = grid
+        else:
+            self.snake_qu = deque([head_idx] if snake_qu is None else snake_qu)
+            self.grid = bytearray(self.length)
+            for idx in self.snake_qu:
+                self.grid[idx] = cell_body
+            self.grid[self.snake_qu[-1]] = cell_head
+            for idx in fruits:
+                self.grid[idx] = cell_fruit
+        self.fruits = set(fruits)
+        # The remainder of the path to a fruit being followed. The
+        # safety of a path depends only on the snake and the fruits,
+        # so the path is followed without being searched for again
+        # unless a fruit is spawned before it is completed
+        self._planned = deque()
+        # The positions of the head and the end of the tail at each
+        # move spent following the tail since a fruit was last eaten
+        # or spawned. Following the tail is deterministic, so if one
+        # of these recurs the snake is circling (see findMove())
+        self._tail_states = set()
+        self._circling = False
+        # The number of moves spent breaking out of cycles since a
+        # fruit was last eaten or spawned, and the number of moves per
+        # cell of the arena after which a fruit is taken even if that
+        # is not safe
+        self._n_circling = 0
+        self._circling_limit = 20
+        self.last_search_depth = 0
+
+    def findPath(self, grid: bytearray, start: int, targets: Set[int], tail_idx: Optional[int]=None) -> Optional[List[int]]:
+        """
+        Finds a shortest path through unoccupied cells from start to
+        the nearest of targets with A* search.
+
+        Args:
+            grid (bytearray): the state of each cell (see
+                GameState.grid)
+            start (int): the flattened position at which the path
+                starts
+            targets (set of ints): the flattened positions at which
+                the path may end
+            tail_idx (int), optional: if given, the flattened position
+                of the end of the tail, which the path may enter (as
+                it moves out of the way at the same time)
+
+        Returns:
+        List of ints giving the flattened positions along the path,
+        excluding start, or None if none of targets can be reached.
+        """
+        coords = self.coords
+        target_coords = [coords[idx] for idx in targets]
+        def heuristic(idx: int) -> int:
+            i0, i1 = coords[idx]
+            return min(abs(i0 - j0) + abs(i1 - j1) for j0, j1 in target_coords)
+        neighbours = self.arena.neighbours
+        prev = {start: -1}
+        dists = {start: 0}
+        heap = [(heuristic(start), 0, start)]
+        while heap:
+            _, d, idx = heapq.heappop(heap)
+            if idx in targets and idx != start:
+                path = []
+                while idx != start:
+                    path.append(idx)
+                    idx = prev[idx]
+                return path[::-1]
+            if d > dists[idx]: continue
+            d2 = d + 1
+            for idx2 in neighbours[idx]:
+                if grid[idx2] >= cell_body and idx2 != tail_idx: continue
+                if d2 >= dists.get(idx2, d2 + 1): continue
+                dists[idx2] = d2
+                prev[idx2] = idx
+                heapq.heappush(heap, (d2 + heuristic(idx2), d2, idx2))
+        return None
+
+    def _tailPathAfter(self, path: List[int]) -> Optional[List[int]]:
+        # The shortest path from the head to the end of the tail after
+        # the snake has followed path (or None if the end of the tail
+        # cannot then be reached), found on a copy of the grid
+        grid = bytearray(self.grid)
+        snake_qu = deque(self.snake_qu)
+        for idx in path:
+            grid[snake_qu[-1]] = cell_body
+            if grid[idx] != cell_fruit:
+                grid[snake_qu.popleft()] = cell_empty
+            grid[idx] = cell_head
+            snake_qu.append(idx)
+        if len(snake_qu) == 1: return []
+        return self.findPath(grid, snake_qu[-1], {snake_qu[0]}, tail_idx=snake_qu[0])
+
+    def findMove(self) -> Tuple[Tuple[int], int]:
+        """
+        Finds the next move.
+
+        Returns:
+        2-tuple whose index 0 is the chosen move and index 1 the
+        flattened position of the head after that move.
+        """
+        head_idx = self.snake_qu[-1]
+        tail_idx = self.snake_qu[0]
+        idx = None
+        if self._planned:
+            # The rest of a path already found to be safe
+            idx = self._planned.popleft()
+        elif self.fruits:
+            path = self.findPath(self.grid, head_idx, self.fruits)
+            if path is not None and self._tailPathAfter(path) is not None:
+                idx = path[0]
+                self._planned.extend(path[1:])
+                self.last_search_depth = len(path)
+        if idx is None and len(self.snake_qu) > 1:
+            # Follows the tail. Following the tail is deterministic, so
+            # once the positions of the head and the end of the tail
+            # recur, the snake is circling in a cycle that may never
+            # allow a fruit to be reached safely, and the cycle is
+            # broken (see _breakCircle()) until a fruit is eaten or
+            # spawned
+            state = (head_idx, tail_idx)
+            if state in self._tail_states:
+                self._circling = True
+            self._tail_states.add(state)
+            if self._circling:
+                self._n_circling += 1
+                path = None
+                if self._n_circling > self._circling_limit * self.length and self.fruits:
+                    # Breaking the cycle has not opened a safe path to
+                    # a fruit, so the shortest path is taken whether or
+                    # not the tail can be reached afterwards, so that
+                    # the game does not continue indefinitely
+                    path = self.findPath(self.grid, head_idx, self.fruits)
+                if path is not None:
+                    idx = path[0]
+                    self._planned.extend(path[1:])
+                    self.last_search_depth = len(path)
+                else: idx = self._breakCircle(head_idx)
+        if idx is None and len(self.snake_qu) > 1:
+            # Moves to the cell furthest from the end of the tail from
+            # which it can still be reached, so that the snake spreads
+            # out. A path from that cell to the end of the tail remains
+            # after the move, as it cannot pass through the head
+            dists = self._tailDistances(head_idx)
+            best = -1
+            for idx2 in self.arena.neighbours[head_idx]:
+                d = dists.get(idx2, -1)
+                if d > best:
+                    idx, best = idx2, d
+                    self.last_search_depth = d + 1
+        if idx is None:
+            # Moves into the largest region of unoccupied cells
+            idx = max(self.possibleNextPositions(head_idx), key=self._regionSize, default=None)
+            self.last_search_depth = 0
+        if idx is None:
+            mv = self.head_direct
+            return (mv, self.arena.next_cells[mv][head_idx])
+        for mv, idx2 in self.arena.move_neighbours[head_idx]:
+            if idx2 == idx: break
+        return (mv, idx)
+
+    def _breakCircle(self, head_idx: int) -> Optional[int]:
+        # The cell to move to from head_idx when the snake is circling,
+        # chosen from the cells after moving to which the end of the
+        # tail can still be reached. This is checked on the grid after
+        # the move, so unlike _tailDistances() includes cells that only
+        # become safe as the end of the tail moves out of the way, which
+        # are what allow the cycle to change shape. Cells leading to a
+        # position (of the head and the end of the tail) not yet
+        # reached while following the tail are preferred, with ties
+        # broken at random so that the shape of the cycle keeps
+        # changing. Gives None if there is no such cell.
+        grid = self.grid
+        snake_qu = self.snake_qu
+        dists = self._tailDistances(head_idx)
+        res, best = None, None
+        for idx2 in self.arena.neighbours[head_idx]:
+            if grid[idx2] >= cell_body and idx2 != snake_qu[0]: continue
+            if idx2 not in dists and self._tailPathAfter([idx2]) is None: continue
+            key = ((idx2, snake_qu[1]) not in self._tail_states, self.rng.random())
+            if best is None or key > best:
+                res, best = idx2, key
+        self.last_search_depth = 1
+        return res
+
+    def _tailDistances(self, head_idx: int) -> Dict[int, int]:
+        # The distances through unoccupied cells from the end of the
+        # tail, found by breadth first search until every unoccupied
+        # neighbour of the head has been reached
+        grid = self.grid
+        neighbours = self.arena.neighbours
+        tail_idx = self.snake_qu[0]
+        remain = {idx for idx in neighbours[head_idx] if grid[idx] < cell_body}
+        remain.discard(tail_idx)
+        dists = {tail_idx: 0}
+        qu = deque([tail_idx])
+        while qu and remain:
+            idx = qu.popleft()
+            d = dists[idx] + 1
+            for idx2 in neighbours[idx]:
+                if idx2 in dists or grid[idx2] >= cell_body: continue
+                dists[idx2] = d
+                remain.discard(idx2)
+                qu.append(idx2)
+        return dists
+
+    def possibleNextPositions(self, idx: int) -> List[int]:
+        grid = self.grid
+        return [idx2 for idx2 in self.arena.neighbours[idx] if grid[idx2] < cell_body]
+
+    def _regionSize(self, idx: int) -> int:
+        # The number of unoccupied cells reachable from idx
+        grid = self.grid
+        neighbours = self.arena.neighbours
+        seen = {idx}
+        stk = [idx]
+        while stk:
+            idx2 = stk.pop()
+            for idx3 in neighbours[idx2]:
+                if idx3 in seen or grid[idx3] >= cell_body: continue
+                seen.add(idx3)
+                stk.append(idx3)
+        return len(seen)
+
+    def _resetCircling(self) -> None:
+        self._n_circling = 0
+        self._tail_states.clear()
+        self._circling = False
+        return
+
+    def update(self, head_idx: int, head_direct: Tuple[int]) -> None:
+        self.head_direct = head_direct
+        hit_fruit = head_idx in self.fruits
+        if hit_fruit:
+            self.fruits.remove(head_idx)
+            self._resetCircling()
+        if not self.shares_state:
+            grid = self.grid
+            grid[self.snake_qu[-1]] = cell_body
+            if not hit_fruit:
+                grid[self.snake_qu.popleft()] = cell_empty
+            grid[head_idx] = cell_head
+            self.snake_qu.append(head_idx)
+        return
+
+    def addFruitFindMoveAndUpdate(self, add_fruit: Optional[int]=None, search_depth: int=2, time_budget_ms: Optional[float]=None) -> Tuple[int]:
+        """
+        Records any fruit spawned since the previous call, then finds
+        the next move (see findMove()) and updates the bot's records
+        for that move.
+
+        Args:
+            add_fruit (int), optional: the flattened position of a
+                fruit spawned since the previous call, if any
+            search_depth (int), optional: ignored
+            time_budget_ms (float), optional: ignored
+
+        Returns:
+        2-tuple of ints giving the chosen move.
+        """
+        if add_fruit is not None:
+            self.fruits.add(add_fruit)
+            self._planned.clear()
+            self._resetCircling()
+            if not self.shares_state:
+                self.grid[add_fruit] = cell_fruit
+        mv, head_idx = self.findMove()
+        if 0 <= head_idx < self.length:
+            self.update(head_idx, mv)
+        return mv
+
+class BotMoveWorker:
+    """
+    Runs a TailChaserBot on a background thread, which plays ahead of
+    the game on its own copy of the game state and places the moves it
+    chooses in a bounded buffer, from which the game takes one move at
+    a time with getMove(). This allows the cost of expensive searches
+    to be spread over the time between moves.
+
+    Where a fruit is eaten, the future of the game depends on where the
+    replacement fruit is spawned, so the worker stops after a move that
+    eats a fruit until resync() is called with the game state after the
+    spawn, which discards any moves remaining in the buffer and restarts
+    the worker from that state.
+
+    Args:
+        state (GameState): the game for which moves are to be chosen
+        search_depth (int), optional: the search depth used by the
+            bot. Default: 4
+        max_lookahead (int), optional: the maximum number of moves held
+            in the buffer. Default: 32
+        rng (random.Random), optional: the source of randomness of the
+            bot (see TailChaserBot)
+        time_budget_ms (float), optional: if given, the time budget
+            for each move (see TailChaserBot.addFruitFindMoveAndUpdate())
+    """
+    def __init__(self, state: GameState, search_depth: int=4, max_lookahead: int=32, rng: Optional[random.Random]=None, time_budget_ms: Optional[float]=None):
+        self.arena_shape = state.arena_shape
+        self.search_depth = search_depth
+        self.time_budget_ms = time_budget_ms
+        self.max_lookahead = max_lookahead
+        self.rng = rng
+        self._cond = threading.Condition()
+        # The moves found, each with the time in nanoseconds spent
+        # searching for it
+        self._buffer = deque()
+        # The search time of the move most recently taken by getMove()
+        self.last_search_ns = 0
+        # Incremented on each resync, so that moves found from a
+        # superseded state are discarded
+        self._generation = 0
+        self._snapshot = state.getSnapshot()
+        self._stopped = False
+        self._thread = None
+        # The simulated game and the bot playing it (see
+        # _syncSimulation()), used only by the worker thread
+        self._state = None
+        self._bot = None
+    
+    def start(self) -> None:
+        if self._thread is not None: return
+        self._thread = threading.Thread(target=self._run, name="anguis-bot", daemon=True)
+        self._thread.start()
+        return
+    
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return
+    
+    def __enter__(self) -> "BotMoveWorker":
+        self.start()
+        return self
+    
+    def __exit__(self, *args) -> None:
+        self.stop()
+        return
+    
+    def resync(self, state: GameState) -> None:
+        """
+        Discards all moves in the buffer and restarts the worker from
+        the current state of the game. Should be called whenever a
+        fruit is spawned.
+        
+        Args:
+            state (GameState): the game for which moves are to be
+                chosen, in its current state
+        """
+        snapshot = state.getSnapshot()
+        with self._cond:
+            self._generation += 1
+            self._buffer.clear()
+            self._snapshot = snapshot
+            self._cond.notify_all()
+        return
+    
+    def getMove(self, timeout: Optional[float]=None) -> Optional[Tuple[int]]:
+        """
+        Takes the next move from the buffer, waiting for the worker to
+        find it if the buffer is empty.
+        
+        Args:
+            timeout (float), optional: the maximum time in seconds to
+                wait for a move. If not given or given as None, waits
+                until a move is found.
+        
+        Returns:
+        2-tuple of ints giving the next move, or None if no move was
+        found within timeout seconds. The time the bot spent searching
+        for the move is recorded in last_search_ns.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._buffer, timeout=timeout):
+                return None
+            mv, self.last_search_ns = self._buffer.popleft()
+            self._cond.notify_all()
+        return mv
+    
+    def _syncSimulation(self, snapshot: Tuple[Any]) -> None:
+        # The simulated game and its bot are created once and then
+        # restored in place from each snapshot, so that a resync costs
+        # only a rebuild of the distances to the fruits, and the bot's
+        # transposition table is kept
+        if self._state is None:
+            state = GameState(self.arena_shape, n_fruit=0)
+            state.restoreSnapshot(snapshot)
+            self._state = state
+            self._bot = TailChaserBot(
+                self.arena_shape,
+                state.head_pos_flat,
+                head_direct=state.head_direct,
+                fruits=set(state.fruits),
+                snake_qu=state.snake_qu,
+                grid=state.grid,
+                rng=self.rng,
+            )
+            return
+        state = self._state
+        state.restoreSnapshot(snapshot)
+        self._bot.resync(state.fruits, state.head_direct)
+        return
+    
+    def _run(self) -> None:
+        cond = self._cond
+        generation = None
+        # Whether the simulated game has reached a point beyond which
+        # its future is unknown (a fruit was eaten) or it has ended
+        blocked = True
+        while True:
+            with cond:
+                cond.wait_for(lambda: self._stopped or self._snapshot is not None\
+                        or (not blocked and len(self._buffer) < self.max_lookahead))
+                if self._stopped: return
+                snapshot = self._snapshot
+                self._snapshot = None
+                if snapshot is not None:
+                    generation = self._generation
+            if snapshot is not None:
+                self._syncSimulation(snapshot)
+                blocked = not self._state.alive
+                if blocked: continue
+            state, bot = self._state, self._bot
+            t0 = time.perf_counter_ns()
+            mv = bot.addFruitFindMoveAndUpdate(search_depth=self.search_depth,\
+                    time_budget_ms=self.time_budget_ms)
+            search_ns = time.perf_counter_ns() - t0
+            alive, hit_fruit = state.move(mv)
+            blocked = hit_fruit or not alive
+            with cond:
+                if generation != self._generation: continue
+                self._buffer.append((mv, search_ns))
+                cond.notify_all()
+        return
@@ -0,0 +1,325 @@
+# library/src/anguis/engine.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Generator
+
+from collections import deque
+import random
+
+from anguis.arena import Arena, getArena, moves
+
+# The 2-bit move code of each move (see anguis.arena.moves)
+move_codes = {mv: i for i, mv in enumerate(moves)}
+
+# The possible states of a cell in the arena grid. These are ordered
+# so that a cell is occupied by the snake if and only if its state is
+# at least cell_body.
+cell_empty = 0
+cell_fruit = 1
+cell_body = 2
+cell_head = 3
+
+class NoSpaceToCreateError(Exception):
+    """
+    Raised when trying to create an object with a spatial location
+    but unable due to all possible spatial locations being occupied
+    """
+    pass
+
+class GameState:
+    """
+    Headless representation of a game of Anguis, owning the snake,
+    the fruits and the rules for moving, colliding and eating. This
+    class does not depend on pygame, so can be used to simulate games
+    (e.g. for bots or regression runs) without any rendering.
+
+    Positions are given as flattened indices, with the position
+    (i0, i1) in an arena of shape (n0, n1) corresponding to the
+    flattened index i0 * n1 + i1. Moves are given as 2-tuples
+    (axis, step), where axis is 0 or 1 and step is -1 or 1 (or 0 for
+    no movement).
+
+    The contents of every cell of the arena are recorded in a single
+    grid, which bots may share (see TailChaserBot) rather than keeping
+    a separate record of which cells are occupied. The grid and
+    snake_qu are updated in place, including by restoreSnapshot(), but
+    are replaced by reset().
+
+    The empty cells are also kept in a pool (free_cells) with the
+    index of each cell in the pool (free_index), from which a cell is
+    removed by moving the last cell of the pool into its place. This
+    is updated in constant time with each move, so that the number of
+    empty cells is found and a fruit spawned with a single random
+    draw in constant time regardless of the size of the arena. As the
+    order of the pool depends on the history of the game and
+    determines where fruits are spawned, it is included in snapshots.
+
+    Attributes:
+        arena_shape (2-tuple of ints): the dimensions of the arena
+        arena (Arena): the precomputed connectivity of the cells of
+            the arena
+        grid (bytearray): the state of each cell of the arena (one of
+            cell_empty, cell_fruit, cell_body or cell_head), indexed
+            by flattened position
+        snake_qu (deque of ints): the flattened positions occupied
+            by the snake, in order from the end of the tail to the
+            head
+        fruits (set of ints): the flattened positions of the fruits
+        free_cells (list of ints): the flattened positions of the
+            empty cells, in the order of the pool
+        free_index (list of ints): the index in free_cells of each
+            flattened position, or -1 for cells that are not empty
+        head_direct (2-tuple of ints): the most recent move
+        score (int): the number of fruits eaten so far
+        alive (bool): whether the game is still in progress
+        seed (int or None): the seed of the random number generator
+            used to place fruits, with None meaning unseeded
+        rng (random.Random): the random number generator used to
+            place fruits, specific to this game
+    """
+    def __init__(
+        self,
+        arena_shape: Tuple[int, int],
+        head_init_pos: Optional[Tuple[int, int]]=None,
+        head_init_direct: Tuple[int, int]=(0, 1),
+        n_fruit: int=1,
+        seed: Optional[int]=None,
+    ):
+        self.arena_shape = arena_shape
+        self.arena = getArena(arena_shape)
+        self.length = arena_shape[0] * arena_shape[1]
+        self.head_init_pos = tuple(x // 2 for x in arena_shape)\
+                if head_init_pos is None else head_init_pos
+        self.head_init_direct = head_init_direct
+        self.n_fruit = n_fruit
+        self.seed = seed
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Returns the game to its initial state, with the snake
+        consisting of only the head at its initial position and
+        n_fruit fruits placed at random unoccupied positions. The
+        random number generator is reseeded, so for a given seed the
+        game always starts in the same way.
+        """
+        hp = self.head_init_pos
+        hp_flat = hp[0] * self.arena_shape[1] + hp[1]
+        self.grid = bytearray(self.length)
+        self.grid[hp_flat] = cell_head
+        self.snake_qu = deque([hp_flat])
+        self._setFreeCells([idx for idx in range(self.length) if idx != hp_flat])
+        self.fruits = set()
+        self.head_direct = self.head_init_direct
+        self.score = 0
+        self.alive = True
+        self.rng = random.Random(self.seed)
+        self.randomSpawn(count=self.n_fruit)
+        return
+
+    @property
+    def head_pos_flat(self) -> int:
+        return self.snake_qu[-1]
+
+    @property
+    def tail_end_pos_flat(self) -> int:
+        return self.snake_qu[0]
+
+    @property
+    def n_free(self) -> int:
+        return len(self.free_cells)
+
+    def _setFreeCells(self, free_cells: List[int]) -> None:
+        self.free_cells = free_cells
+        self.free_index = [-1] * self.length
+        for i, idx in enumerate(free_cells):
+            self.free_index[idx] = i
+        return
+
+    def _removeFree(self, pos_flat: int) -> None:
+        # Removes an empty cell from the pool, moving the last cell of
+        # the pool into its place
+        free_cells, free_index = self.free_cells, self.free_index
+        i = free_index[pos_flat]
+        last = free_cells.pop()
+        if last != pos_flat:
+            free_cells[i] = last
+            free_index[last] = i
+        free_index[pos_flat] = -1
+        return
+
+    def _addFree(self, pos_flat: int) -> None:
+        self.free_index[pos_flat] = len(self.free_cells)
+        self.free_cells.append(pos_flat)
+        return
+
+    def nextPosition(self, pos_flat: int, mv: Tuple[int]) -> Optional[int]:
+        """
+        Finds the flattened position reached by making the move mv
+        from the flattened position pos_flat.
+
+        Args:
+            pos_flat (int): the flattened starting position
+            mv (2-tuple of ints): the move to be made
+
+        Returns:
+        Integer (int) giving the flattened position after the move,
+        or None if that move would leave the arena.
+        """
+        res = self.arena.next_cells[mv][pos_flat]
+        return None if res < 0 else res
+
+    def move(self, mv: Optional[Tuple[int]]=None) -> Tuple[bool]:
+        """
+        Moves the head of the snake, with the tail following it,
+        checking whether the head has collided with the walls or the
+        tail and whether it has reached a fruit (in which case the
+        fruit is removed and the tail extended by one). Does not
+        spawn any replacement fruit (see step()).
+
+        Args:
+            mv (2-tuple of ints), optional: the move to be made. If
+                not given or given as None, repeats the most recent
+                move.
+
+        Returns:
+        2-tuple of bools, of which index 0 corresponds to whether the
+        snake is still alive and index 1 to whether it has eaten a
+        fruit.
+        """
+        if mv is None:
+            mv = self.head_direct
+        else: self.head_direct = mv
+        snake_qu = self.snake_qu
+        grid = self.grid
+        pos2 = self.nextPosition(snake_qu[-1], mv)
+        if pos2 is None:
+            self.alive = False
+            return (False, False)
+        cell = grid[pos2]
+        hit_fruit = (cell == cell_fruit)
+        if hit_fruit:
+            self.fruits.remove(pos2)
+            grid[snake_qu[-1]] = cell_body
+        else:
+            # The end of the tail moves out of the way at the same
+            # time as the head moves
+            tail_end = snake_qu[0]
+            if cell != cell_empty and pos2 != tail_end:
+                self.alive = False
+                return (False, False)
+            grid[snake_qu[-1]] = cell_body
+            grid[snake_qu.popleft()] = cell_empty
+            if pos2 != tail_end:
+                self._removeFree(pos2)
+                self._addFree(tail_end)
+        grid[pos2] = cell_head
+        snake_qu.append(pos2)
+        return (True, hit_fruit)
+
+    def randomSpawn(self, count: int=1) -> List[int]:
+        """
+        Places count fruits at distinct unoccupied positions chosen
+        uniformly at random, each with a single draw from the pool of
+        empty cells.
+
+        Args:
+            count (int), optional: the number of fruits to place.
+                Default: 1
+
+        Returns:
+        List of ints giving the flattened positions of the new fruits.
+
+        Raises:
+            NoSpaceToCreateError: if there are fewer than count
+                unoccupied positions
+        """
+        n_free = self.n_free
+        if n_free < count:
+            raise NoSpaceToCreateError("Insufficient valid spaces to "
+                    "place the specified number of fruits.")
+        res = []
+        for _ in range(count):
+            pos_flat = self.free_cells[self.rng.randrange(n_free)]
+            n_free -= 1
+            self._removeFree(pos_flat)
+            res.append(pos_flat)
+            self.grid[pos_flat] = cell_fruit
+            self.fruits.add(pos_flat)
+        return res
+
+    def step(self, mv: Optional[Tuple[int]]=None) -> Tuple[bool, bool, List[int]]:
+        """
+        Performs a full game step: moves the snake (see move()) and,
+        if a fruit was eaten, increments the score and spawns a
+        replacement fruit. If there is no space left for the
+        replacement fruit, the game ends.
+
+        Args:
+            mv (2-tuple of ints), optional: the move to be made. If
+                not given or given as None, repeats the most recent
+                move.
+
+        Returns:
+        3-tuple whose index 0 is a bool giving whether the game is
+        still in progress, index 1 is a bool giving whether a fruit
+        was eaten and index 2 is a list of the flattened positions of
+        any fruits spawned.
+        """
+        alive, hit_fruit = self.move(mv)
+        spawned = []
+        if alive and hit_fruit:
+            self.score += 1
+            try:
+                spawned = self.randomSpawn(count=1)
+            except NoSpaceToCreateError:
+                self.alive = alive = False
+        return (alive, hit_fruit, spawned)
+
+    def getSnapshot(self) -> Tuple[Any]:
+        """
+        Creates a record of the current state of the game, from which
+        the game can be returned to that state using
+        restoreSnapshot(). The record includes the state of the random
+        number generator, so the game continues identically after the
+        snapshot is restored.
+
+        Returns:
+        7-tuple containing, in order, a tuple of the flattened
+        positions of the snake from the end of the tail to the head, a
+        sorted tuple of the flattened positions of the fruits, the most
+        recent move, the score, whether the game is still in progress,
+        the state of the random number generator and a tuple of the
+        flattened positions of the empty cells in the order of the
+        pool of empty cells.
+        """
+        return (tuple(self.snake_qu), tuple(sorted(self.fruits)),\
+                self.head_direct, self.score, self.alive,\
+                self.rng.getstate(), tuple(self.free_cells))
+
+    def restoreSnapshot(self, snapshot: Tuple[Any]) -> None:
+        """
+        Returns the game to the state recorded in snapshot.
+
+        Args:
+            snapshot (tuple): a record of the game state as created
+                by getSnapshot()
+        """
+        snake, fruits, head_direct, score, alive, rng_state, free_cells = snapshot
+        grid = self.grid
+        grid[:] = bytes(self.length)
+        for pos_flat in snake:
+            grid[pos_flat] = cell_body
+        grid[snake[-1]] = cell_head
+        for pos_flat in fruits:
+            grid[pos_flat] = cell_fruit
+        self.snake_qu.clear()
+        self.snake_qu.extend(snake)
+        self.fruits = set(fruits)
+        self._setFreeCells(list(free_cells))
+        self.head_direct = tuple(head_direct)
+        self.score = score
+        self.alive = alive
+        self.rng.setstate(rng_state)
+        return
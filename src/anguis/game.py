@@ -39,8 +39,14 @@ class Game:
         auto_fruitpos: List[Tuple[Tuple[int, int], Tuple[int, int]]]=(((-2, 1), (1, 0)), ((-2, -2), (0, 1)), ((1, -2), (-1, 0)), ((1, 1), (0, -1))),
         navkeys: Optional[Tuple[Tuple[Set[int]]]]=None,
         menu_framerate: int=60,
+        profile: bool=False,
+        profile_path: Optional[str]=None,
+        viewport_shape: Optional[Tuple[int, int]]=None,
+        minimap: bool=True,
+        pixel_board: bool=False,
     ):
         pg.init()
+        self.viewport_shape = viewport_shape
         self.head_size = head_size
         self.arena_shape = arena_shape
         self.head_init_pos_func = head_init_pos_func
@@ -50,6 +56,11 @@ class Game:
         self.n_fruit = n_fruit
         self.border = border
         self.menu_framerate = menu_framerate
+        # See GamePlay
+        self.profile = profile
+        self.profile_path = profile_path
+        self.minimap = minimap
+        self.pixel_board = pixel_board
         self.font = font_def_func() if font is None else font
         self.auto_startpos = auto_startpos
         
@@ -94,6 +105,11 @@ class Game:
                 font=self.font,
                 auto=False,
                 navkeys=self.navkeys,
+                profile=self.profile,
+                profile_path=self.profile_path,
+                viewport_shape=self.viewport_shape,
+                minimap=self.minimap,
+                pixel_board=self.pixel_board,
             )
             self._gameplay = res
         return res
@@ -421,13 +437,39 @@ class Game:
                                 self._arena_shape)
         return self._arena_dims
     
+    @property
+    def viewport_shape(self):
+        return self._viewport_shape
+    
+    @viewport_shape.setter
+    def viewport_shape(self, viewport_shape):
+        self._screen_shape = None
+        self._viewport_shape = viewport_shape
+        
+        gameplay_obj = getattr(self, "_gameplay", None)
+        if gameplay_obj is not None:
+            gameplay_obj.viewport_shape = viewport_shape
+        
+        if getattr(self, "_screen", None) is not None:
+            self._resetScreen()
+        return
+    
+    @property
+    def view_shape(self) -> Tuple[int, int]:
+        # The number of cells of the arena shown on the screen in each
+        # direction (see GamePlay.view_shape)
+        viewport_shape = getattr(self, "_viewport_shape", None)
+        if viewport_shape is None:
+            return tuple(self.arena_shape)
+        return tuple(min(v, n) for v, n in zip(viewport_shape, self.arena_shape))
+    
     @property
     def screen_shape(self):
         screen_shape = getattr(self, "_screen_shape", None)
         if screen_shape is not None:
             return screen_shape
         self._screen_shape = tuple(self.head_size * (x + sum(y))\
-                for x, y in zip(self.arena_shape, self.border))
+                for x, y in zip(self.view_shape, self.border))
         #screen = getattr(self, "_screen", None)
         #if screen is not None:
         #    #screen.size = self._screen_shape
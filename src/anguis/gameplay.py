@@ -2,15 +2,18 @@
 
 from __future__ import annotations
 
-from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Generator, TYPE_CHECKING
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Generator, Iterable, TYPE_CHECKING
 
 from collections import deque
+import itertools
+import time
 
-from sortedcontainers import SortedSet, SortedDict
-
+import numpy as np
 import pygame as pg
 
-from anguis.utils import randomKTupleGenerator, findKthMissing
+from anguis.arena import getArena
+from anguis.engine import GameState, NoSpaceToCreateError, cell_empty, cell_fruit, cell_body, cell_head
+from anguis.profiler import FrameProfiler
 
 #sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
 #sys.path.append(os.path.abspath('../'))
@@ -28,273 +31,876 @@ from pygame_display_component_classes import (
     UserInputProcessor
 )
 
-from anguis.bots import TailChaserBot
+from anguis.bots import BotMoveWorker
 
-class NoSpaceToCreateError(Exception):
+class SurfaceAtlas:
     """
-    Raised when trying to create an object with a spatial location
-    but unable due to all possible spatial locations being occupied
+    Cache of single colour square surfaces, keyed by colour and side
+    length, shared by everything drawn in the arena. Where a display
+    has been set up, the surfaces are converted to the pixel format of
+    the display so that blitting them is fast.
     """
-    pass
-
-
-class SquareSprite(pg.sprite.Sprite):
-    def __init__(self, screen, arena_shape: Tuple[int], pos_flat: int, color: Tuple[Union[Tuple[int]], Real], size: int, screen_pos_func: Callable[[Tuple[Real]], Tuple[int]]):
-        super().__init__()
-        self._screen = screen
-        self.size = size
-        self.color = color
-        self.pos_flat = pos_flat
-        self.screen_pos_func = screen_pos_func
+    __slots__ = ("_surfs",)
     
-    @property
-    def screen(self):
-        return self._screen
+    def __init__(self):
+        self._surfs = {}
     
-    @property
-    def size(self):
-        return self._size
+    def getSurface(self, color: Tuple[Union[Tuple[int], Real]], size: int) -> "pg.Surface":
+        key = (tuple(color[0]), color[1], size)
+        res = self._surfs.get(key)
+        if res is None:
+            res = self._createSurface(color, size)
+            self._surfs[key] = res
+        return res
     
-    @size.setter
-    def size(self, size):
-        if size == getattr(self, "_size", None):
-            return
-        self._size = size
-        self._surf = None
+    @staticmethod
+    def _createSurface(color: Tuple[Union[Tuple[int], Real]], size: int) -> "pg.Surface":
+        res = pg.Surface((size, size))
+        if pg.display.get_surface() is not None:
+            res = res.convert()
+        # Surfaces that are fully opaque are left without a surface
+        # alpha, so that blitting them does not require blending
+        if color[1] < 1:
+            res.set_alpha(color[1] * 255)
+        res.fill(color[0])
+        return res
+    
+    def clear(self) -> None:
+        self._surfs = {}
         return
+
+class SquareSprite:
+    __slots__ = ("gameplay", "pos_flat", "color")
     
-    @property
-    def shape(self):
-        size = self.size
-        return (size, size)
+    def __init__(self, gameplay: "GamePlay", pos_flat: int, color: Tuple[Union[Tuple[int], Real]]):
+        self.gameplay = gameplay
+        self.pos_flat = pos_flat
+        self.color = color
     
     @property
     def surf(self):
-        res = getattr(self, "_surf", None)
-        if res is None:
-            res = self._createSurface(self.color)
-            self._surf = res
-        return res
+        gameplay = self.gameplay
+        return gameplay.surface_atlas.getSurface(self.color, gameplay.head_size)
     
-    def _createSurface(self, color):
-        res = pg.Surface(self.shape)
-        self._setSurfaceColor(res, color)
-        return res
+    def draw(self) -> None:
+        gameplay = self.gameplay
+        gameplay.screen.blit(self.surf, gameplay.screen_pos_func(self.pos_flat))
+        return
+
+# Defining the head of the snake (effectively the player)
+class HeadSprite(SquareSprite):
+    __slots__ = ("tail",)
     
-    @staticmethod
-    def _setSurfaceColor(surf, color: Tuple[Union[Tuple[int], Real]]) -> None:
-        if surf is None:
-            return
-        surf.set_alpha(color[1] * 255)
-        surf.fill(color[0])
+    def __init__(self, gameplay: "GamePlay", pos_flat: int):
+        super().__init__(gameplay, pos_flat, color=gameplay.head_color)
+        self.tail = tail_render_modes[gameplay.tail_render_mode](gameplay, gameplay.tail_colors)
+    
+    def sync(self, state: "GameState") -> None:
+        """
+        Updates the position of the head to match the snake in the
+        game state.
+        
+        Args:
+            state (GameState): the game state being rendered
+        """
+        self.pos_flat = state.head_pos_flat
         return
     
-    @property
-    def color(self):
-        return self._color
+    def drawHeadAndTail(self) -> None:
+        #print("Drawing head")
+        self.draw()
+        self.tail.draw()
+        return
+
+# Define the tail as a whole. The tail positions are read from the
+# game state, with each tail section drawn using a surface from the
+# surface atlas rather than having an object of its own.
+class Tail:
+    __slots__ = ("gameplay", "tail_colors")
     
-    @color.setter
-    def color(self, color):
-        if color == getattr(self, "_color", None):
+    def __init__(self, gameplay: "GamePlay", tail_colors: Tuple[Tuple[Union[Tuple[int], Real]]]):
+        self.gameplay = gameplay
+        self.tail_colors = tail_colors
+    
+    def tailColors(self, length: int) -> Generator[Tuple[Union[Tuple[int], Real]], None, None]:
+        # The colours of the tail sections from the end of the tail
+        # to the section next to the head, rounded so that there are
+        # a limited number of distinct colours to cache
+        if len(self.tail_colors) == 1 or length <= 1:
+            for _ in range(length):
+                yield self.tail_colors[0]
             return
-        self._color = color
-        if getattr(self, "_surf", None) is not None:
-            self._setSurfaceColor(self.surf, color)
+        colors = self.tail_colors[0][0], self.tail_colors[1][0]
+        opacities = self.tail_colors[0][1], self.tail_colors[1][1]
+        for i in range(length):
+            r = i / (length - 1)
+            ratios = (1 - r, r)
+            color = tuple(round(c1 * ratios[0] + c2 * ratios[1]) for c1, c2 in zip(*colors))
+            opacity = round((opacities[0] * ratios[0] + opacities[1] * ratios[1]) * 255) / 255
+            yield (color, opacity)
+        return
+    
+    def draw(self) -> None:
+        gameplay = self.gameplay
+        snake_qu = gameplay.state.snake_qu
+        length = len(snake_qu) - 1
+        screen = gameplay.screen
+        get_surf = gameplay.surface_atlas.getSurface
+        screen_pos_func = gameplay.screen_pos_func
+        size = gameplay.head_size
+        for pos_flat, color in zip(snake_qu, self.tailColors(length)):
+            screen.blit(get_surf(color, size), screen_pos_func(pos_flat))
         return
+
+# Alternative to Tail that writes every tail section into a single
+# board-sized surface in one NumPy operation via pygame.surfarray, and
+# then blits that surface once. The colours of the sections for a
+# given snake length (which is unchanged by most moves) are cached.
+class SurfarrayTail(Tail):
+    __slots__ = ("_board", "_board_key", "_palette")
+    
+    def __init__(self, gameplay: "GamePlay", tail_colors: Tuple[Tuple[Union[Tuple[int], Real]]]):
+        super().__init__(gameplay, tail_colors)
+        self._board = None
+        self._board_key = None
+        self._palette = (None, None, None)
     
     @property
-    def pos_flat(self):
-        return self._pos_flat
+    def board(self) -> "pg.Surface":
+        gameplay = self.gameplay
+        key = (gameplay.arena_shape, gameplay.head_size)
+        if key != self._board_key:
+            self._board = pg.Surface(gameplay.arena_dims, pg.SRCALPHA, 32)
+            self._board_key = key
+        return self._board
+    
+    def palette(self, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self._palette[0] != length:
+            self._palette = (length, *self.createPalette(length))
+        return self._palette[1:]
+    
+    def createPalette(self, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Returns the RGB colours and the alpha values of the tail
+        # sections from the end of the tail to the section next to
+        # the head, with the same gradient as Tail.tailColors()
+        (color0, opacity0), (color1, opacity1) = self.tail_colors[0], self.tail_colors[-1]
+        r = np.linspace(0, 1, length) if length > 1 else np.zeros(length)
+        rgb = np.outer(1 - r, tuple(color0)[:3]) + np.outer(r, tuple(color1)[:3])
+        alpha = ((1 - r) * opacity0 + r * opacity1) * 255
+        return np.rint(rgb).astype(np.uint8), np.rint(alpha).astype(np.uint8)
     
-    @pos_flat.setter
-    def pos_flat(self, pos_flat):
-        if pos_flat == getattr(self, "_pos_flat", None):
-            return
-        self._pos_flat = pos_flat
-        self._obj_topleft_screen = None
-        self._rect = None
+    def draw(self) -> None:
+        gameplay = self.gameplay
+        snake_qu = gameplay.state.snake_qu
+        length = len(snake_qu) - 1
+        if length <= 0: return
+        n0, n1 = gameplay.arena_shape
+        size = gameplay.head_size
+        board = self.board
+        rgb, alpha = self.palette(length)
+        pos_flat = np.fromiter(itertools.islice(snake_qu, length), dtype=np.intp, count=length)
+        inds0, inds1 = gameplay.arena_graph.coords[pos_flat].T
+        board.fill((0, 0, 0, 0))
+        # Views of the pixels with the shape (n0, size, n1, size),
+        # so each cell is a single element along the first and third
+        # axes (setting shape fails rather than copying)
+        pixels = pg.surfarray.pixels3d(board).view()
+        pixels.shape = (n0, size, n1, size, 3)
+        pixels[inds0, :, inds1] = rgb[:, None, None, :]
+        del pixels
+        pixels = pg.surfarray.pixels_alpha(board).view()
+        pixels.shape = (n0, size, n1, size)
+        pixels[inds0, :, inds1] = alpha[:, None, None]
+        del pixels
+        gameplay.screen.blit(board, gameplay.arena_topleft)
+        return
+
+tail_render_modes = {"blit": Tail, "surfarray": SurfarrayTail}
+
+# Define the fruits as a whole, with the fruit positions read from the
+# game state
+class Fruits:
+    __slots__ = ("gameplay",)
+    
+    def __init__(self, gameplay: "GamePlay"):
+        self.gameplay = gameplay
+    
+    def draw(self) -> None:
+        gameplay = self.gameplay
+        screen = gameplay.screen
+        surf = gameplay.surface_atlas.getSurface(gameplay.fruit_color, gameplay.head_size)
+        screen_pos_func = gameplay.screen_pos_func
+        for pos_flat in gameplay.state.fruits:
+            screen.blit(surf, screen_pos_func(pos_flat))
+        return
+
+class ScoreDisplay:
+    """
+    Draws the score using a cached strip of pre-rendered digit glyphs
+    rather than re-rendering the score text every frame. The glyphs are
+    rendered once (using the score number text object of the GamePlay
+    object, so they match its font and size) and the image of the
+    score is only recomposed from them when the score changes.
+
+    The glyphs are rendered at the size of the score area of the
+    screen, and are re-rendered if the dimensions of the game change.
+    """
+    __slots__ = ("gameplay", "_strip", "_glyphs", "_key", "_score", "_surf")
+    
+    def __init__(self, gameplay: "GamePlay"):
+        self.gameplay = gameplay
+        self._strip = None
+        self._glyphs = None
+        self._key = None
+        self._score = None
+        self._surf = None
+    
+    def _renderText(self, text: str, shape: Tuple[int, int]) -> "pg.Surface":
+        gameplay = self.gameplay
+        surf = pg.Surface(shape, pg.SRCALPHA, 32)
+        text_obj = gameplay.score_text_number
+        text_obj.text = text
+        text_obj.draw(surf, (0, gameplay.score_text_number_bottomleft_pos[1]), anchor_type="bottomleft")
+        return surf
+    
+    def createGlyphStrip(self) -> Tuple["pg.Surface", Tuple[Tuple[int, int, int]]]:
+        """
+        Renders the digits 0 to 9 side by side on a single surface.
+
+        Returns:
+        2-tuple whose index 0 is the surface containing the digits and
+        whose index 1 is a 10-tuple containing for each digit a 3-tuple
+        giving the horizontal offset of the digit in the strip, its
+        width and the horizontal distance between the start of that
+        digit and the start of a following digit.
+        """
+        gameplay = self.gameplay
+        gameplay.updateScoreTextNumberDimensions()
+        rect = gameplay.score_text_number_rect
+        surfs = []
+        glyphs = []
+        offset = 0
+        for d in range(10):
+            surf = self._renderText(str(d), rect.size)
+            width = surf.get_bounding_rect().right
+            # The spacing between digits is found from the extra
+            # width of the digit repeated
+            width2 = self._renderText(str(d) * 2, rect.size).get_bounding_rect().right
+            surfs.append((surf, width))
+            glyphs.append((offset, width, max(width2 - width, 0)))
+            offset += width
+        strip = pg.Surface((max(offset, 1), rect.height), pg.SRCALPHA, 32)
+        for (surf, width), (offset, _, _) in zip(surfs, glyphs):
+            strip.blit(surf, (offset, 0), area=pg.Rect(0, 0, width, rect.height))
+        return strip, tuple(glyphs)
+    
+    def _composeScore(self, score: int) -> "pg.Surface":
+        rect = self.gameplay.score_text_number_rect
+        surf = pg.Surface(rect.size, pg.SRCALPHA, 32)
+        strip, glyphs = self._strip, self._glyphs
+        x = 0
+        for d in map(int, str(score)):
+            offset, width, advance = glyphs[d]
+            surf.blit(strip, (x, 0), area=pg.Rect(offset, 0, width, rect.height))
+            x += advance
+        return surf
+    
+    def draw(self, surf: "pg.Surface", score: int) -> "pg.Rect":
+        """
+        Draws the score in the score area of surf.
+
+        Args:
+            surf (pygame.Surface): the surface on which the score is
+                to be drawn
+            score (int): the score to be drawn
+
+        Returns:
+        pygame.Rect object giving the score area of surf.
+        """
+        gameplay = self.gameplay
+        rect = gameplay.score_text_number_rect
+        key = (gameplay.screen_shape, tuple(rect))
+        if key != self._key:
+            self._strip, self._glyphs = self.createGlyphStrip()
+            self._key = key
+            self._score = None
+        if score != self._score:
+            self._surf = self._composeScore(score)
+            self._score = score
+        surf.blit(self._surf, rect)
+        return rect
+
+# The phases of the main loop timed by the profiler of GamePlay
+profile_phases = ("input", "bot", "step", "draw", "flip")
+
+class ProfilerHUD:
+    """
+    Small overlay in the bottom left corner of the screen showing the
+    frame rate and the median, 95th percentile and maximum duration of
+    each phase of the main loop (see FrameProfiler), with the bot
+    phase giving the time the bot spent searching for each move on
+    its own thread (see BotMoveWorker). The text
+    is re-rendered at most every refresh_ms milliseconds, and the
+    overlay is otherwise blitted from the previous rendering.
+    """
+    __slots__ = ("gameplay", "font_size", "refresh_ms", "_font", "_surf", "_rendered_ns")
+    
+    def __init__(self, gameplay: "GamePlay", font_size: int=14, refresh_ms: int=250):
+        self.gameplay = gameplay
+        self.font_size = font_size
+        self.refresh_ms = refresh_ms
+        self._font = None
+        self._surf = None
+        self._rendered_ns = None
     
     @property
-    def obj_topleft_screen(self):
-        res = getattr(self, "_obj_topleft_screen", None)
+    def font(self) -> "pg.font.Font":
+        res = self._font
         if res is None:
-            res = self.screen_pos_func(self.pos_flat)
-            self._obj_topleft_screen = res
+            pg.font.init()
+            res = pg.font.SysFont("monospace", self.font_size)
+            self._font = res
         return res
     
-    @property
-    def rect(self):
-        res = getattr(self, "_rect", None)
-        if res is None:
-            res = self.surf.get_rect(topleft=self.obj_topleft_screen)
-            self._rect = res
+    def textLines(self) -> List[str]:
+        summary = self.gameplay.profiler.summary()
+        fps = summary["fps"]
+        res = ["FPS " + ("-" if fps is None else f"{fps:.1f}"),\
+                f"{'ms':<6}{'p50':>8}{'p95':>8}{'max':>8}"]
+        for phase, stats in summary["phases"].items():
+            if stats["p50_ms"] is None: continue
+            res.append(f"{phase:<6}{stats['p50_ms']:8.2f}{stats['p95_ms']:8.2f}{stats['max_ms']:8.2f}")
         return res
     
-    def draw(self) -> None:
-        #print("hi")
-        self.rect
-        #print(self.screen)
-        #print(self.surf)
-        self.screen.blit(self.surf, self.obj_topleft_screen)
-        return
+    def render(self) -> "pg.Surface":
+        font = self.font
+        imgs = [font.render(line, True, named_colors_def["white"]) for line in self.textLines()]
+        pad = 4
+        width = max(img.get_width() for img in imgs) + 2 * pad
+        height = sum(img.get_height() for img in imgs) + 2 * pad
+        # Opaque, so that drawing the overlay repeatedly over parts of
+        # the screen that have not been redrawn leaves it unchanged
+        surf = pg.Surface((width, height))
+        surf.fill(named_colors_def["black"])
+        y = pad
+        for img in imgs:
+            surf.blit(img, (pad, y))
+            y += img.get_height()
+        return surf
+    
+    def draw(self, surf: "pg.Surface") -> "pg.Rect":
+        """
+        Draws the overlay on surf.
 
-# Defining the head of the snake (effectively the player)
-class HeadSprite(SquareSprite):
+        Returns:
+        pygame.Rect object giving the area of surf covered by the
+        overlay.
+        """
+        t = time.perf_counter_ns()
+        if self._surf is None or t - self._rendered_ns >= self.refresh_ms * 1_000_000:
+            self._surf = self.render()
+            self._rendered_ns = t
+        rect = self._surf.get_rect(bottomleft=(0, surf.get_height()))
+        surf.blit(self._surf, rect)
+        return rect
+
+class DirtyRectRenderer:
+    """
+    Renders the game by redrawing only the cells that may have changed
+    since the previous frame (the previous and new positions of the
+    head, the vacated end of the tail and any eaten or spawned fruits)
+    and the score if it has changed, with only those areas of the
+    display then being updated. The contents of each changed cell are
+    read from the grid of the game state.
+
+    This is only suitable where every tail section is the same colour,
+    as otherwise the colour of every section changes when the snake
+    grows. The first frame, and any frame after reset() is called, is
+    drawn in full using GamePlay.draw().
+    """
+    __slots__ = ("gameplay", "head_pos_flat", "tail_end_pos_flat", "fruits", "score", "rects")
     
-    def __init__(self, gameplay, pos_flat: int, mv: Tuple[int]=(0, 1)):
-        super().__init__(gameplay.screen, gameplay.arena_shape, pos_flat,\
-                color=gameplay.head_color, size=gameplay.head_size,\
-                screen_pos_func=gameplay.screen_pos_func)
+    def __init__(self, gameplay: "GamePlay"):
         self.gameplay = gameplay
-        self.tail = TailSpriteQueue(self, gameplay.tail_colors)
-        self.mv = mv
-        self.fruits = gameplay.fruits
-        self.arena_shape = gameplay.arena_shape
+        self.rects = []
+        self.reset()
+    
+    def reset(self) -> None:
+        self.head_pos_flat = None
+        self.tail_end_pos_flat = None
+        self.fruits = frozenset()
+        self.score = None
+        return
     
-    def move(self, mv: Optional[Tuple[int]]=None) -> Tuple[bool]:
+    def _record(self, state: "GameState") -> None:
+        self.head_pos_flat = state.head_pos_flat
+        self.tail_end_pos_flat = state.tail_end_pos_flat
+        self.fruits = frozenset(state.fruits)
+        self.score = state.score
+        return
+    
+    def _drawCell(self, pos_flat: int) -> "pg.Rect":
+        gameplay = self.gameplay
+        cell = gameplay.state.grid[pos_flat]
+        size = gameplay.head_size
+        rect = pg.Rect(gameplay.screen_pos_func(pos_flat), (size, size))
+        screen = gameplay.screen
+        screen.blit(gameplay.static_bg_surf, rect, area=rect)
+        if cell == cell_empty:
+            return rect
+        color = gameplay.fruit_color if cell == cell_fruit else\
+                gameplay.head_color if cell == cell_head else\
+                gameplay.tail_colors[0]
+        screen.blit(gameplay.surface_atlas.getSurface(color, size), rect)
+        return rect
+    
+    def _drawScore(self, score: int) -> "pg.Rect":
+        gameplay = self.gameplay
+        rect = gameplay.score_text_number_rect
+        gameplay.screen.blit(gameplay.static_bg_surf, rect, area=rect)
+        return gameplay.score_display.draw(gameplay.screen, score)
+    
+    def draw(self, score: int) -> None:
         """
-        Updates the position of the head, including performing the
-        corresponding required updates to the tail, checking if
-        has collided with the tail or walls and checking if has
-        collided with fruit (and if so, removing that fruit and
-        spawning a new one).
+        Draws the current state of the game on the screen, recording
+        the areas of the screen changed so that update() can update
+        only those areas of the display.
         
         Args:
-        pressed_keys (tuple), optional: the output of
-            pygame.key.get_pressed() representing the keys that are
-            being pressed at the time when that function is called.
-            If not given, or given as None, evaluates this function
-            at the beginning of this method.
-        
-        Returns:
-        2-tuple of bools, of which the 0th index corresponds to
-        whether the snake is still alive and the second to
-        whether it has eaten fruit.
+            score (int): the score to be displayed
         """
-        if mv is None:
-            mv = self.mv
-        else: self.mv = mv
-        # Finding the position after the move
-        pos2 = self.pos_flat
-        shape = self.arena_shape
-        x = pos2 % shape[1] if mv[0] else pos2 // shape[1]
-        #print(f"mv = {mv}, pos2 = {pos2}, x = {x}")
-        if not 0 <= x + mv[1] < shape[mv[0]]:
-            return (False, False)
-        pos2 += mv[1] * (1 if mv[0] else shape[1])
-        hit_fruit = self.fruits.remove(pos2)
-        occ_pos_flat = self.gameplay.occ_pos_flat
-        for pos_flat in self.tail.move(extend_tail=hit_fruit)[0]:
-            occ_pos_flat.remove(pos_flat)
-        if self.tail.includesPosition(pos2):
-            return (False, False)
-        if not hit_fruit:
-            occ_pos_flat.add(pos2)
-        #if hit_fruit:
-        #    self.fruits.randomSpawn()
-        self.pos_flat = pos2
-        return (True, hit_fruit)
+        gameplay = self.gameplay
+        state = gameplay.state
+        if self.head_pos_flat is None:
+            gameplay.draw(score)
+            self.rects = [gameplay.screen.get_rect()]
+            self._record(state)
+            self.score = score
+            return
+        cells = {self.head_pos_flat, self.tail_end_pos_flat,\
+                state.head_pos_flat}
+        cells.update(self.fruits.symmetric_difference(state.fruits))
+        rects = self.rects
+        for pos_flat in cells:
+            rects.append(self._drawCell(pos_flat))
+        if score != self.score:
+            rects.append(self._drawScore(score))
+        self._record(state)
+        self.score = score
+        return
     
-    def drawHeadAndTail(self) -> None:
-        #print("Drawing head")
-        self.draw()
-        self.tail.draw()
+    def update(self) -> None:
+        """
+        Updates the areas of the display changed since the previous
+        call to update().
+        """
+        if self.rects:
+            pg.display.update(self.rects)
+            self.rects = []
         return
+
+class CellEntryTimes:
+    """
+    Records the move on which the head last entered each cell of the
+    arena, as the frames of a game are drawn, from which the index of
+    each tail section along the snake (counting from the end of the
+    tail) is found without traversing the snake. Must be updated with
+    update() after every move, with the record rebuilt from the snake
+    after reset().
+
+    Args:
+        length (int): the number of cells in the arena
+    """
+    __slots__ = ("times", "n_moves", "head_pos_flat")
     
-# Define a tail section object
-class TailSprite(SquareSprite):
-    def __init__(self, head: "HeadSprite", pos_flat: Tuple[int], color: Tuple[Union[Tuple[int], Real]]):
-        super().__init__(
-            head.screen,
-            head.arena_shape,
-            pos_flat,
-            color=color, size=head.size,
-            screen_pos_func=head.screen_pos_func,
-        )
+    def __init__(self, length: int):
+        self.times = np.zeros(length, dtype=np.int64)
+        self.reset()
+    
+    def reset(self) -> None:
+        self.n_moves = 0
+        self.head_pos_flat = None
+        return
+    
+    def update(self, state: "GameState") -> None:
+        if self.head_pos_flat is None:
+            snake_qu = state.snake_qu
+            pos_flat = np.fromiter(snake_qu, dtype=np.intp, count=len(snake_qu))
+            self.times[pos_flat] = np.arange(len(snake_qu))
+            self.n_moves = len(snake_qu) - 1
+        elif state.head_pos_flat != self.head_pos_flat:
+            self.n_moves += 1
+            self.times[state.head_pos_flat] = self.n_moves
+        self.head_pos_flat = state.head_pos_flat
+        return
+    
+    def sectionIndices(self, state: "GameState", pos_flat: np.ndarray) -> np.ndarray:
+        """
+        Gives the index along the snake, counting from the end of the
+        tail, of the tail section at each of the flattened positions
+        pos_flat.
+        """
+        return self.times[pos_flat] - self.times[state.tail_end_pos_flat]
 
-# Define the tail as a whole
-class TailSpriteQueue:
-    def __init__(self, head: "HeadSprite", tail_colors: Tuple[Tuple[Union[Tuple[int], Real]]]):
-        self.head = head
-        self.tail_qu = deque()
-        self.pos_in_qu = set()
-        self.tail_colors = tail_colors
+class PixelBoard:
+    """
+    Surface with one pixel per cell of the arena giving the colour of
+    that cell, from which the arena is drawn by scaling the surface
+    (see PixelBoardRenderer and Minimap).
+
+    The surface is built in full from the grid of the game state by
+    reset(), after which update() only sets the pixels of the cells
+    that have changed. Where the tail is drawn with a gradient of
+    colours (as the colour of every tail section then changes with
+    every move), update() instead rewrites every pixel in one NumPy
+    operation through pygame.surfarray, with the colours of the tail
+    sections found from a CellEntryTimes. Colours that are not fully
+    opaque are blended with the colour of the arena.
+
+    Args:
+        gameplay (GamePlay): the game being drawn
+        gradient (bool), optional: whether the tail sections are
+            coloured with the gradient of GamePlay.tail_colors (see
+            Tail.tailColors()) rather than all with the first of those
+            colours. Default: True
+    """
+    __slots__ = ("gameplay", "gradient", "surf", "palette", "entry_times", "_tail_rgb")
     
-    def includesPosition(self, pos_flat: int):
-        return pos_flat in self.pos_in_qu
-    
-    def move(self, extend_tail: bool=False) -> Tuple[Set[int]]:
-        res = (set(), set())
-        if not self.tail_qu and not extend_tail:
-            return res
-        head = self.head
-        self.tail_qu.append(TailSprite(self.head, self.head.pos_flat,\
-                color=self.tail_colors[0]))
-        res[1].add(self.head.pos_flat)
-        self.pos_in_qu.add(self.head.pos_flat)
-        if not extend_tail:
-            tail_end = self.tail_qu.popleft()
-            self.pos_in_qu.remove(tail_end.pos_flat)
-            res[0].add(tail_end.pos_flat)
-            tail_end.kill()
+    def __init__(self, gameplay: "GamePlay", gradient: bool=True):
+        self.gameplay = gameplay
+        colors = {(tuple(color), opacity) for color, opacity in gameplay.tail_colors}
+        self.gradient = gradient and len(colors) > 1
+        self.surf = None
+        self.palette = None
+        self.entry_times = CellEntryTimes(gameplay.arena_graph.length) if self.gradient else None
+        self._tail_rgb = (None, None)
+    
+    @staticmethod
+    def blendedColor(color: Tuple[Union[Tuple[int], Real]]) -> Tuple[int, int, int]:
+        # The RGB colour of color drawn over the arena
+        rgb, opacity = tuple(color[0])[:3], color[1]
+        if opacity >= 1: return rgb
+        bg = tuple(named_colors_def["white"])[:3]
+        return tuple(round(c * opacity + c0 * (1 - opacity)) for c, c0 in zip(rgb, bg))
+    
+    def createPalette(self) -> np.ndarray:
+        # The colour of the pixel of each cell state
+        gameplay = self.gameplay
+        res = np.zeros((4, 3), dtype=np.uint8)
+        res[cell_empty] = tuple(named_colors_def["white"])[:3]
+        res[cell_fruit] = self.blendedColor(gameplay.fruit_color)
+        res[cell_body] = self.blendedColor(gameplay.tail_colors[0])
+        res[cell_head] = self.blendedColor(gameplay.head_color)
         return res
     
-    def draw(self) -> None:
-        if len(self.tail_colors) != 1 and len(self.tail_qu) > 1:
-            length = len(self.tail_qu) - 1
-            for i, tail_sprite in enumerate(self.tail_qu):
-                r = i / length
-                ratios = (1 - r, r)
-                colors = self.tail_colors[0][0], self.tail_colors[1][0]
-                color = tuple(c1 * ratios[0] + c2 * ratios[1] for c1, c2 in zip(*colors)) 
-                opacities = self.tail_colors[0][1], self.tail_colors[1][1]
-                opacity = opacities[0] * ratios[0] + opacities[1] * ratios[1]
-                tail_sprite.color = (color, opacity)
-        for tail_sprite in self.tail_qu:
-            tail_sprite.draw()
+    def tailRGB(self, length: int) -> np.ndarray:
+        # The colours of the tail sections from the end of the tail,
+        # cached for the current length
+        if self._tail_rgb[0] != length:
+            tail = Tail(self.gameplay, self.gameplay.tail_colors)
+            rgb = np.array([self.blendedColor(color) for color in tail.tailColors(length)],\
+                    dtype=np.uint8).reshape(-1, 3)
+            self._tail_rgb = (length, rgb)
+        return self._tail_rgb[1]
+    
+    def _blitAll(self, state: "GameState") -> None:
+        grid = np.frombuffer(state.grid, dtype=np.uint8).reshape(self.gameplay.arena_shape)
+        rgb = self.palette[grid]
+        if self.gradient:
+            self.entry_times.update(state)
+            inds0, inds1 = np.nonzero(grid == cell_body)
+            pos_flat = inds0 * grid.shape[1] + inds1
+            tail_rgb = self.tailRGB(len(state.snake_qu) - 1)
+            rgb[inds0, inds1] = tail_rgb[self.entry_times.sectionIndices(state, pos_flat)]
+        pg.surfarray.blit_array(self.surf, rgb)
+        return
+    
+    def reset(self, state: "GameState") -> None:
+        """
+        Rebuilds the surface in full from the grid of state.
+        """
+        self.palette = self.createPalette()
+        surf = pg.Surface(self.gameplay.arena_shape)
+        if pg.display.get_surface() is not None:
+            surf = surf.convert()
+        self.surf = surf
+        if self.entry_times is not None:
+            self.entry_times.reset()
+        self._blitAll(state)
+        return
+    
+    def update(self, state: "GameState", cells: Iterable[int]) -> None:
+        """
+        Updates the surface to match state, where the cells (as
+        flattened positions) whose states have changed since the
+        previous update are given by cells.
+        """
+        if self.gradient:
+            self._blitAll(state)
+            return
+        surf, palette, grid = self.surf, self.palette, state.grid
+        n1 = self.gameplay.arena_shape[1]
+        for pos_flat in cells:
+            surf.set_at(divmod(pos_flat, n1), palette[grid[pos_flat]])
         return
 
-# Define a fruit object
-class FruitSprite(SquareSprite):
-    def __init__(self, gameplay, pos_flat: Tuple[int]):
-        super().__init__(gameplay.screen, gameplay.arena_shape,\
-                pos_flat, color=gameplay.fruit_color,\
-                size=gameplay.head_size,\
-                screen_pos_func=gameplay.screen_pos_func)
+class Minimap:
+    """
+    Map of the whole arena drawn in the bottom right corner of the
+    viewport in camera mode (see CameraRenderer), together with the
+    outline of the area of the arena shown in the viewport.
 
-class Fruits:
-    def __init__(self, gameplay):
+    The map is drawn by scaling a PixelBoard (with every tail section
+    the same colour, so that only the pixels of changed cells are
+    updated each frame) to the size of the map, so the cost of each
+    frame depends on the size of the map rather than the area of the
+    arena.
+
+    Args:
+        gameplay (GamePlay): the game being drawn
+        max_fraction (float), optional: the largest fraction of the
+            width or height of the viewport the map may cover.
+            Default: 0.25
+    """
+    __slots__ = ("gameplay", "max_fraction", "board", "scaled")
+    
+    def __init__(self, gameplay: "GamePlay", max_fraction: float=0.25):
         self.gameplay = gameplay
-        self.fruit_dict = SortedDict()
-        
-    def remove(self, pos_flat: Tuple[int]) -> bool:
-        if pos_flat not in self.fruit_dict.keys():
-            return False
-        self.fruit_dict.pop(pos_flat)
-        return True
+        self.max_fraction = max_fraction
+        self.board = PixelBoard(gameplay, gradient=False)
+        self.scaled = None
+    
+    def mapRect(self) -> "pg.Rect":
+        """
+        Gives the area of the screen covered by the map, being the
+        largest with the proportions of the arena within max_fraction
+        of the viewport, in its bottom right corner.
+        """
+        gameplay = self.gameplay
+        view_rect = gameplay.arena
+        scale = min(self.max_fraction * d / n for d, n in zip(view_rect.size, gameplay.arena_shape))
+        size = tuple(max(1, round(n * scale)) for n in gameplay.arena_shape)
+        return pg.Rect((view_rect.right - size[0], view_rect.bottom - size[1]), size)
+    
+    def reset(self, state: "GameState") -> None:
+        """
+        Rebuilds the map in full from the grid of state.
+        """
+        self.board.reset(state)
+        scaled = pg.Surface(self.mapRect().size)
+        if pg.display.get_surface() is not None:
+            scaled = scaled.convert()
+        self.scaled = scaled
+        return
+    
+    def updateCells(self, state: "GameState", cells: Iterable[int]) -> None:
+        """
+        Updates the map at the given cells (as flattened positions)
+        from the grid of state.
+        """
+        self.board.update(state, cells)
+        return
+    
+    def draw(self, surf: "pg.Surface", origin: Tuple[int, int]) -> "pg.Rect":
+        """
+        Draws the map on surf, with the outline of the viewport whose
+        top left cell is origin.
+
+        Returns:
+        pygame.Rect object giving the area of surf covered by the map.
+        """
+        gameplay = self.gameplay
+        rect = self.mapRect()
+        pg.transform.scale(self.board.surf, rect.size, self.scaled)
+        surf.blit(self.scaled, rect)
+        scale = tuple(d / n for d, n in zip(rect.size, gameplay.arena_shape))
+        outline = pg.Rect(
+            (rect.x + round(origin[0] * scale[0]), rect.y + round(origin[1] * scale[1])),
+            tuple(max(1, round(v * sc)) for v, sc in zip(gameplay.view_shape, scale)),
+        )
+        pg.draw.rect(surf, named_colors_def["gray"], outline, 1)
+        pg.draw.rect(surf, named_colors_def["black"], rect, 1)
+        return rect
+
+class CameraRenderer(DirtyRectRenderer):
+    """
+    Renders a game whose arena is larger than the viewport (camera
+    mode), showing the part of the arena within a viewport of
+    GamePlay.view_shape cells that follows the head, centred on the
+    head where the edges of the arena allow. Optionally, a map of the
+    whole arena (see Minimap) is drawn in a corner of the viewport.
+
+    As the viewport may scroll with every move, the viewport is
+    redrawn in full each frame, with the cells to draw found from the
+    part of the occupancy grid of the game state within the viewport,
+    so that the cost of each frame depends on the size of the viewport
+    rather than the area of the arena or the length of the snake. The
+    colour of each visible tail section is found from the move on
+    which the head entered its cell (see CellEntryTimes).
+
+    The first frame, and any frame after reset() is called, redraws
+    the whole screen.
+    """
+    __slots__ = ("origin", "minimap", "entry_times", "_tail_colors")
+    
+    def __init__(self, gameplay: "GamePlay"):
+        self.origin = (0, 0)
+        self.minimap = Minimap(gameplay) if gameplay.show_minimap else None
+        self.entry_times = CellEntryTimes(gameplay.arena_graph.length)
+        self._tail_colors = (None, None)
+        super().__init__(gameplay)
+    
+    def reset(self) -> None:
+        super().reset()
+        self.entry_times.reset()
+        return
+    
+    def follow(self, head_pos_flat: int) -> Tuple[int, int]:
+        """
+        Moves the viewport to be centred on the head at head_pos_flat,
+        as far as the edges of the arena allow.
+
+        Returns:
+        2-tuple of ints giving the cell at the top left of the
+        viewport.
+        """
+        gameplay = self.gameplay
+        head_pos = divmod(head_pos_flat, gameplay.arena_shape[1])
+        self.origin = tuple(min(max(h - v // 2, 0), n - v) for h, v, n in\
+                zip(head_pos, gameplay.view_shape, gameplay.arena_shape))
+        return self.origin
+    
+    def tailColors(self, length: int) -> List[Tuple[Union[Tuple[int], Real]]]:
+        # The colours of the tail sections from the end of the tail
+        # (see Tail.tailColors()), cached for the current length
+        if self._tail_colors[0] != length:
+            tail = Tail(self.gameplay, self.gameplay.tail_colors)
+            self._tail_colors = (length, list(tail.tailColors(length)))
+        return self._tail_colors[1]
+    
+    def _drawCells(self, origin: Tuple[int, int]) -> "pg.Rect":
+        gameplay = self.gameplay
+        state = gameplay.state
+        (o0, o1), (v0, v1) = origin, gameplay.view_shape
+        n1 = gameplay.arena_shape[1]
+        grid = np.frombuffer(state.grid, dtype=np.uint8).reshape(gameplay.arena_shape)
+        window = grid[o0:o0 + v0, o1:o1 + v1]
+        inds0, inds1 = np.nonzero(window)
+        pos_flat = (inds0 + o0) * n1 + inds1 + o1
+        size = gameplay.head_size
+        x0, y0 = gameplay.arena_topleft
+        get_surf = gameplay.surface_atlas.getSurface
+        surfs = {
+            cell_fruit: get_surf(gameplay.fruit_color, size),
+            cell_head: get_surf(gameplay.head_color, size),
+        }
+        tail_colors = self.tailColors(len(state.snake_qu) - 1)
+        blits = []
+        for cell, section, x, y in zip(window[inds0, inds1].tolist(),\
+                self.entry_times.sectionIndices(state, pos_flat).tolist(),\
+                (inds0 * size + x0).tolist(), (inds1 * size + y0).tolist()):
+            if cell == cell_body:
+                surf = get_surf(tail_colors[section], size)
+            else: surf = surfs[cell]
+            blits.append((surf, (x, y)))
+        gameplay.screen.blits(blits, doreturn=False)
+        return gameplay.arena
+    
+    def draw(self, score: int) -> None:
+        """
+        Draws the part of the game within the viewport on the screen,
+        recording the areas of the screen changed so that update()
+        can update only those areas of the display.
         
-    def randomSpawn(self, occ_pos_flat: SortedSet, count: int=1) -> List[int]:
-        shape = self.gameplay.arena_shape
-        mx = shape[0] * shape[1] - len(occ_pos_flat)
-        if mx < count:
-            raise NoSpaceToCreateError("Insufficient valid spaces to "
-                    "place the specified number of fruits.")
-        idx_lst = next(iter(randomKTupleGenerator(mx, count,\
-                mx_n_samples=1, allow_index_repeats=False,\
-                allow_tuple_repeats=False,
-                nondecreasing=True)))
-        res = []
-        for idx in reversed(idx_lst):
-            pos_flat = findKthMissing(occ_pos_flat, idx)
-            res.append(pos_flat)
-            occ_pos_flat.add(pos_flat)
-            self.fruit_dict[pos_flat] =\
-                    FruitSprite(self.gameplay, pos_flat)
-        return res
+        Args:
+            score (int): the score to be displayed
+        """
+        gameplay = self.gameplay
+        state = gameplay.state
+        screen = gameplay.screen
+        rects = self.rects
+        full = self.head_pos_flat is None
+        if full:
+            screen.blit(gameplay.static_bg_surf, (0, 0))
+            gameplay.score_display.draw(screen, score)
+            rects.append(screen.get_rect())
+            if self.minimap is not None:
+                self.minimap.reset(state)
+        else:
+            if self.minimap is not None:
+                cells = {self.head_pos_flat, self.tail_end_pos_flat,\
+                        state.head_pos_flat}
+                cells.update(self.fruits.symmetric_difference(state.fruits))
+                self.minimap.updateCells(state, cells)
+            view_rect = gameplay.arena
+            screen.blit(gameplay.static_bg_surf, view_rect, area=view_rect)
+            rects.append(view_rect)
+            if score != self.score:
+                rects.append(self._drawScore(score))
+        self.entry_times.update(state)
+        origin = self.follow(state.head_pos_flat)
+        self._drawCells(origin)
+        if self.minimap is not None:
+            self.minimap.draw(screen, origin)
+        self._record(state)
+        self.score = score
+        return
+
+class PixelBoardRenderer(DirtyRectRenderer):
+    """
+    Renders the game from a PixelBoard, with one pixel per cell of the
+    arena, which is scaled to the arena with a single call to
+    pygame.transform.scale() each frame, rather than blitting a
+    surface for each tail section and fruit. Each move only updates
+    the pixels of the cells that have changed (or with a gradient of
+    tail colours, rewrites the board in one NumPy operation), so the
+    cost of each frame is nearly independent of the length of the
+    snake and the number of fruits.
+
+    The first frame, and any frame after reset() is called, redraws
+    the whole screen.
+    """
+    __slots__ = ("board", "scaled")
     
-    def draw(self) -> None:
-        for fruit_sprite in self.fruit_dict.values():
-            fruit_sprite.draw()
+    def __init__(self, gameplay: "GamePlay"):
+        self.board = PixelBoard(gameplay)
+        self.scaled = None
+        super().__init__(gameplay)
+    
+    def draw(self, score: int) -> None:
+        """
+        Draws the current state of the game on the screen, recording
+        the areas of the screen changed so that update() can update
+        only those areas of the display.
+        
+        Args:
+            score (int): the score to be displayed
+        """
+        gameplay = self.gameplay
+        state = gameplay.state
+        screen = gameplay.screen
+        rects = self.rects
+        if self.head_pos_flat is None:
+            screen.blit(gameplay.static_bg_surf, (0, 0))
+            gameplay.score_display.draw(screen, score)
+            rects.append(screen.get_rect())
+            self.board.reset(state)
+            scaled = pg.Surface(gameplay.arena_dims)
+            if pg.display.get_surface() is not None:
+                scaled = scaled.convert()
+            self.scaled = scaled
+        else:
+            cells = {self.head_pos_flat, self.tail_end_pos_flat,\
+                    state.head_pos_flat}
+            cells.update(self.fruits.symmetric_difference(state.fruits))
+            self.board.update(state, cells)
+            rects.append(gameplay.arena)
+            if score != self.score:
+                rects.append(self._drawScore(score))
+        pg.transform.scale(self.board.surf, gameplay.arena_dims, self.scaled)
+        screen.blit(self.scaled, gameplay.arena_topleft)
+        self._record(state)
+        self.score = score
         return
 
 class GamePlay:
@@ -304,6 +910,7 @@ class GamePlay:
     static_bg_imgs_constructor_names = ["arena", "title_text", "score_text_static"]
     
     pause_keys_def = {pg.K_p}
+    profiler_keys_def = {pg.K_F3}
 
     def __init__(
         self,
@@ -320,9 +927,26 @@ class GamePlay:
         auto: bool=False,
         navkeys: Optional[Set[int]]=None,
         pause_keys: Optional[Set[int]]=None,
+        tail_render_mode: str="blit",
+        dirty_rects: bool=True,
+        pixel_board: bool=False,
+        profile: bool=False,
+        profile_path: Optional[str]=None,
+        profiler_keys: Optional[Set[int]]=None,
+        viewport_shape: Optional[Tuple[int, int]]=None,
+        minimap: bool=True,
     ):
         pg.init()
         self._screen = screen
+        # The number of cells of the arena shown at once in each
+        # direction, with the screen sized to fit this many cells
+        # and a viewport following the head (see CameraRenderer) if
+        # this is smaller than the arena, and the whole arena shown
+        # if not given
+        self.viewport_shape = viewport_shape
+        # Whether a map of the whole arena is shown in the viewport
+        # (see Minimap) when the arena is larger than the viewport
+        self.show_minimap = minimap
         self.head_size = head_size
         self.arena_shape = arena_shape
         self.move_rate = move_rate
@@ -344,6 +968,27 @@ class GamePlay:
         self.navkeys = navkeys
         self.pause_keys = pause_keys
         
+        # How the tail is drawn, either "blit" (blitting each section
+        # separately) or "surfarray" (writing all sections into one
+        # surface with NumPy, which is faster for long tails)
+        if tail_render_mode not in tail_render_modes.keys():
+            raise ValueError(f"Unrecognised tail render mode {tail_render_mode}")
+        self.tail_render_mode = tail_render_mode
+        # Whether to redraw only the changed parts of the screen each
+        # frame where possible (see DirtyRectRenderer)
+        self.dirty_rects = dirty_rects
+        # Whether the arena is drawn by scaling a surface with one
+        # pixel per cell (see PixelBoardRenderer), which takes
+        # precedence over dirty_rects but not camera mode
+        self.pixel_board = pixel_board
+        # Whether the phases of the main loop are timed and shown in a
+        # HUD overlay (see ProfilerHUD), which is toggled by pressing
+        # any of profiler_keys, and the file to which the timings are
+        # exported (see FrameProfiler.export()) at the end of each game
+        self.show_profiler = profile
+        self.profile_path = profile_path
+        self.profiler_keys = self.profiler_keys_def if profiler_keys is None else profiler_keys
+        
         self.head_color = (named_colors_def["red"], 1)
         self.tail_colors = ((named_colors_def["black"], 1), ((150, 0, 0), 1))
         self.fruit_color = (named_colors_def["lime"], 1)
@@ -361,7 +1006,7 @@ class GamePlay:
         self.enter_keys = enter_keys_def_glob
         
         self.user_input_processor = UserInputProcessor(keys_down_func=False,
-            key_press_event_filter=lambda obj, event: event.key in obj.pause_keys.union(obj.navkeys_dict.keys()),
+            key_press_event_filter=lambda obj, event: event.key in obj.pause_keys.union(obj.navkeys_dict.keys(), obj.profiler_keys),
             key_release_event_filter=False,
             mouse_press_event_filter=False,
             mouse_release_event_filter=False,
@@ -502,22 +1147,45 @@ class GamePlay:
                 for x, y in zip(pos, self.border))
     
     def screenPositionFromFlat(self, pos_flat: int) -> Tuple[int]:
-        pos = divmod(pos_flat, self.arena_shape[1])
-        return self.screenPosition(pos)
+        return self.screen_pos_table[pos_flat]
+    
+    @property
+    def arena_graph(self) -> "Arena":
+        # The precomputed connectivity of the cells of the arena (not
+        # to be confused with the pygame.Rect arena)
+        res = getattr(self, "_arena_graph", None)
+        if res is None:
+            res = getArena(self.arena_shape)
+            self._arena_graph = res
+        return res
+    
+    @property
+    def screen_pos_table(self) -> Tuple[Tuple[int, int]]:
+        # The screen position of each flattened position
+        res = getattr(self, "_screen_pos_table", None)
+        if res is None:
+            res = self.arena_graph.screenPositions(self.head_size, self.arena_topleft)
+            self._screen_pos_table = res
+        return res
     
     def _resetGameDimensions(self) -> None:
         #print("Using _resetGameDimensions()")
+        self._view_shape = None
         self._arena_dims = None
         self._screen_shape = None
         self._auto_fruitpos = None
         self._arena_topleft = None
         self._arena = None
+        self._arena_graph = None
+        self._screen_pos_table = None
         self._score_text_max_height = None
         self._score_text_static_max_width = None
         self._score_text_number_max_width = None
         self._score_text_static_bottomright_pos = None
         self._score_text_number_bottomleft_pos = None
+        self._score_text_number_rect = None
         self._static_bg_surf = None
+        self._surface_atlas = None
 
         for menu_attr in ("_pause_overlay", "_death_overlay"):
             menu = getattr(self, menu_attr, None)
@@ -559,14 +1227,43 @@ class GamePlay:
         self._resetGameDimensions()
         return
     
+    @property
+    def viewport_shape(self):
+        return self._viewport_shape
+    
+    @viewport_shape.setter
+    def viewport_shape(self, viewport_shape):
+        self._viewport_shape = viewport_shape
+        self._resetGameDimensions()
+        return
+    
+    @property
+    def view_shape(self) -> Tuple[int, int]:
+        # The number of cells of the arena shown on the screen in each
+        # direction
+        res = getattr(self, "_view_shape", None)
+        if res is None:
+            viewport_shape = getattr(self, "_viewport_shape", None)
+            res = tuple(self.arena_shape) if viewport_shape is None else\
+                    tuple(min(v, n) for v, n in zip(viewport_shape, self.arena_shape))
+            self._view_shape = res
+        return res
+    
+    @property
+    def camera_enabled(self) -> bool:
+        # Whether only part of the arena is shown on the screen
+        return self.view_shape != tuple(self.arena_shape)
+    
     @property
     def arena_dims(self):
+        # The dimensions in pixels of the area of the screen in which
+        # the arena (or in camera mode, the viewport) is drawn
         arena_dims = getattr(self, "_arena_dims", None)
         if arena_dims is not None:
             return arena_dims
         #print("calculating arena_dims")
         self._arena_dims = tuple(self._head_size * x for x in\
-                                self._arena_shape)
+                                self.view_shape)
         return self._arena_dims
     
     @property
@@ -584,7 +1281,7 @@ class GamePlay:
         if screen_shape is not None:
             return screen_shape
         self._screen_shape = tuple(self.head_size * (x + sum(y))\
-                for x, y in zip(self.arena_shape, self.border))
+                for x, y in zip(self.view_shape, self.border))
         
         return self._screen_shape
     
@@ -642,6 +1339,14 @@ class GamePlay:
     #def createBackgroundImageConstructor(self) -> Callable[[], None]:
     #    return lambda: self.screen.blit(self.bg_surf, (0, 0))
     
+    @property
+    def surface_atlas(self):
+        res = getattr(self, "_surface_atlas", None)
+        if res is None:
+            res = SurfaceAtlas()
+            self._surface_atlas = res
+        return res
+    
     @property
     def arena(self):
         res = getattr(self, "_arena", None)
@@ -695,7 +1400,7 @@ class GamePlay:
         return res
     
     def calculateTitleTextMaxShape(self):
-        max_shape = (self.arena_shape[0] * 0.48, self.border[1][0] * 0.9)
+        max_shape = (self.view_shape[0] * 0.48, self.border[1][0] * 0.9)
         return tuple(x * self.head_size for x in max_shape)
     
     def createTitleText(self):
@@ -732,7 +1437,7 @@ class GamePlay:
         return res
     
     def calculateScoreTextStaticMaxWidth(self) -> float:
-        self.arena_shape[0] * 0.3 * self.head_size
+        self.view_shape[0] * 0.3 * self.head_size
 
     @property
     def score_text_static_max_width(self):
@@ -743,7 +1448,7 @@ class GamePlay:
         return res 
     
     def calculateScoreTextNumberMaxWidth(self) -> float:
-        return self.arena_shape[0] * 0.1 * self.head_size
+        return self.view_shape[0] * 0.1 * self.head_size
 
     @property
     def score_text_number_max_width(self):
@@ -754,7 +1459,7 @@ class GamePlay:
         return res
     
     def calculateScoreTextStaticBottomRightPosition(self) -> Tuple[int, int]:
-        return ((self.border[0][0] + self.arena_shape[0]) * self.head_size - self.score_text_number_max_width, self.border[1][0] * 0.9 * self.head_size)
+        return ((self.border[0][0] + self.view_shape[0]) * self.head_size - self.score_text_number_max_width, self.border[1][0] * 0.9 * self.head_size)
         #re tuple(x * self.head_size for x in txt_anchor_rel_pos)
 
     @property
@@ -766,7 +1471,7 @@ class GamePlay:
         return res
 
     def calculateScoreTextNumberBottomLeftPosition(self) -> Tuple[int, int]:
-        return ((self.border[0][0] + self.arena_shape[0]) * self.head_size - self.score_text_number_max_width, self.border[1][0] * 0.9 * self.head_size)
+        return ((self.border[0][0] + self.view_shape[0]) * self.head_size - self.score_text_number_max_width, self.border[1][0] * 0.9 * self.head_size)
         #re tuple(x * self.head_size for x in txt_anchor_rel_pos)
 
     @property
@@ -909,8 +1614,11 @@ class GamePlay:
     
     def createBackgroundSurface(self):
         surf = pg.Surface(self.screen_shape)
+        if pg.display.get_surface() is not None:
+            surf = surf.convert()
         color, alpha0 = self.bg_color
-        surf.set_alpha(alpha0 * 255)
+        if alpha0 < 1:
+            surf.set_alpha(alpha0 * 255)
         surf.fill(color)
         return surf
 
@@ -942,9 +1650,9 @@ class GamePlay:
         #self.arena
         
         # Display the score
-        self.score_text_number.text = str(score)
-        self.score_text_number_img_constructor(self.screen)
+        self.score_display.draw(self.screen, score)
         
+        self.head.sync(self.state)
         self.head.drawHeadAndTail()
         self.fruits.draw()
         
@@ -954,6 +1662,94 @@ class GamePlay:
         #            **overlay_input[1])
         return
     
+    @property
+    def score_text_number_rect(self) -> "pg.Rect":
+        # The part of the top border to the right of the static score
+        # text, within which the score is drawn
+        res = getattr(self, "_score_text_number_rect", None)
+        if res is None:
+            x = int(self.score_text_number_bottomleft_pos[0])
+            res = pg.Rect(x, 0, self.screen_shape[0] - x,\
+                    self.border[1][0] * self.head_size)
+            self._score_text_number_rect = res
+        return res
+    
+    @property
+    def score_display(self) -> "ScoreDisplay":
+        res = getattr(self, "_score_display", None)
+        if res is None:
+            res = ScoreDisplay(self)
+            self._score_display = res
+        return res
+    
+    @property
+    def use_dirty_rects(self) -> bool:
+        if not self.dirty_rects: return False
+        colors = {(tuple(color), opacity) for color, opacity in self.tail_colors}
+        return len(colors) == 1
+    
+    @property
+    def profiler(self) -> "FrameProfiler":
+        res = getattr(self, "_profiler", None)
+        if res is None:
+            res = FrameProfiler(profile_phases, enabled=self.show_profiler)
+            self._profiler = res
+        return res
+    
+    @property
+    def profiler_hud(self) -> "ProfilerHUD":
+        res = getattr(self, "_profiler_hud", None)
+        if res is None:
+            res = ProfilerHUD(self)
+            self._profiler_hud = res
+        return res
+    
+    def toggleProfiler(self) -> None:
+        """
+        Switches the profiling of the main loop and its HUD overlay on
+        or off.
+        """
+        self.show_profiler = not self.show_profiler
+        self.profiler.setEnabled(self.show_profiler)
+        renderer = getattr(self, "renderer", None)
+        if not self.show_profiler and renderer is not None:
+            # The next frame must be drawn in full to remove the HUD
+            renderer.reset()
+        return
+    
+    def drawFrame(self, score: int) -> None:
+        """
+        Draws the current state of the game, redrawing only the
+        changed parts of the screen if a DirtyRectRenderer is in use
+        and otherwise redrawing the whole screen.
+        
+        Args:
+            score (int): the score to be displayed
+        """
+        profiler = self.profiler
+        t0 = profiler.start()
+        renderer = getattr(self, "renderer", None)
+        if renderer is None:
+            self.draw(score)
+        else: renderer.draw(score)
+        profiler.stop("draw", t0)
+        if self.show_profiler:
+            rect = self.profiler_hud.draw(self.screen)
+            if renderer is not None:
+                renderer.rects.append(rect)
+        return
+    
+    def updateDisplay(self) -> None:
+        profiler = self.profiler
+        t0 = profiler.start()
+        renderer = getattr(self, "renderer", None)
+        if renderer is None:
+            pg.display.flip()
+        else: renderer.update()
+        profiler.stop("flip", t0)
+        profiler.frame()
+        return
+    
     @property
     def navkeys(self):
         return self.navkeys_def if self._navkeys is None else self._navkeys
@@ -989,7 +1785,10 @@ class GamePlay:
     
     def updateKeyBuffer(self, key_buffer_qu: deque):
         # Checking user inputs
+        profiler = self.profiler
+        t0 = profiler.start()
         quit, esc_pressed, input_dict = self.getRequiredInputs()
+        profiler.stop("input", t0)
         
         running = not esc_pressed and not quit
         events = input_dict["events"]
@@ -1001,39 +1800,39 @@ class GamePlay:
             if event_tup[1] != 0: continue
             if event_tup[0].key in self.pause_keys:
                 return (running, quit, True)
-            if event_tup[0].key in self.navkeys_dict.keys():
+            if event_tup[0].key in self.profiler_keys:
+                self.toggleProfiler()
+            elif event_tup[0].key in self.navkeys_dict.keys():
                 key_buffer_qu.append(event_tup[0].key)
         #if esc_pressed:
         #    print("escape key pressed")
         #    print(f"running = {running}, quit = {quit}")
         return (running, quit, False)
     
-    @property
-    def bot(self):
-        res = getattr(self, "_bot", None)
-        if res is None:
-            snake_qu = deque(x.pos_flat for x in self.head.tail.tail_qu)
-            snake_qu.append(self.head.pos_flat)
-            res = TailChaserBot(
-                self.arena_shape,
-                self.head.pos_flat,
-                head_direct=self.head.mv,
-                fruits=set(self.head.fruits.fruit_dict.keys()),
-                snake_qu=snake_qu,
-            )
-            self._bot = res
-        return res
-    
     def autoDirection(self, key_buffer_qu: deque, framerate: int, clock: "pg.time.Clock", add_fruit: Optional[int]=None):
-        tail_end_idx = self.head.tail.tail_qu[0].pos_flat if self.head.tail.tail_qu else self.head.pos_flat
-        res = self.bot.addFruitFindMoveAndUpdate(add_fruit=add_fruit, search_depth=4)
+        # The moves are chosen by the bot on a background thread (see
+        # BotMoveWorker), which must be restarted from the current
+        # state whenever a fruit has been spawned
+        worker = self.bot_worker
+        if add_fruit is not None:
+            worker.resync(self.state)
         clock.tick(framerate)
-        (running, quit, to_pause) =\
-                    self.updateKeyBuffer(key_buffer_qu)
-        if to_pause:
-            _, quit = self.pause()
-        if quit: running = False
-        while key_buffer_qu: key_buffer_qu.popleft()
+        while True:
+            (running, quit, to_pause) =\
+                        self.updateKeyBuffer(key_buffer_qu)
+            if to_pause:
+                _, quit = self.pause()
+            if quit: running = False
+            while key_buffer_qu: key_buffer_qu.popleft()
+            if not running: return running, quit, None
+            # If the bot has not yet found the next move, continues
+            # processing events while waiting for it
+            res = worker.getMove(timeout=1 / framerate)
+            if res is not None: break
+        # The time spent searching for the move, which excludes the
+        # events processed (timed as input) and any time the move
+        # waited in the buffer
+        self.profiler.add("bot", worker.last_search_ns)
         return running, quit, res
     
     def userInputDirection(self, key_buffer_qu: deque, framerate: int, clock: "pg.time.Clock") -> Tuple[int]:
@@ -1057,10 +1856,11 @@ class GamePlay:
         #print(f"running = {running}, quit = {quit}")
         if not running: return (running, quit, None)
         # Get move from key buffer
-        if self.head.mv[1]:
+        head_direct = self.state.head_direct
+        if head_direct[1]:
             while key_buffer_qu:
                 mv = self.navkey2Move(key_buffer_qu.popleft())
-                if mv[0] != self.head.mv[0]: break
+                if mv[0] != head_direct[0]: break
             else: mv = None
         else: mv = self.navkey2Move(key_buffer_qu.popleft())\
                 if key_buffer_qu else None
@@ -1070,19 +1870,24 @@ class GamePlay:
         # Setup the clock for a consistent framerate
         clock = pg.time.Clock()
         
-        # Set or reset the fruits
-        self.fruits = Fruits(self)
-        
-        # Set or reset the head to its initial position and direction
-        hp = self.head_init_pos_func(self)
-        hp_flat = hp[0] * self.arena_shape[1] + hp[1]
-        self.head = HeadSprite(self, hp_flat, self.head_init_direct)
-        
-        # Record occupied flattened positions
-        self.occ_pos_flat = SortedSet({self.head.pos_flat})
+        # Set or reset the game state, with the head at its initial
+        # position and direction and the initial fruit(s) placed
+        self.state = GameState(
+            self.arena_shape,
+            head_init_pos=self.head_init_pos_func(self),
+            head_init_direct=self.head_init_direct,
+            n_fruit=self.n_fruit,
+        )
         
-        # Add initial fruit(s)
-        self.fruits.randomSpawn(self.occ_pos_flat, count=self.n_fruit)
+        # Set or reset the sprites used to render the game state
+        self.fruits = Fruits(self)
+        self.head = HeadSprite(self, self.state.head_pos_flat)
+        if self.camera_enabled:
+            self.renderer = CameraRenderer(self)
+        elif self.pixel_board:
+            self.renderer = PixelBoardRenderer(self)
+        else:
+            self.renderer = DirtyRectRenderer(self) if self.use_dirty_rects else None
 
         # Variable to keep the main loop running
         running = True
@@ -1090,14 +1895,14 @@ class GamePlay:
         key_buffer_qu = deque()
         prev_pressed_keys = None
 
-        score = 0
         retry = False
         quit = False
         iter_cycle_no = 0
         
         framerate = self.move_rate * self.n_frame_per_move
         if auto:
-            self._bot = None
+            self.bot_worker = BotMoveWorker(self.state, search_depth=4)
+            self.bot_worker.start()
             move_func = (lambda: self.autoDirection(key_buffer_qu, self.move_rate, clock, add_fruit=add_fruit))
             add_fruit = None
         else:
@@ -1106,31 +1911,28 @@ class GamePlay:
         # Main loop
         while True:
             # Update the display
-            pg.display.flip()
+            self.updateDisplay()
             running, quit, mv = move_func()#self.userInputDirection(key_buffer_qu, framerate, clock)
             #print(f"running = {running}, quit = {quit}")
             #print(f"mv = {mv}")
             if not running: break
-            alive, hit_fruit = self.head.move(mv)
-            #print(f"head position flat = {self.head.pos_flat}, tail positions flat = {[x.pos_flat for x in self.head.tail.tail_qu]}")
-            if alive and hit_fruit:
-                score += 1
-                try:
-                    fruit_inds = self.fruits.randomSpawn(self.occ_pos_flat, count=1)
-                except NoSpaceToCreateError:
-                    alive = False
-                    self.draw(score, overlay=None)
-                else:
-                    add_fruit = fruit_inds[0]
-            else: add_fruit = None
+            t0 = self.profiler.start()
+            alive, hit_fruit, fruit_inds = self.state.step(mv)
+            self.profiler.stop("step", t0)
+            add_fruit = fruit_inds[0] if fruit_inds else None
             if not alive:
+                if hit_fruit:
+                    # No space remains for a new fruit
+                    self.drawFrame(self.state.score)
                 retry, quit = self.death()
                 break
             
-            #print(f"fruit flat positions = {set(self.fruits.fruit_dict.keys())}")
-            self.draw(score, overlay=None)
-            #print(f"score = {score}")
-        return score, retry, quit
+            self.drawFrame(self.state.score)
+        if auto:
+            self.bot_worker.stop()
+        if self.profile_path is not None and self.profiler.frame_timings.count:
+            self.profiler.export(self.profile_path)
+        return self.state.score, retry, quit
     
     def menuOverlay(self, overlay_attr: str) -> Tuple[bool, bool]:
         
@@ -1173,7 +1975,13 @@ class GamePlay:
         return restart, quit
     
     def pause(self) -> Tuple[bool, bool]:
-        return self.menuOverlay(overlay_attr="pause_overlay")
+        res = self.menuOverlay(overlay_attr="pause_overlay")
+        # The overlay has been drawn over the screen, so the next frame
+        # must be drawn in full
+        renderer = getattr(self, "renderer", None)
+        if renderer is not None:
+            renderer.reset()
+        return res
     
     def death(self) -> Tuple[bool, bool]:
         return self.menuOverlay(overlay_attr="death_overlay")
@@ -0,0 +1,129 @@
+# library/src/anguis/hamiltonian.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any
+
+import os
+import tempfile
+
+import numpy as np
+
+from anguis.arena import getArena
+
+def cacheDirectory() -> str:
+    """
+    Gives the directory in which Hamiltonian cycles are cached, being
+    the value of the environment variable ANGUIS_CACHE_DIR if set and
+    otherwise the directory anguis within the user's cache directory
+    (XDG_CACHE_HOME if set, otherwise ~/.cache).
+    """
+    res = os.environ.get("ANGUIS_CACHE_DIR")
+    if res: return res
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "anguis")
+
+def createHamiltonianCycle(shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Constructs a Hamiltonian cycle of the arena of the given shape,
+    i.e. a sequence of moves visiting every cell exactly once and
+    returning to its start. Such a cycle exists if and only if the
+    number of cells is even and (unless the arena consists of exactly
+    two cells) both dimensions are at least 2.
+
+    The cycle starts at (0, 0), runs along the first row (or column,
+    if the number of rows is odd), then snakes back and forth over the
+    remaining rows (columns), excluding the first column (row), before
+    returning to the start along the first column (row).
+
+    Args:
+        shape (2-tuple of ints): the dimensions of the arena
+
+    Returns:
+    1D numpy int array giving the flattened positions of the cells in
+    the order they are visited by the cycle.
+
+    Raises:
+        ValueError: if the arena has no Hamiltonian cycle
+    """
+    n0, n1 = shape
+    if n0 * n1 == 2:
+        return np.arange(2, dtype=np.int32)
+    if (n0 * n1) & 1 or min(n0, n1) < 2:
+        raise ValueError(f"An arena of shape {tuple(shape)} has no Hamiltonian cycle")
+    # Constructed with an even number of rows, transposing if needed
+    transpose = bool(n0 & 1)
+    m0, m1 = (n1, n0) if transpose else (n0, n1)
+    path = [(0, j) for j in range(m1)]
+    for i in range(1, m0):
+        cols = range(m1 - 1, 0, -1) if i & 1 else range(1, m1)
+        path.extend((i, j) for j in cols)
+    path.extend((i, 0) for i in range(m0 - 1, 0, -1))
+    coords = np.array(path, dtype=np.int32)
+    if transpose:
+        coords = coords[:, ::-1]
+    return coords[:, 0] * n1 + coords[:, 1]
+
+def isHamiltonianCycle(shape: Tuple[int, int], cycle: np.ndarray) -> bool:
+    """
+    Checks whether cycle (as returned by createHamiltonianCycle()) is
+    a Hamiltonian cycle of the arena of the given shape.
+    """
+    n0, n1 = shape
+    length = n0 * n1
+    cycle = np.asarray(cycle)
+    if cycle.shape != (length,) or not np.issubdtype(cycle.dtype, np.integer):
+        return False
+    if not np.array_equal(np.sort(cycle), np.arange(length)):
+        return False
+    coords = getArena(shape).coords[cycle]
+    steps = np.abs(coords - np.roll(coords, -1, axis=0)).sum(axis=1)
+    return bool(np.all(steps == 1)) or length == 2
+
+def loadHamiltonianCycle(shape: Tuple[int, int], cache_dir: Optional[str]=None) -> np.ndarray:
+    """
+    Gives a Hamiltonian cycle of the arena of the given shape (see
+    createHamiltonianCycle()), reading it from the on-disk cache if it
+    has previously been constructed for that shape and otherwise
+    constructing it and writing it to the cache. A cached cycle that
+    cannot be read or is not valid is replaced, and failure to write
+    the cache is ignored.
+
+    Args:
+        shape (2-tuple of ints): the dimensions of the arena
+        cache_dir (str), optional: the cache directory. If not given
+            or given as None, uses cacheDirectory().
+
+    Returns:
+    1D numpy int array giving the flattened positions of the cells in
+    the order they are visited by the cycle.
+
+    Raises:
+        ValueError: if the arena has no Hamiltonian cycle
+    """
+    shape = tuple(shape)
+    if cache_dir is None:
+        cache_dir = cacheDirectory()
+    path = os.path.join(cache_dir, f"hamiltonian_{shape[0]}x{shape[1]}.npy")
+    try:
+        cycle = np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        cycle = None
+    if cycle is not None and isHamiltonianCycle(shape, cycle):
+        return cycle
+    cycle = createHamiltonianCycle(shape)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written to a temporary file first, so that other processes
+        # never read a partially written cycle
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, cycle, allow_pickle=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+    return cycle
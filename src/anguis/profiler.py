@@ -0,0 +1,193 @@
+# library/src/anguis/profiler.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Iterable
+
+import json
+import time
+
+import numpy as np
+
+class PhaseTimings:
+    """
+    Rolling record of the durations of one phase of the game loop,
+    holding the most recent window durations (from which percentiles
+    are found) together with a histogram of them in power of 2 bins of
+    microseconds, which is updated as each duration enters and leaves
+    the window. Also keeps the count and total of all the durations
+    recorded.
+
+    Bin 0 of the histogram holds durations under 1 microsecond and
+    bin k (for k >= 1) those of at least 2 ** (k - 1) and under
+    2 ** k microseconds, with the last bin also holding all longer
+    durations.
+
+    Args:
+        window (int): the number of most recent durations held
+        n_bins (int), optional: the number of histogram bins.
+            Default: 24 (so that the last bin starts at about 4
+            seconds)
+    """
+    __slots__ = ("window", "n_bins", "ring", "ring_bins", "pos", "histogram", "count", "total_ns")
+
+    def __init__(self, window: int, n_bins: int=24):
+        self.window = window
+        self.n_bins = n_bins
+        self.ring = [0] * window
+        self.ring_bins = [-1] * window
+        self.pos = 0
+        self.histogram = [0] * n_bins
+        self.count = 0
+        self.total_ns = 0
+
+    def add(self, duration_ns: int) -> None:
+        pos = self.pos
+        b = self.ring_bins[pos]
+        if b >= 0:
+            self.histogram[b] -= 1
+        b = min((duration_ns // 1000).bit_length(), self.n_bins - 1)
+        self.histogram[b] += 1
+        self.ring[pos] = duration_ns
+        self.ring_bins[pos] = b
+        self.pos = pos + 1 if pos + 1 < self.window else 0
+        self.count += 1
+        self.total_ns += duration_ns
+        return
+
+    def samples(self) -> np.ndarray:
+        """
+        Gives the durations in the window in nanoseconds, oldest first.
+        """
+        arr = np.array(self.ring, dtype=np.int64)
+        if self.count < self.window:
+            return arr[:self.count]
+        return np.roll(arr, -self.pos)
+
+    def binEdgesUs(self) -> List[int]:
+        """
+        Gives the lower edge in microseconds of each histogram bin.
+        """
+        return [0] + [1 << (k - 1) for k in range(1, self.n_bins)]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Gives statistics of the durations, with the keys "count" and
+        "mean_ms" (over all the durations recorded) and "p50_ms",
+        "p95_ms" and "max_ms" (over the durations in the window, or
+        None if there are none).
+        """
+        res = {"count": self.count,\
+                "mean_ms": self.total_ns / self.count / 1e6 if self.count else None}
+        arr = self.samples()
+        if arr.size:
+            p50, p95 = np.percentile(arr, (50, 95)) / 1e6
+            res.update({"p50_ms": float(p50), "p95_ms": float(p95), "max_ms": int(arr.max()) / 1e6})
+        else:
+            res.update({"p50_ms": None, "p95_ms": None, "max_ms": None})
+        return res
+
+class FrameProfiler:
+    """
+    Lightweight profiler of the phases of the game loop (e.g. input
+    polling, the bot, moving the snake, drawing and updating the
+    display), timed with time.perf_counter_ns() and kept in rolling
+    windows (see PhaseTimings), together with the intervals between
+    frames from which the frame rate is found.
+
+    Each phase is timed by calling start() before it and stop() with
+    the phase name and the value returned by start() after it. While
+    the profiler is disabled, start() returns 0 without reading the
+    clock and stop() returns immediately, so the instrumentation
+    costs only two method calls per phase.
+
+    Args:
+        phases (iterable of strs): the names of the phases
+        window (int), optional: the number of most recent durations
+            of each phase used for the percentiles and histograms.
+            Default: 512
+        enabled (bool), optional: whether the profiler starts enabled.
+            Default: False
+    """
+    def __init__(self, phases: Iterable[str], window: int=512, enabled: bool=False):
+        self.phases = tuple(phases)
+        self.window = window
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self) -> None:
+        self.timings = {phase: PhaseTimings(self.window) for phase in self.phases}
+        self.frame_timings = PhaseTimings(self.window)
+        self._prev_frame_ns = None
+        return
+
+    def setEnabled(self, enabled: bool) -> None:
+        self.enabled = enabled
+        # The interval spanning the time spent disabled is not counted
+        self._prev_frame_ns = None
+        return
+
+    def start(self) -> int:
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def stop(self, phase: str, t0: int) -> None:
+        if not t0: return
+        self.timings[phase].add(time.perf_counter_ns() - t0)
+        return
+
+    def add(self, phase: str, duration_ns: int) -> None:
+        """
+        Records a duration of the phase timed elsewhere (e.g. on
+        another thread) rather than with start() and stop(), unless
+        the profiler is disabled.
+        """
+        if not self.enabled: return
+        self.timings[phase].add(duration_ns)
+        return
+
+    def frame(self) -> None:
+        """
+        Records that a frame has been displayed, for finding the frame
+        rate.
+        """
+        if not self.enabled: return
+        t = time.perf_counter_ns()
+        if self._prev_frame_ns is not None:
+            self.frame_timings.add(t - self._prev_frame_ns)
+        self._prev_frame_ns = t
+        return
+
+    def fps(self) -> Optional[float]:
+        """
+        Gives the mean frame rate over the frames in the window, or
+        None if fewer than two frames have been recorded.
+        """
+        arr = self.frame_timings.samples()
+        if not arr.size: return None
+        return 1e9 * arr.size / int(arr.sum())
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Gives the frame rate and the statistics of each phase (see
+        PhaseTimings.summary()), with the key "fps" and the key
+        "phases" mapping to a dictionary of the statistics of each
+        phase.
+        """
+        return {"fps": self.fps(),\
+                "phases": {phase: t.summary() for phase, t in self.timings.items()}}
+
+    def export(self, path: str) -> None:
+        """
+        Writes the summary (see summary()), along with the histogram
+        of each phase and of the frame intervals, to the file at path
+        as JSON.
+        """
+        res = self.summary()
+        res["window"] = self.window
+        res["histogram_bin_edges_us"] = self.frame_timings.binEdgesUs()
+        res["frame_interval_histogram"] = list(self.frame_timings.histogram)
+        for phase, t in self.timings.items():
+            res["phases"][phase]["histogram"] = list(t.histogram)
+        with open(path, "w") as f:
+            json.dump(res, f, indent=1)
+        return
@@ -0,0 +1,190 @@
+# library/src/anguis/regions.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Hashable
+
+from collections import deque
+
+from anguis.arena import Arena
+from anguis.engine import cell_body
+
+class RegionEvaluator:
+    """
+    For a given position of the snake, finds for each possible next
+    position of the head the regions of unoccupied cells that the head
+    could then move into, the number of cells in each region and which
+    of them are adjacent to the end of the tail (as given by
+    TailChaserBot.moveGroups() after that move is made), for all of the
+    possible next positions at once.
+
+    This is done with a single depth first search of the regions of
+    unoccupied cells adjacent to the head and the end of the tail,
+    finding the articulation points of those regions (Tarjan's
+    algorithm) and so, for every unoccupied cell, the sizes of the
+    regions that its removal would split its region into (i.e. the
+    block-cut tree of each region). Moving the head into a cell
+    removes that cell from its region, and (unless a fruit is eaten)
+    adds the cell vacated by the end of the tail, which may join some
+    of the resulting regions together.
+
+    Requires the snake to consist of at least 3 cells.
+
+    Args:
+        arena (Arena): the arena
+        grid (bytearray): the state of each cell (see GameState.grid)
+        snake_qu (deque of ints): the flattened positions occupied by
+            the snake, in order from the end of the tail to the head
+    """
+    def __init__(self, arena: Arena, grid: bytearray, snake_qu: deque):
+        self.arena = arena
+        self.grid = grid
+        self.head = snake_qu[-1]
+        self.tail_ends = (snake_qu[0], snake_qu[1])
+        length = arena.length
+        # Preorder number (starting at 1, with 0 meaning not visited),
+        # lowest preorder number reachable by a back edge from the
+        # subtree, size of subtree and region of each cell
+        self.disc = [0] * length
+        self.low = [0] * length
+        self.sub = [0] * length
+        self.region = [0] * length
+        self.region_sizes = []
+        # For each possible next position of the head, the children
+        # in the search tree whose subtrees are separated from the
+        # rest of the region when that position is removed
+        self.separated = {}
+        self._time = 0
+
+        neighbours = arena.neighbours
+        cands = [idx for idx in neighbours[self.head] if grid[idx] < cell_body]
+        for idx in cands:
+            self.separated[idx] = []
+        for idx in cands + [idx for idx in neighbours[self.tail_ends[0]] if grid[idx] < cell_body]:
+            if not self.disc[idx]:
+                self._search(idx)
+
+    def _search(self, root: int) -> None:
+        # Iterative version of Tarjan's articulation point algorithm
+        # over the region containing root
+        neighbours = self.arena.neighbours
+        grid = self.grid
+        disc, low, sub, region = self.disc, self.low, self.sub, self.region
+        separated = self.separated
+        region_idx = len(self.region_sizes)
+        t = self._time + 1
+        t0 = t
+        disc[root] = low[root] = t
+        region[root] = region_idx
+        stack = [[root, -1, neighbours[root], 0]]
+        while stack:
+            frame = stack[-1]
+            v, parent, nbrs, i = frame
+            if i < len(nbrs):
+                frame[3] = i + 1
+                w = nbrs[i]
+                if grid[w] >= cell_body: continue
+                if not disc[w]:
+                    t += 1
+                    disc[w] = low[w] = t
+                    region[w] = region_idx
+                    stack.append([w, v, neighbours[w], 0])
+                elif w != parent and disc[w] < low[v]:
+                    low[v] = disc[w]
+                continue
+            stack.pop()
+            # The cells in the subtree of v are exactly those whose
+            # preorder numbers are between those of v and t inclusive
+            sub[v] = t - disc[v] + 1
+            if not stack: break
+            u = stack[-1][0]
+            if low[v] < low[u]: low[u] = low[v]
+            if low[v] >= disc[u] and u in separated.keys():
+                separated[u].append(v)
+        self.region_sizes.append(t - t0 + 1)
+        self._time = t
+        return
+
+    def _piece(self, idx: int, removed: int) -> Tuple[Hashable, int]:
+        # The label and size of the region containing the unoccupied
+        # cell idx once the unoccupied cell removed (or -1 for none)
+        # has been removed
+        disc = self.disc
+        d = disc[idx]
+        if not d:
+            return (("u", idx), 0)
+        region_idx = self.region[idx]
+        if removed < 0 or self.region[removed] != region_idx or not disc[removed]:
+            return (("r", region_idx), self.region_sizes[region_idx])
+        sep = self.separated[removed]
+        sub = self.sub
+        for c in sep:
+            if disc[c] <= d < disc[c] + sub[c]:
+                return (("s", c), sub[c])
+        return (("x", removed), self.region_sizes[region_idx] - 1 - sum(sub[c] for c in sep))
+
+    def moveGroups(self, idx: int, hit_fruit: bool) -> Tuple[Dict[int, Hashable], Dict[Hashable, int], Set[Hashable]]:
+        """
+        Finds the regions of unoccupied cells adjacent to the head
+        after the head moves to idx.
+
+        Args:
+            idx (int): the flattened position the head moves to, which
+                must be unoccupied or the end of the tail
+            hit_fruit (bool): whether there is a fruit at idx
+
+        Returns:
+        3-tuple whose index 0 is a dictionary mapping each unoccupied
+        cell adjacent to the head after the move (and the end of the
+        tail, if adjacent) to a label for its region, index 1 is a
+        dictionary giving the number of unoccupied cells in each of
+        those regions and index 2 is the set of labels of those
+        regions that are adjacent to the end of the tail (in the same
+        form as TailChaserBot.moveGroups()).
+        """
+        grid = self.grid
+        neighbours = self.arena.neighbours
+        tail0, tail1 = self.tail_ends
+        if hit_fruit:
+            tail1, freed = tail0, -1
+        else:
+            freed = tail0 if idx != tail0 else -1
+        removed = idx if grid[idx] < cell_body else -1
+
+        # The cell vacated by the end of the tail joins all of the
+        # regions adjacent to it
+        merged = {}
+        if freed >= 0:
+            for idx2 in neighbours[freed]:
+                if idx2 == idx or grid[idx2] >= cell_body: continue
+                lab, sz = self._piece(idx2, removed)
+                merged[lab] = sz
+        merged_size = sum(merged.values()) + 1
+
+        def label(idx2: int) -> Tuple[Hashable, int]:
+            if idx2 == freed:
+                return ("m", merged_size)
+            res = self._piece(idx2, removed)
+            return ("m", merged_size) if res[0] in merged.keys() else res
+
+        def isFree(idx2: int) -> bool:
+            return idx2 != idx and (idx2 == freed or grid[idx2] < cell_body)
+
+        group_rep_dict = {}
+        group_size_dict = {}
+        tail_connected = set()
+        for idx2 in neighbours[idx]:
+            if idx2 == self.head: continue
+            if idx2 == tail1:
+                lab = ("t", idx2)
+                group_rep_dict[idx2] = lab
+                group_size_dict[lab] = 0
+                tail_connected.add(lab)
+                continue
+            if not isFree(idx2): continue
+            lab, sz = label(idx2)
+            group_rep_dict[idx2] = lab
+            group_size_dict[lab] = sz
+        tail_labels = {label(idx2)[0] for idx2 in neighbours[tail1] if isFree(idx2)}
+        tail_connected.update(tail_labels.intersection(group_size_dict.keys()))
+        return (group_rep_dict, group_size_dict, tail_connected)
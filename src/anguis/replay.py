@@ -0,0 +1,457 @@
+# library/src/anguis/replay.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Generator, BinaryIO
+
+import bisect
+import struct
+
+from anguis.engine import GameState, moves, move_codes
+
+# File layout
+#
+# A replay file consists of a header, followed by a sequence of
+# records, followed (once the replay has been closed) by a trailer.
+#
+# The header records the settings of the game (see _header_fmt),
+# followed by the seed, as a one byte type code (see _seed_types), a 4
+# byte length and that many bytes encoding the seed (see
+# encodeSeed()), so that any seed accepted by random.Random can be
+# recorded.
+#
+# Each record is a one byte tag and a 4 byte payload length followed by
+# the payload. The record types are:
+#  - keyframe (b"K"): the number of moves made so far and a snapshot of
+#    the game state (see GameState.getSnapshot()) after those moves,
+#    including the state of the random number generator and the order
+#    of the pool of empty cells (whose number is not stored, being the
+#    number of cells not occupied by the snake or a fruit)
+#  - moves (b"M"): a number of moves followed by the move codes (see
+#    anguis.engine.moves) of that many moves, packed four to a byte
+#    starting from the least significant bits
+#  - end (b"E"): the total number of moves in the replay
+#  - index (b"I"): the number of moves made and the offset in the file
+#    of every keyframe record
+# A keyframe is written at the start and then after every
+# keyframe_interval moves, so the state after any move can be found by
+# restoring the last preceding keyframe and applying fewer than
+# keyframe_interval moves.
+#
+# The trailer gives the offset of the index record, so a reader can
+# jump straight to the index. If the trailer is missing (for instance
+# if the replay is still being written), the reader instead finds the
+# keyframes by scanning the records.
+#
+# All integers are little-endian.
+
+_magic = b"ANGR"
+_trailer_magic = b"ANGI"
+_version = 3
+_header_fmt = "<4sBHHHHbbHI"
+_header_size = struct.calcsize(_header_fmt)
+_seed_fmt = "<BI"
+_seed_size = struct.calcsize(_seed_fmt)
+# The type code of each type of seed
+_seed_types = {type(None): 0, int: 1, float: 2, str: 3, bytes: 4}
+_record_fmt = "<cI"
+_record_size = struct.calcsize(_record_fmt)
+_trailer_fmt = "<Q4s"
+_trailer_size = struct.calcsize(_trailer_fmt)
+_snapshot_fmt = "<IIbbIB"
+_snapshot_size = struct.calcsize(_snapshot_fmt)
+
+class ReplayFormatError(Exception):
+    """
+    Raised when a file being read as a replay is not a valid replay
+    """
+    pass
+
+def _positionTypecode(arena_shape: Tuple[int, int]) -> str:
+    return "H" if arena_shape[0] * arena_shape[1] <= (1 << 16) else "I"
+
+def encodeSeed(seed: Optional[Union[int, float, str, bytes, bytearray]]) -> bytes:
+    """
+    Converts a seed of the random number generator of a game (anything
+    accepted by random.Random, or None) into bytes, consisting of a
+    type code, the length of the encoded seed and the encoded seed.
+
+    Raises:
+        ValueError: if the seed is not None, an int, a float, a str
+            or a bytes-like object
+    """
+    if isinstance(seed, bytearray):
+        seed = bytes(seed)
+    # bool is a subclass of int, which random.Random treats as such
+    typ = int if isinstance(seed, int) else type(seed)
+    if typ not in _seed_types:
+        raise ValueError(f"Seeds of type {type(seed).__name__} cannot be recorded in a replay")
+    if seed is None:
+        b = b""
+    elif typ is int:
+        b = int(seed).to_bytes((int(seed).bit_length() + 8) // 8, "little", signed=True)
+    elif typ is float:
+        b = struct.pack("<d", seed)
+    elif typ is str:
+        b = seed.encode("utf-8", "surrogatepass")
+    else: b = seed
+    return struct.pack(_seed_fmt, _seed_types[typ], len(b)) + b
+
+def decodeSeed(code: int, b: bytes) -> Optional[Union[int, float, str, bytes]]:
+    """
+    Converts the type code and the encoded seed written by
+    encodeSeed() back into the seed.
+
+    Raises:
+        ReplayFormatError: if the type code is not recognised
+    """
+    if code == _seed_types[type(None)]: return None
+    if code == _seed_types[int]: return int.from_bytes(b, "little", signed=True)
+    if code == _seed_types[float]: return struct.unpack("<d", b)[0]
+    if code == _seed_types[str]: return b.decode("utf-8", "surrogatepass")
+    if code == _seed_types[bytes]: return bytes(b)
+    raise ReplayFormatError(f"Unrecognised seed type {code}")
+
+def encodeSnapshot(snapshot: Tuple[Any], arena_shape: Tuple[int, int]) -> bytes:
+    """
+    Converts a game state snapshot (as created by
+    GameState.getSnapshot()) into bytes.
+    """
+    snake, fruits, head_direct, score, alive, rng_state, free_cells = snapshot
+    tc = _positionTypecode(arena_shape)
+    rng_version, rng_internal, rng_gauss = rng_state
+    return b"".join([
+        struct.pack(_snapshot_fmt, len(snake), len(fruits),\
+                head_direct[0], head_direct[1], score, alive),
+        struct.pack(f"<{len(snake)}{tc}", *snake),
+        struct.pack(f"<{len(fruits)}{tc}", *fruits),
+        struct.pack(f"<{len(free_cells)}{tc}", *free_cells),
+        struct.pack(f"<BI", rng_version, len(rng_internal)),
+        struct.pack(f"<{len(rng_internal)}I", *rng_internal),
+        struct.pack("<Bd", rng_gauss is not None,\
+                0. if rng_gauss is None else rng_gauss),
+    ])
+
+def decodeSnapshot(b: bytes, arena_shape: Tuple[int, int]) -> Tuple[Any]:
+    """
+    Converts bytes created by encodeSnapshot() back into a game state
+    snapshot.
+    """
+    n_snake, n_fruits, d0, d1, score, alive =\
+            struct.unpack_from(_snapshot_fmt, b, 0)
+    offset = _snapshot_size
+    tc = _positionTypecode(arena_shape)
+    snake = struct.unpack_from(f"<{n_snake}{tc}", b, offset)
+    offset += struct.calcsize(f"<{n_snake}{tc}")
+    fruits = struct.unpack_from(f"<{n_fruits}{tc}", b, offset)
+    offset += struct.calcsize(f"<{n_fruits}{tc}")
+    n_free = arena_shape[0] * arena_shape[1] - n_snake - n_fruits
+    free_cells = struct.unpack_from(f"<{n_free}{tc}", b, offset)
+    offset += struct.calcsize(f"<{n_free}{tc}")
+    rng_version, n_rng = struct.unpack_from("<BI", b, offset)
+    offset += struct.calcsize("<BI")
+    rng_internal = struct.unpack_from(f"<{n_rng}I", b, offset)
+    offset += struct.calcsize(f"<{n_rng}I")
+    has_gauss, rng_gauss = struct.unpack_from("<Bd", b, offset)
+    rng_state = (rng_version, rng_internal, rng_gauss if has_gauss else None)
+    return (snake, fruits, (d0, d1), score, bool(alive), rng_state, free_cells)
+
+class ReplayWriter:
+    """
+    Writes a replay of a game to a binary file as the game is played.
+
+    The game should be started (or reset) before the writer is
+    created, and record() called with each move immediately after the
+    move has been made with GameState.step() or GameState.move().
+    Moves are buffered and written out at the latest at each keyframe,
+    or whenever flush() is called.
+
+    Args:
+        f (binary file object): the file to which the replay is written
+        state (GameState): the game being recorded
+        keyframe_interval (int), optional: the number of moves between
+            successive keyframes. Default: 4096
+
+    Raises:
+        ValueError: if the seed of the game is not of a type that can
+            be recorded (see encodeSeed())
+    """
+    def __init__(self, f: BinaryIO, state: GameState, keyframe_interval: int=4096):
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be a positive integer")
+        self.f = f
+        self.state = state
+        self.keyframe_interval = keyframe_interval
+        self.n_moves = 0
+        self.keyframes = []
+        self._move_buffer = []
+        self._offset = 0
+        self.closed = False
+
+        # Encoded first, so that a seed that cannot be recorded is
+        # rejected before anything is written
+        seed_bytes = encodeSeed(state.seed)
+        self._write(struct.pack(_header_fmt, _magic, _version,\
+                *state.arena_shape, *state.head_init_pos,\
+                *state.head_init_direct, state.n_fruit,\
+                keyframe_interval) + seed_bytes)
+        self._writeKeyframe()
+
+    def __enter__(self) -> ReplayWriter:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+        return
+
+    def _write(self, b: bytes) -> None:
+        self.f.write(b)
+        self._offset += len(b)
+        return
+
+    def _writeRecord(self, tag: bytes, payload: bytes) -> None:
+        self._write(struct.pack(_record_fmt, tag, len(payload)) + payload)
+        return
+
+    def _writeKeyframe(self) -> None:
+        self.keyframes.append((self.n_moves, self._offset))
+        self._writeRecord(b"K", struct.pack("<Q", self.n_moves) +\
+                encodeSnapshot(self.state.getSnapshot(), self.state.arena_shape))
+        return
+
+    def record(self, mv: Tuple[int]) -> None:
+        """
+        Records a move that has just been made. A move with step 0
+        only leaves the game state unchanged while the snake consists
+        of a single cell, in which case it is not recorded. Otherwise,
+        it moves the head into its own cell, ending the game, which
+        cannot be represented in the replay.
+
+        Args:
+            mv (2-tuple of ints): the move made
+
+        Raises:
+            ValueError: if mv has step 0 and the snake is longer than
+                one cell
+        """
+        if not mv[1]:
+            if len(self.state.snake_qu) > 1:
+                raise ValueError("A move with step 0 cannot be recorded "
+                        "when the snake is longer than one cell")
+            return
+        self._move_buffer.append(move_codes[tuple(mv)])
+        self.n_moves += 1
+        if not self.n_moves % self.keyframe_interval:
+            self.flush()
+            self._writeKeyframe()
+        return
+
+    def flush(self) -> None:
+        """
+        Writes any buffered moves to the file.
+        """
+        buf = self._move_buffer
+        if buf:
+            packed = bytearray((len(buf) + 3) >> 2)
+            for i, code in enumerate(buf):
+                packed[i >> 2] |= code << ((i & 3) << 1)
+            self._writeRecord(b"M", struct.pack("<I", len(buf)) + bytes(packed))
+            self._move_buffer = []
+        self.f.flush()
+        return
+
+    def close(self) -> None:
+        """
+        Writes any buffered moves, a final keyframe and the index of
+        keyframes, completing the replay. Does not close the file.
+        """
+        if self.closed: return
+        self.flush()
+        if self.keyframes[-1][0] != self.n_moves:
+            self._writeKeyframe()
+        self._writeRecord(b"E", struct.pack("<Q", self.n_moves))
+        index_offset = self._offset
+        self._writeRecord(b"I", struct.pack(f"<I", len(self.keyframes)) +\
+                b"".join(struct.pack("<QQ", *x) for x in self.keyframes))
+        self._write(struct.pack(_trailer_fmt, index_offset, _trailer_magic))
+        self.f.flush()
+        self.closed = True
+        return
+
+class ReplayReader:
+    """
+    Reads a replay written by ReplayWriter, allowing the game state
+    after any move to be found without replaying the game from the
+    start.
+
+    Args:
+        f (binary file object): the file containing the replay, which
+            must be seekable
+
+    Attributes:
+        arena_shape (2-tuple of ints): the dimensions of the arena
+        head_init_pos (2-tuple of ints): the initial position of the
+            head
+        head_init_direct (2-tuple of ints): the initial direction of
+            the head
+        n_fruit (int): the number of fruits present at any one time
+        seed (int, float, str, bytes or None): the seed of the game
+        keyframe_interval (int): the number of moves between keyframes
+        n_moves (int): the number of moves in the replay
+        keyframes (list of 2-tuples of ints): the number of moves made
+            and the file offset of each keyframe, in order
+    """
+    def __init__(self, f: BinaryIO):
+        self.f = f
+        f.seek(0)
+        header = f.read(_header_size)
+        if len(header) < _header_size:
+            raise ReplayFormatError("File too short to be a replay")
+        magic, version, s0, s1, h0, h1, d0, d1, n_fruit,\
+                keyframe_interval = struct.unpack(_header_fmt, header)
+        if magic != _magic:
+            raise ReplayFormatError("File is not a replay")
+        if version != _version:
+            raise ReplayFormatError(f"Unsupported replay version {version}")
+        b = f.read(_seed_size)
+        if len(b) < _seed_size:
+            raise ReplayFormatError("File too short to be a replay")
+        seed_code, seed_len = struct.unpack(_seed_fmt, b)
+        b = f.read(seed_len)
+        if len(b) < seed_len:
+            raise ReplayFormatError("File too short to be a replay")
+        # The offset of the first record
+        self._records_offset = _header_size + _seed_size + seed_len
+        self.arena_shape = (s0, s1)
+        self.head_init_pos = (h0, h1)
+        self.head_init_direct = (d0, d1)
+        self.n_fruit = n_fruit
+        self.seed = decodeSeed(seed_code, b)
+        self.keyframe_interval = keyframe_interval
+        if not self._loadIndex():
+            self._scanIndex()
+
+    def _readRecord(self) -> Optional[Tuple[bytes, bytes]]:
+        b = self.f.read(_record_size)
+        if len(b) < _record_size: return None
+        tag, length = struct.unpack(_record_fmt, b)
+        payload = self.f.read(length)
+        if len(payload) < length: return None
+        return tag, payload
+
+    def _loadIndex(self) -> bool:
+        f = self.f
+        end = f.seek(0, 2)
+        if end < self._records_offset + _trailer_size: return False
+        f.seek(end - _trailer_size)
+        index_offset, magic = struct.unpack(_trailer_fmt, f.read(_trailer_size))
+        if magic != _trailer_magic: return False
+        f.seek(index_offset)
+        rec = self._readRecord()
+        if rec is None or rec[0] != b"I": return False
+        payload = rec[1]
+        n = struct.unpack_from("<I", payload, 0)[0]
+        flat = struct.unpack_from(f"<{2 * n}Q", payload, 4)
+        self.keyframes = list(zip(flat[::2], flat[1::2]))
+        self.n_moves = self.keyframes[-1][0]
+        return True
+
+    def _scanIndex(self) -> None:
+        f = self.f
+        f.seek(self._records_offset)
+        self.keyframes = []
+        n_moves = 0
+        while True:
+            offset = f.tell()
+            rec = self._readRecord()
+            if rec is None: break
+            tag, payload = rec
+            if tag == b"K":
+                self.keyframes.append((struct.unpack_from("<Q", payload, 0)[0], offset))
+            elif tag == b"M":
+                n_moves += struct.unpack_from("<I", payload, 0)[0]
+            elif tag == b"E":
+                break
+        if not self.keyframes:
+            raise ReplayFormatError("Replay contains no keyframes")
+        self.n_moves = n_moves
+        return
+
+    def _keyframeBefore(self, move_idx: int) -> Tuple[int, int]:
+        if not 0 <= move_idx <= self.n_moves:
+            raise IndexError(f"Move index {move_idx} outside the range "
+                    f"0 to {self.n_moves} of the replay")
+        i = bisect.bisect_right(self.keyframes, (move_idx, float("inf"))) - 1
+        return self.keyframes[i]
+
+    def _moveCodesFrom(self, offset: int) -> Generator[int, None, None]:
+        # Yields the move codes of all moves after the keyframe at the
+        # given offset
+        f = self.f
+        f.seek(offset)
+        self._readRecord()
+        while True:
+            rec = self._readRecord()
+            if rec is None: return
+            tag, payload = rec
+            if tag in {b"E", b"I"}: return
+            if tag != b"M": continue
+            n = struct.unpack_from("<I", payload, 0)[0]
+            pos = f.tell()
+            for i in range(n):
+                yield (payload[4 + (i >> 2)] >> ((i & 3) << 1)) & 3
+            # The consumer may have moved the file position while this
+            # generator was suspended
+            f.seek(pos)
+        return
+
+    def newGameState(self) -> GameState:
+        """
+        Creates a game state with the settings of the replayed game,
+        in its initial state.
+        """
+        return GameState(self.arena_shape, head_init_pos=self.head_init_pos,\
+                head_init_direct=self.head_init_direct,\
+                n_fruit=self.n_fruit, seed=self.seed)
+
+    def stateAt(self, move_idx: int, state: Optional[GameState]=None) -> GameState:
+        """
+        Finds the state of the game after move_idx moves, by restoring
+        the last keyframe at or before that move and applying the
+        remaining moves.
+
+        Args:
+            move_idx (int): the number of moves made, between 0 and
+                n_moves inclusive
+            state (GameState), optional: if given, this game state is
+                updated and returned rather than creating a new one.
+                Should have the same settings as the replayed game.
+
+        Returns:
+        GameState object giving the state of the game after move_idx
+        moves.
+        """
+        k_idx, offset = self._keyframeBefore(move_idx)
+        self.f.seek(offset)
+        payload = self._readRecord()[1]
+        if state is None:
+            state = self.newGameState()
+        state.restoreSnapshot(decodeSnapshot(payload[8:], self.arena_shape))
+        for _, code in zip(range(move_idx - k_idx), self._moveCodesFrom(offset)):
+            state.step(moves[code])
+        return state
+
+    def moves(self, start: int=0, stop: Optional[int]=None) -> Generator[Tuple[int], None, None]:
+        """
+        Generator yielding the moves of the replay with indices from
+        start (inclusive) to stop (exclusive).
+        """
+        if stop is None or stop > self.n_moves:
+            stop = self.n_moves
+        if start >= stop: return
+        k_idx, offset = self._keyframeBefore(start)
+        for i, code in enumerate(self._moveCodesFrom(offset), start=k_idx):
+            if i >= stop: break
+            if i >= start:
+                yield moves[code]
+        return
@@ -0,0 +1,331 @@
+# library/src/anguis/sim.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Generator, TextIO
+
+import argparse
+import concurrent.futures
+import csv
+import json
+import os
+import random
+import sys
+import time
+
+from anguis.engine import GameState
+from anguis.bots import TailChaserBot, HamiltonianCycleBot, SafePathBot
+from anguis.replay import ReplayWriter
+
+# The bots that may play the games, by name
+bot_classes = {
+    "tail-chaser": TailChaserBot,
+    "hamiltonian": HamiltonianCycleBot,
+    "safe-path": SafePathBot,
+}
+
+result_fields = ("game", "seed", "score", "moves", "wall_time", "mean_search_depth", "outcome")
+
+def playBotGame(
+    arena_shape: Tuple[int, int],
+    n_fruit: int=1,
+    search_depth: int=4,
+    seed: Optional[int]=None,
+    max_moves: Optional[int]=None,
+    replay_path: Optional[str]=None,
+    time_budget_ms: Optional[float]=None,
+    bot: str="tail-chaser",
+    max_seconds: Optional[float]=None,
+    move_times: Optional[List[float]]=None,
+) -> Dict[str, Any]:
+    """
+    Plays a single headless game of Anguis with a bot (by default
+    TailChaserBot) choosing every move. The fruit placement and the bot's choices
+    between equally good moves use separate random number generators
+    derived from seed, so a game is fully determined by its seed.
+
+    Args:
+        arena_shape (2-tuple of ints): the dimensions of the arena
+        n_fruit (int), optional: the number of fruits present at any
+            one time. Default: 1
+        search_depth (int), optional: the search depth used by the
+            bot. Default: 4
+        seed (int), optional: the seed for the random number
+            generation. If not given or given as None, the game is
+            not reproducible.
+        max_moves (int), optional: the number of moves after which
+            the game is abandoned. If not given or given as None, is
+            taken to be 100 times the number of positions in the arena.
+        replay_path (str), optional: if given, a replay of the game is
+            written to the file with this path (see
+            anguis.replay.ReplayWriter)
+        time_budget_ms (float), optional: if given, the bot searches
+            iteratively deeper up to the search depth for at most this
+            many milliseconds per move (see
+            TailChaserBot.findMoveIterativeDeepening()), so the moves
+            chosen depend on the speed of the machine
+        bot (str), optional: the name of the bot (one of the keys of
+            bot_classes). Default: "tail-chaser"
+        max_seconds (float), optional: if given, the number of seconds
+            after which the game is abandoned
+        move_times (list), optional: if given, the time in seconds
+            taken by the bot to choose each move is appended to this
+            list
+
+    Returns:
+    Dictionary with the keys "seed", "score", "moves", "wall_time"
+    (in seconds), "mean_search_depth" (the mean over the moves of the
+    depth to which the bot searched) and "outcome", where outcome is
+    "won" if the snake
+    filled the arena, "died" if the snake collided with a wall or its
+    tail and "timeout" if the game was abandoned.
+    """
+    if max_moves is None:
+        max_moves = 100 * arena_shape[0] * arena_shape[1]
+    t0 = time.perf_counter()
+    deadline = None if max_seconds is None else t0 + max_seconds
+    state = GameState(arena_shape, head_init_direct=(0, 0),\
+            n_fruit=n_fruit, seed=seed)
+    bot = bot_classes[bot](
+        arena_shape,
+        state.head_pos_flat,
+        head_direct=state.head_direct,
+        fruits=set(state.fruits),
+        snake_qu=state.snake_qu,
+        grid=state.grid,
+        rng=random.Random(None if seed is None else f"bot:{seed}"),
+    )
+    replay_file = None if replay_path is None else open(replay_path, "wb")
+    replay = None if replay_file is None else ReplayWriter(replay_file, state)
+    add_fruit = None
+    outcome = "timeout"
+    n_moves = 0
+    depth_sum = 0
+    try:
+        while n_moves < max_moves:
+            t1 = time.perf_counter()
+            if deadline is not None and t1 >= deadline: break
+            mv = bot.addFruitFindMoveAndUpdate(add_fruit=add_fruit,\
+                    search_depth=search_depth, time_budget_ms=time_budget_ms)
+            if move_times is not None:
+                move_times.append(time.perf_counter() - t1)
+            alive, hit_fruit, fruit_inds = state.step(mv)
+            n_moves += 1
+            depth_sum += bot.last_search_depth
+            if replay is not None:
+                replay.record(mv)
+            if not alive:
+                outcome = "won" if hit_fruit else "died"
+                break
+            add_fruit = fruit_inds[0] if fruit_inds else None
+    finally:
+        if replay_file is not None:
+            replay.close()
+            replay_file.close()
+    return {
+        "seed": seed,
+        "score": state.score,
+        "moves": n_moves,
+        "wall_time": time.perf_counter() - t0,
+        "mean_search_depth": depth_sum / max(n_moves, 1),
+        "outcome": outcome,
+    }
+
+class RunningAggregates:
+    """
+    Summary statistics of a stream of game results, kept in constant
+    memory regardless of the number of games.
+    """
+    def __init__(self):
+        self.n_games = 0
+        self.outcome_counts = {}
+        self.sums = {"score": 0, "moves": 0, "wall_time": 0., "mean_search_depth": 0.}
+        self.mins = {}
+        self.maxs = {}
+
+    def add(self, result: Dict[str, Any]) -> None:
+        self.n_games += 1
+        outcome = result["outcome"]
+        self.outcome_counts[outcome] = self.outcome_counts.get(outcome, 0) + 1
+        for k in self.sums.keys():
+            v = result[k]
+            self.sums[k] += v
+            self.mins[k] = min(self.mins.get(k, v), v)
+            self.maxs[k] = max(self.maxs.get(k, v), v)
+        return
+
+    def summary(self) -> Dict[str, Any]:
+        n = max(self.n_games, 1)
+        return {
+            "games": self.n_games,
+            "outcomes": dict(self.outcome_counts),
+            "mean": {k: v / n for k, v in self.sums.items()},
+            "min": dict(self.mins),
+            "max": dict(self.maxs),
+        }
+
+class ResultWriter:
+    """
+    Writes game results to a file one line at a time, either in JSON
+    lines or CSV format.
+    """
+    def __init__(self, f: TextIO, fmt: str="jsonl"):
+        self.f = f
+        self.fmt = fmt
+        if fmt == "csv":
+            self._csv_writer = csv.DictWriter(f, fieldnames=result_fields)
+            self._csv_writer.writeheader()
+        elif fmt != "jsonl":
+            raise ValueError(f"Unrecognised output format {fmt}")
+
+    def write(self, result: Dict[str, Any]) -> None:
+        if self.fmt == "csv":
+            self._csv_writer.writerow(result)
+        else:
+            self.f.write(json.dumps(result) + "\n")
+        return
+
+def _playBotGameTask(game: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {"game": game, **playBotGame(**kwargs)}
+
+def runBotGames(
+    n_games: int,
+    arena_shape: Tuple[int, int],
+    n_fruit: int=1,
+    search_depth: int=4,
+    base_seed: int=0,
+    max_moves: Optional[int]=None,
+    n_workers: Optional[int]=None,
+    replay_dir: Optional[str]=None,
+    result_func: Optional[Callable[[Dict[str, Any]], None]]=None,
+    time_budget_ms: Optional[float]=None,
+    bot: str="tail-chaser",
+) -> RunningAggregates:
+    """
+    Plays n_games games with a bot across a pool of
+    processes, with game i using the seed base_seed + i. The number of
+    games submitted to the pool at any one time is bounded, so memory
+    usage does not grow with n_games.
+
+    Args:
+        n_games (int): the number of games to play
+        arena_shape (2-tuple of ints): the dimensions of the arena
+        n_fruit (int), optional: the number of fruits present at any
+            one time. Default: 1
+        search_depth (int), optional: the search depth used by the
+            bot. Default: 4
+        base_seed (int), optional: the seed of the first game.
+            Default: 0
+        max_moves (int), optional: the number of moves after which
+            each game is abandoned (see playBotGame())
+        n_workers (int), optional: the number of worker processes. If
+            not given or given as None, uses the number of CPUs.
+        replay_dir (str), optional: if given, a replay of game i is
+            written to the file game_i.anguis in this directory
+        result_func (callable), optional: if given, called with the
+            result of each game (see playBotGame(), with the extra key
+            "game" giving the game number) as it completes
+        time_budget_ms (float), optional: if given, the time budget
+            for each move of the bot (see playBotGame())
+        bot (str), optional: the name of the bot (see playBotGame()).
+            Default: "tail-chaser"
+
+    Returns:
+    RunningAggregates object summarising the results of all the games.
+    """
+    aggregates = RunningAggregates()
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    max_in_flight = 4 * n_workers
+    game_iter = iter(range(n_games))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        pending = set()
+        while True:
+            for game in game_iter:
+                kwargs = {
+                    "arena_shape": arena_shape,
+                    "n_fruit": n_fruit,
+                    "search_depth": search_depth,
+                    "seed": base_seed + game,
+                    "max_moves": max_moves,
+                    "replay_path": None if replay_dir is None else\
+                            os.path.join(replay_dir, f"game_{game}.anguis"),
+                    "time_budget_ms": time_budget_ms,
+                    "bot": bot,
+                }
+                pending.add(executor.submit(_playBotGameTask, game, kwargs))
+                if len(pending) >= max_in_flight: break
+            if not pending: break
+            done, pending = concurrent.futures.wait(pending,\
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                res = future.result()
+                aggregates.add(res)
+                if result_func is not None:
+                    result_func(res)
+    return aggregates
+
+def main(argv: Optional[List[str]]=None) -> None:
+    parser = argparse.ArgumentParser(prog="anguis-sim",\
+            description="Plays games of Anguis with the bot without a "
+            "display, writing the result of each game to a file.")
+    parser.add_argument("-n", "--games", type=int, default=100,\
+            help="number of games to play (default: 100)")
+    parser.add_argument("--shape", type=int, nargs=2, default=(10, 10),\
+            metavar=("WIDTH", "HEIGHT"), help="arena shape (default: 10 10)")
+    parser.add_argument("--fruits", type=int, default=1,\
+            help="number of fruits (default: 1)")
+    parser.add_argument("--bot", choices=tuple(bot_classes.keys()),\
+            default="tail-chaser", help="bot playing the games (default: "
+            "tail-chaser)")
+    parser.add_argument("--depth", type=int, default=4,\
+            help="bot search depth (default: 4)")
+    parser.add_argument("--time-budget-ms", type=float, default=None,\
+            help="if given, the bot deepens its search iteratively up to "
+            "the search depth for at most this many milliseconds per move "
+            "(default: always search to the full depth)")
+    parser.add_argument("--seed", type=int, default=0,\
+            help="seed of the first game, with game i using seed + i "
+            "(default: 0)")
+    parser.add_argument("--max-moves", type=int, default=None,\
+            help="moves after which a game is abandoned (default: 100 "
+            "times the arena area)")
+    parser.add_argument("-j", "--workers", type=int, default=None,\
+            help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--replay-dir", default=None,\
+            help="directory in which to write a replay of each game "
+            "(default: no replays)")
+    parser.add_argument("-o", "--output", default="-",\
+            help="output file, or - for stdout (default: -)")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default=None,\
+            help="output format (default: inferred from the output file "
+            "extension, otherwise jsonl)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt is None:
+        fmt = "csv" if args.output.endswith(".csv") else "jsonl"
+    f = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        writer = ResultWriter(f, fmt=fmt)
+        aggregates = runBotGames(
+            args.games,
+            tuple(args.shape),
+            n_fruit=args.fruits,
+            search_depth=args.depth,
+            base_seed=args.seed,
+            max_moves=args.max_moves,
+            n_workers=args.workers,
+            replay_dir=args.replay_dir,
+            result_func=writer.write,
+            time_budget_ms=args.time_budget_ms,
+            bot=args.bot,
+        )
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    print(json.dumps(aggregates.summary()), file=sys.stderr)
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# library/src/anguis/transposition.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any, Iterable
+
+import numpy as np
+
+from anguis.arena import Arena
+
+class ZobristHasher:
+    """
+    Zobrist hashing of positions in the bot search, where a position
+    is given by the set of cells occupied by the snake, the cells of
+    the head and of the last two sections of the tail and the cells
+    of the fruits (which together determine the moves available and
+    the regions those moves lead to).
+
+    Each position is hashed once for each symmetry of the arena (see
+    Arena.symmetries), with the smallest of these being used as the
+    key of the position, so that positions that are reflections or
+    rotations of each other share a key. The 64-bit hashes for the
+    different symmetries are packed into a single Python int (with
+    the hash for symmetry s in bits 64 * s to 64 * s + 63), so that
+    all of them are updated by a single XOR. The hash of the cells
+    occupied by the snake is maintained incrementally with toggle().
+
+    Args:
+        arena (Arena): the arena
+        seed (int), optional: the seed used to generate the random
+            keys. Default: 0
+    """
+    n_features = 5
+    snake_feature, head_feature, tail0_feature, tail1_feature, fruit_feature = range(5)
+
+    def __init__(self, arena: Arena, seed: int=0):
+        self.arena = arena
+        self.symmetries = arena.symmetries
+        self.inverse_symmetries = np.argsort(self.symmetries, axis=1)
+        self.n_symmetries = len(self.symmetries)
+        rng = np.random.default_rng(seed)
+        self.keys = rng.integers(0, 2 ** 64, size=(self.n_features, arena.length),\
+                dtype=np.uint64, endpoint=False)
+        # For each feature and cell, the keys of the images of that
+        # cell under each symmetry, packed into a single int
+        self.cell_keys = tuple(tuple(self._pack(row) for row in\
+                self.keys[f][self.symmetries].T.tolist()) for f in range(self.n_features))
+        # The symmetries and their inverses as tuples, for mapping
+        # single cells quickly
+        self.symmetry_tuples = tuple(map(tuple, self.symmetries.tolist()))
+        self.inverse_tuples = tuple(map(tuple, self.inverse_symmetries.tolist()))
+        self._shifts = tuple(range(0, 64 * self.n_symmetries, 64))
+
+    @staticmethod
+    def _pack(hashes: Iterable[int]) -> int:
+        res = 0
+        for i, h in enumerate(hashes):
+            res |= h << (64 * i)
+        return res
+
+    def hashCells(self, cells: Iterable[int], feature: int=0) -> int:
+        """
+        Finds the hashes under each symmetry of a set of cells for
+        the given feature (by default, the cells occupied by the
+        snake).
+
+        Args:
+            cells (iterable of ints): the flattened positions of the
+                cells
+            feature (int), optional: the feature. Default: 0 (the
+                cells occupied by the snake)
+
+        Returns:
+        Int giving the packed hashes under each symmetry.
+        """
+        cells = np.fromiter(cells, dtype=np.intp)
+        if not cells.size:
+            return 0
+        images = self.symmetries[:, cells]
+        return self._pack(np.bitwise_xor.reduce(self.keys[feature][images], axis=1).tolist())
+
+    def toggle(self, hashes: int, idx: int) -> int:
+        """
+        Gives the packed hashes of the cells occupied by the snake
+        after the cell idx is added to or removed from the snake.
+        """
+        return hashes ^ self.cell_keys[0][idx]
+
+    def positionKey(self, snake_hashes: int, head: int, tail0: int, tail1: int, fruits: Iterable[int]) -> Tuple[int, int]:
+        """
+        Finds the key of a position.
+
+        Args:
+            snake_hashes (int): the packed hashes of the cells
+                occupied by the snake under each symmetry
+            head (int): the flattened position of the head
+            tail0 (int): the flattened position of the end of the tail
+            tail1 (int): the flattened position of the tail section
+                next to the end of the tail
+            fruits (iterable of ints): the flattened positions of the
+                fruits
+
+        Returns:
+        2-tuple whose index 0 is the key of the position and index 1
+        the index of the symmetry mapping the position to the one from
+        which the key was calculated.
+        """
+        keys = self.cell_keys
+        h = snake_hashes ^ keys[1][head] ^ keys[2][tail0] ^ keys[3][tail1]
+        fruit_keys = keys[4]
+        for idx in fruits:
+            h ^= fruit_keys[idx]
+        mask = 0xFFFFFFFFFFFFFFFF
+        hashes = [(h >> shift) & mask for shift in self._shifts]
+        key = min(hashes)
+        return key, hashes.index(key)
+
+class TranspositionTable:
+    """
+    Table of fixed size storing a value for each of a number of keys
+    (e.g. positions hashed by ZobristHasher), where each key has a
+    single slot in the table determined by its low bits, and storing a
+    value replaces any value of another key in the same slot.
+
+    Args:
+        size_log2 (int), optional: the base 2 logarithm of the number
+            of slots. Default: 15
+    """
+    def __init__(self, size_log2: int=15):
+        self.size = 1 << size_log2
+        self.mask = self.size - 1
+        self.clear()
+
+    def clear(self) -> None:
+        self.keys = [None] * self.size
+        self.values = [None] * self.size
+        self.n_hits = 0
+        self.n_misses = 0
+        return
+
+    def get(self, key: int) -> Any:
+        """
+        Gives the value stored for key, or None if there is none.
+        """
+        i = key & self.mask
+        if self.keys[i] == key:
+            self.n_hits += 1
+            return self.values[i]
+        self.n_misses += 1
+        return None
+
+    def put(self, key: int, value: Any) -> None:
+        """
+        Stores value for key, replacing any value in the same slot.
+        """
+        i = key & self.mask
+        self.keys[i] = key
+        self.values[i] = value
+        return
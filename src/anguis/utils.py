@@ -1,8 +1,14 @@
 # library/src/anguis/utils.py
 
+import bisect
+import itertools
 import math
 import random
 
+import numpy as np
+
+from array import array
+
 from sortedcontainers import SortedSet
 
 from collections.abc import Iterable
@@ -10,40 +16,317 @@ from typing import Dict, List, Set, Tuple, Optional, Union, Hashable,\
         Generator, Any, Callable
 
 class UnionFind:
+    """
+    Union-find (disjoint set) structure over the integers 0 to (n - 1)
+    inclusive, backed by arrays, tracking the size of each set.
+
+    Uses union by rank without path compression, so that find() takes
+    O(log n) time (iteratively) and each union changes only a fixed
+    number of entries, allowing the unions made since a checkpoint
+    (see checkpoint()) to be undone with rollback(), e.g. when
+    backtracking in a search.
+
+    Args:
+        n (int): the number of elements
+    """
     def __init__(self, n: int):
         self.n = n
-        self.root = list(range(n))
-        self.rank = [1] * n
-        #self.group_sizes = {idx: 1 for idx in range(n)}
+        self.root = array("l", range(n))
+        self.rank = array("b", bytes(n))
+        self.sizes = array("l", [1]) * n
+        self.n_groups = n
+        # The roots attached to another root by each union, together
+        # with whether the rank of the other root was incremented
+        self.history = []
     
     def find(self, v: int) -> int:
-        r = self.root[v]
-        if r == v: return v
-        res = self.find(r)
-        self.root[v] = res
-        return res
+        root = self.root
+        r = root[v]
+        while r != v:
+            v = r
+            r = root[v]
+        return v
     
-    def union(self, v1: int, v2: int) -> None:
-        r1, r2 = list(map(self.find, (v1, v2)))
-        if r1 == r2: return
-        d = self.rank[r1] - self.rank[r2]
+    def union(self, v1: int, v2: int) -> bool:
+        """
+        Merges the sets containing v1 and v2.
+
+        Returns:
+        Boolean giving whether v1 and v2 were in different sets.
+        """
+        r1, r2 = self.find(v1), self.find(v2)
+        if r1 == r2: return False
+        rank = self.rank
+        d = rank[r1] - rank[r2]
         if d < 0: r1, r2 = r2, r1
-        elif not d: self.rank[r1] += 1
+        elif not d: rank[r1] += 1
         self.root[r2] = r1
-        #self.group_sizes[r1] += self.group_sizes.pop(r2)
+        self.sizes[r1] += self.sizes[r2]
+        self.n_groups -= 1
+        self.history.append((r2, not d))
+        return True
+    
+    def groupSize(self, v: int) -> int:
+        """
+        Gives the number of elements in the set containing v.
+        """
+        return self.sizes[self.find(v)]
+    
+    def checkpoint(self) -> int:
+        """
+        Gives a checkpoint which may be passed to rollback() to undo
+        the unions made after this call.
+        """
+        return len(self.history)
+    
+    def rollback(self, checkpoint: int=0) -> None:
+        """
+        Undoes the unions made since the given checkpoint (see
+        checkpoint()), by default undoing all unions.
+        """
+        history, root, rank, sizes = self.history, self.root, self.rank, self.sizes
+        while len(history) > checkpoint:
+            r2, rank_incremented = history.pop()
+            r1 = root[r2]
+            root[r2] = r2
+            sizes[r1] -= sizes[r2]
+            if rank_incremented: rank[r1] -= 1
+            self.n_groups += 1
         return
 
 ### Random k-tuples from first n natural numbers functions ###
 ### and generators                                         ###
 
+class BinomialTable:
+    """
+    Cache of the binomial coefficients C(m, j) for 0 <= m <= n_max and
+    0 <= j <= k_max, held as the columns of Pascal's triangle (so that
+    column j is a nondecreasing list that may be bisected to find the
+    largest m for which C(m, j) does not exceed a given value). The
+    table is grown as larger coefficients are requested, with the
+    number of rows at least doubling each time it grows, as long as
+    the number of coefficients held does not exceed max_entries and
+    an upper bound on the memory they take up does not exceed
+    max_bytes. The coefficients are Python ints which may be large,
+    so the memory bound is usually the tighter one. The memory is
+    released by clear().
+
+    Args:
+        max_entries (int), optional: the maximum number of
+                coefficients held. Default: 2 ** 16
+        max_bytes (int), optional: the maximum number of bytes the
+                coefficients (and the lists holding them) may take
+                up. Default: 2 ** 22 (4 MiB)
+    """
+    def __init__(self, max_entries: int=1 << 16, max_bytes: int=1 << 22):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clear()
+    
+    def clear(self) -> None:
+        """
+        Removes all the coefficients held.
+        """
+        self.n_max = -1
+        self.columns = []
+        return
+    
+    @staticmethod
+    def _intBytes(n_bits: int) -> int:
+        # Upper bound on the size in bytes of a Python int with n_bits
+        # bits (held in 30-bit digits), including the pointer to it
+        return 32 + 4 * max(1, -(-n_bits // 30))
+    
+    def fits(self, n_max: int, k_max: int) -> bool:
+        """
+        Gives whether a table holding C(m, j) for 0 <= m <= n_max and
+        0 <= j <= k_max is within both max_entries and max_bytes.
+        """
+        if (n_max + 1) * (k_max + 1) > self.max_entries: return False
+        # Every entry of column j is at most C(n_max, j)
+        n_bytes = 0
+        for j in range(k_max + 1):
+            n_bytes += (n_max + 1) * self._intBytes(math.comb(n_max, j).bit_length())
+            if n_bytes > self.max_bytes: return False
+        return True
+    
+    def reserve(self, n_max: int, k_max: int) -> bool:
+        """
+        Grows the table if needed so that it holds C(m, j) for
+        0 <= m <= n_max and 0 <= j <= k_max, unless this would take
+        it over the maximum number of entries or bytes.
+
+        Returns:
+        Boolean giving whether the table holds these coefficients.
+        """
+        n_max = max(n_max, 0)
+        k_max2 = max(k_max, len(self.columns) - 1)
+        if n_max <= self.n_max:
+            if k_max2 < len(self.columns): return True
+            n_max2 = self.n_max
+        else:
+            n_max2 = max(n_max, 2 * self.n_max)
+            if not self.fits(n_max2, k_max2):
+                n_max2 = n_max
+        if not self.fits(n_max2, k_max2):
+            return False
+        if n_max2 > self.n_max:
+            self.columns = [[1] * (n_max2 + 1)]
+            self.n_max = n_max2
+        while len(self.columns) <= k_max2:
+            # By the hockey stick identity, C(m, j) is the sum of
+            # C(r, j - 1) for 0 <= r < m
+            prev = self.columns[-1]
+            self.columns.append([0, *itertools.accumulate(prev[:-1])])
+        return True
+    
+    def comb(self, m: int, j: int) -> int:
+        """
+        Gives the binomial coefficient C(m, j), from the table if it
+        is held and otherwise calculated with math.comb().
+        """
+        if 0 <= j < len(self.columns) and 0 <= m <= self.n_max:
+            return self.columns[j][m]
+        return math.comb(m, j)
+
+# Shared by the unranking functions unless they are given their own
+# table. Its memory is bounded (see BinomialTable), and may be
+# released with binomial_table.clear()
+binomial_table = BinomialTable()
+
+class FenwickTree:
+    """
+    Fenwick (binary indexed) tree of non-negative integer counts at
+    the positions 0 to (n - 1) inclusive, supporting updates of the
+    counts, prefix sums and finding the position of the k:th unit
+    (e.g. the k:th smallest of a set of integers whose members have
+    count 1), each in O(log n) time.
+
+    Args:
+        n (int): the number of positions
+        counts (iterable of ints), optional: the initial counts at
+                each position. If not given, all counts are 0.
+    """
+    def __init__(self, n: int, counts: Optional[Iterable[int]]=None):
+        self.n = n
+        self.tree = [0] * (n + 1)
+        self.top_bit = 1 << (n.bit_length() - 1) if n else 0
+        if counts is None: return
+        tree = self.tree
+        for i, c in enumerate(counts, start=1):
+            tree[i] += c
+            j = i + (i & -i)
+            if j <= n: tree[j] += tree[i]
+    
+    def add(self, idx: int, delta: int) -> None:
+        tree = self.tree
+        i = idx + 1
+        while i <= self.n:
+            tree[i] += delta
+            i += i & -i
+        return
+    
+    def prefixSum(self, idx: int) -> int:
+        """
+        Gives the sum of the counts at the positions 0 to (idx - 1)
+        inclusive.
+        """
+        tree = self.tree
+        res = 0
+        while idx > 0:
+            res += tree[idx]
+            idx &= idx - 1
+        return res
+    
+    def findKth(self, k: int) -> int:
+        """
+        Gives the smallest position idx for which the sum of the
+        counts at positions 0 to idx inclusive exceeds k (where k
+        starts at 0), or n if there is no such position.
+        """
+        tree = self.tree
+        pos = 0
+        step = self.top_bit
+        while step:
+            nxt = pos + step
+            if nxt <= self.n and tree[nxt] <= k:
+                pos = nxt
+                k -= tree[nxt]
+            step >>= 1
+        return pos
+
 def countFunctionNondecreasing(n: int, k: int) -> int:
     return math.comb(n + k - 1, k)
     
 def countFunctionIncreasing(n: int, k: int) -> int:
     return math.comb(n, k)
 
+def _largestCombAtMost(j: int, t: int, hi: int) -> int:
+    # The largest m between t - 1 and hi inclusive for which
+    # C(m, t) <= j, found by galloping down from hi followed by binary
+    # search (so with O(log(hi - m)) calculations of binomials)
+    if math.comb(hi, t) <= j: return hi
+    step = 1
+    while True:
+        lo = hi - step
+        if lo <= t - 1:
+            lo = t - 1
+            break
+        if math.comb(lo, t) <= j: break
+        hi = lo
+        step <<= 1
+    while hi - lo > 1:
+        mid = (lo + hi) >> 1
+        if math.comb(mid, t) <= j: lo = mid
+        else: hi = mid
+    return lo
+
+def _unrankIncreasing(i: int, n: int, k: int,\
+        table: Optional[BinomialTable]=None) -> List[int]:
+    # The lexicographically i:th (starting at 0) increasing k-tuple of
+    # integers from 0 to (n - 1), found iteratively from the
+    # combinatorial number system representation
+    # C(c_k, k) + ... + C(c_1, 1) (with c_k > ... > c_1 >= 0) of the
+    # reverse rank C(n, k) - 1 - i, whose terms give the elements
+    # (n - 1 - c_k, ..., n - 1 - c_1)
+    if table is None: table = binomial_table
+    j = math.comb(n, k) - 1 - i
+    res = []
+    if not k: return res
+    if table.reserve(n - 1, k):
+        columns = table.columns
+        for t in range(k, 0, -1):
+            col = columns[t]
+            c = bisect.bisect_right(col, j, 0, n) - 1
+            j -= col[c]
+            res.append(n - 1 - c)
+        return res
+    if n <= 64 * (k + 1):
+        # Scans down c once, updating C(c, t) by the ratios between
+        # neighbouring binomials (so with O(n) operations in total)
+        c = n - 1
+        val = math.comb(c, k)
+        for t in range(k, 0, -1):
+            while val > j:
+                val = val * (c - t) // c
+                c -= 1
+            j -= val
+            res.append(n - 1 - c)
+            if t > 1:
+                # C(c - 1, t - 1) from C(c, t)
+                val = val * t // c
+                c -= 1
+        return res
+    c = n
+    for t in range(k, 0, -1):
+        c = _largestCombAtMost(j, t, c - 1)
+        j -= math.comb(c, t)
+        res.append(n - 1 - c)
+    return res
+
 def getIthNondecreasingKTuple(i: int, n: int, k: int,\
-        allow_repeats: bool) -> Tuple[int]:
+        allow_repeats: bool, table: Optional[BinomialTable]=None)\
+        -> Tuple[int]:
     
     count_func = countFunctionNondecreasing if allow_repeats else\
             countFunctionIncreasing
@@ -54,27 +337,13 @@ def getIthNondecreasingKTuple(i: int, n: int, k: int,\
                 "of i was outside the valid range for the "\
                 "given n and k.")
     
-    res = []
-    def recur(i: int, n: int, k: int, prev: int) -> None:
-        if not k: return
-        tot = count_func(n, k)
-        target = tot - i
-        lft, rgt = 0, n - 1
-        while lft < rgt:
-            mid = lft - ((lft - rgt) >> 1)
-            #if tot - countFunction(n - mid, k) <= i:
-            if count_func(n - mid, k) >= target:
-                lft = mid
-            else: rgt = mid - 1
-        num = prev + lft
-        res.append(num)
-        lft2 = lft + (not allow_repeats)
-        recur(count_func(n - lft, k) - target, n - lft2, k - 1,\
-                num + (not allow_repeats))
-        return
-    
-    recur(i, n, k, 0)
-    return tuple(res)
+    if not allow_repeats:
+        return tuple(_unrankIncreasing(i, n, k, table=table))
+    # The nondecreasing k-tuples of integers from 0 to (n - 1)
+    # correspond in order to the increasing k-tuples of integers from
+    # 0 to (n + k - 2), by adding j to the element at index j
+    res = _unrankIncreasing(i, n + k - 1, k, table=table)
+    return tuple(num - j for j, num in enumerate(res))
 
 def getIthSet(i: int, n: int, k: int) -> Set[int]:
     if k > n:
@@ -89,54 +358,30 @@ def getIthMultiset(i: int, n: int, k: int) -> Dict[int, int]:
         res[num] = res.get(num, 0) + 1
     return res
 
+def _sortedIndices(inds: Iterable, inds_sorted: bool, tot: int)\
+        -> Generator[int, None, None]:
+    # The indices in increasing order, stopping at the first that is
+    # not less than tot
+    if not inds_sorted:
+        inds = sorted(inds)
+    for ind in inds:
+        if ind >= tot: return
+        yield ind
+    return
+
 def numberedNondecreasingKTupleGenerator(inds: Iterable, n: int,\
         k: int, allow_repeats: bool, inds_sorted: bool=False)\
         -> Generator[Tuple[int], None, None]:
-    if not inds_sorted:
-        inds = sorted(inds)
-    m = len(inds)
-    
     count_func = countFunctionNondecreasing if allow_repeats else\
             countFunctionIncreasing
+    tot = count_func(n, k)
     
-    inds_iter = iter(inds)
-    
-    ind_pair = [-1, next(inds_iter, float("inf"))]
-    if not isinstance(ind_pair[1], int): return
-    curr = []
-    def recur(delta: int, n: int, k: int, prev: int)\
-            -> Generator[Tuple[int], None, None]:
-        if not k:
-            yield_next = True
-            res = tuple(curr)
-            while yield_next:
-                yield res
-                ind_pair[0], ind_pair[1] =\
-                        ind_pair[1], next(inds_iter, float("inf"))
-                yield_next = (ind_pair[0] == ind_pair[1])
-            return
-        tot = count_func(n, k)
-        tot2 = tot + delta
-        lft = 0
-        curr.append(0)
-        while ind_pair[1] < tot2:
-            target = tot2 - ind_pair[1]
-            rgt = n - 1
-            while lft < rgt:
-                mid = lft - ((lft - rgt) >> 1)
-                if count_func(n - mid, k) >= target:
-                    lft = mid
-                else: rgt = mid - 1
-            num = prev + lft
-            curr[-1] = num
-            lft2 = lft + (not allow_repeats)
-            yield from recur(delta + tot - count_func(n - lft, k),\
-                    n - lft2, k - 1, num + (not allow_repeats))
-            lft += 1
-        curr.pop()
-        return
-    
-    yield from recur(0, n, k, 0)
+    prev_ind = None
+    for ind in _sortedIndices(inds, inds_sorted, tot):
+        if ind != prev_ind:
+            res = getIthNondecreasingKTuple(ind, n, k, allow_repeats)
+            prev_ind = ind
+        yield res
     return
 
 def countFunctionAll(n: int, k: int) -> int:
@@ -148,17 +393,63 @@ def countFunctionDistinct(n: int, k: int) -> int:
 def findKthMissing(lst: SortedSet, k: int) -> int:
     # k starts at 0
     # Assumes lst contains only non-negative integers
-    if not lst or k >= lst[-1]: return k + len(lst)
-    
-    def countLT(num: int) -> int:
-        return num - lst.bisect_left(num)
-    
-    lft, rgt = k, k + len(lst)
-    while lft < rgt:
-        mid = lft - ((lft - rgt) >> 1)
-        if countLT(mid) <= k: lft = mid
-        else: rgt = mid - 1
-    return lft
+    # The number of members of lst less than the answer is the number
+    # of indices j for which lst[j] - j (the number of missing
+    # integers less than lst[j], which is nondecreasing in j) is at
+    # most k
+    return k + bisect.bisect_right(range(len(lst)), k,\
+            key=lambda j: lst[j] - j)
+
+def _kTupleDigits(i: int, n: int, k: int, allow_repeats: bool)\
+        -> List[int]:
+    # The digits of the lexicographically i:th k-tuple of integers
+    # from 0 to (n - 1), where for distinct integers digit j gives the
+    # position of element j among the integers not among the
+    # elements before it
+    if allow_repeats:
+        res = [0] * k
+        for j in reversed(range(k)):
+            i, res[j] = divmod(i, n)
+        return res
+    # The place values P(n - j - 1, k - j - 1), found from the last
+    # (which is 1) backwards
+    place_vals = [1] * k
+    for j in reversed(range(k - 1)):
+        place_vals[j] = place_vals[j + 1] * (n - j - 1)
+    res = []
+    for val in place_vals:
+        d, i = divmod(i, val)
+        res.append(d)
+    return res
+
+def _distinctFromDigits(digits: List[int],\
+        fenwick: Optional[FenwickTree]=None) -> List[int]:
+    # The distinct integers whose digits are given (see
+    # _kTupleDigits()), using fenwick (holding count 1 at each
+    # integer not yet used, which is restored on return) if given and
+    # otherwise a sorted list of the integers used
+    res = []
+    if fenwick is not None:
+        for d in digits:
+            num = fenwick.findKth(d)
+            fenwick.add(num, -1)
+            res.append(num)
+        for num in res:
+            fenwick.add(num, 1)
+        return res
+    used = []
+    for d in digits:
+        num = d + bisect.bisect_right(range(len(used)), d,\
+                key=lambda j: used[j] - j)
+        bisect.insort(used, num)
+        res.append(num)
+    return res
+
+def _useFenwick(n: int, k: int, n_tuples: int) -> bool:
+    # Whether to find distinct k-tuples with a Fenwick tree over all n
+    # integers, whose construction is only worthwhile if n is not
+    # much larger than the total number of elements found
+    return n <= max(8 * k * n_tuples, 64) and n <= 1 << 24
 
 def getIthKTuple(i: int, n: int, k: int,\
         allow_repeats: bool) -> Tuple[int]:
@@ -171,104 +462,303 @@ def getIthKTuple(i: int, n: int, k: int,\
                 "getIthKTuple(), the given value  of i was outside "\
                 "the valid range for the given n and k.")
     
-    count_func = countFunctionAll if allow_repeats else\
-            countFunctionDistinct
-    
+    digits = _kTupleDigits(i, n, k, allow_repeats)
     if allow_repeats:
-        res = []
-        for j in range(k):
-            ans, i = divmod(i, count_func(n, k - j - 1))
-            res.append(ans)
-        return tuple(res)
-    seen = SortedSet()
-    res = []
-    for j in range(k):
-        ans, i = divmod(i, count_func(n - j - 1, k - j - 1))
-        ans = findKthMissing(seen, ans)
-        res.append(ans)
-        seen.add(ans)
-    return tuple(res)
+        return tuple(digits)
+    fenwick = FenwickTree(n, [1] * n) if _useFenwick(n, k, 1) else None
+    return tuple(_distinctFromDigits(digits, fenwick=fenwick))
 
 def numberedKTupleGenerator(inds: Iterable, n: int,\
         k: int, allow_repeats: bool, inds_sorted: bool=False)\
         -> Generator[Tuple[int], None, None]:
     if not inds_sorted:
         inds = sorted(inds)
-    m = len(inds)
-    
     count_func = countFunctionAll if allow_repeats else\
             countFunctionDistinct
+    tot = count_func(n, k)
     
-    def numProcessorAll(num: int) -> int:
-        return num
-    
-    def numProcessorDistinct(num: int) -> int:
-        num = findKthMissing(seen, num)
-        seen.add(num)
-        return num
-    
-    def seenProcessorAll(num: int) -> None:
-        return
-    
-    def seenProcessorDistinct(num: int) -> None:
-        seen.remove(num)
-        return
-    
-    if allow_repeats:
-        num_processor = numProcessorAll
-        seen_processor = seenProcessorAll
-    else:
-        num_processor = numProcessorDistinct
-        seen_processor = seenProcessorDistinct
-        seen = SortedSet()
-    
-    inds_iter = iter(inds)
-    
-    ind_pair = [-1, next(inds_iter, float("inf"))]
-    if not isinstance(ind_pair[1], int): return
-    curr = []
-    def recur(delta: int, n: int, k: int)\
-            -> Generator[Tuple[int], None, None]:
-        if not k:
-            yield_next = True
-            res = tuple(curr)
-            while yield_next:
-                yield res
-                ind_pair[0], ind_pair[1] =\
-                        ind_pair[1], next(inds_iter, float("inf"))
-                yield_next = (ind_pair[0] == ind_pair[1])
-            return
-        n2 = n - (not allow_repeats)
-        tot = count_func(n, k)
-        tot2 = tot + delta
-        lft = 0
-        curr.append(0)
-        div = count_func(n2, k - 1)
-        while ind_pair[1] < tot2:
-            
-            q = (ind_pair[1] - delta) // div
-            curr[-1] = num_processor(q)
-            yield from recur(delta + q * div, n2, k - 1)
-            seen_processor(curr[-1]) 
-        curr.pop()
-        return
+    fenwick = None
+    if not allow_repeats and _useFenwick(n, k, len(inds)):
+        fenwick = FenwickTree(n, [1] * n)
     
-    yield from recur(0, n, k)
+    prev_ind = None
+    for ind in _sortedIndices(inds, True, tot):
+        if ind != prev_ind:
+            digits = _kTupleDigits(ind, n, k, allow_repeats)
+            res = tuple(digits) if allow_repeats else\
+                    tuple(_distinctFromDigits(digits, fenwick=fenwick))
+            prev_ind = ind
+        yield res
     return
 
-def randomSampleWithoutReplacement(n: int, k: int) -> List[int]:
+def _cappedBinomialColumns(n: int, k: int, cap: int)\
+        -> List[np.ndarray]:
+    # The columns 0 to k of Pascal's triangle for rows 0 to n as numpy
+    # int64 arrays, with entries exceeding cap (which must be less than
+    # 2 ** 61) replaced by cap. Each column is the cumulative sum of the
+    # previous one, found exactly up to the point where an estimate of
+    # the sum in floating point reaches 2 ** 62 (beyond which the exact
+    # sums certainly exceed cap)
+    col = np.ones(n + 1, dtype=np.int64)
+    res = [np.minimum(col, cap)]
+    for _ in range(k):
+        approx = np.cumsum(res[-1][:-1], dtype=np.float64)
+        end = int(np.searchsorted(approx, float(1 << 62)))
+        col = np.full(n + 1, cap, dtype=np.int64)
+        col[0] = 0
+        col[1:end + 1] = np.minimum(np.cumsum(res[-1][:end]), cap)
+        res.append(col)
+    return res
+
+def unrankMany(inds: Iterable[int], n: int, k: int,\
+        allow_repeats: bool, nondecreasing: bool) -> np.ndarray:
+    """
+    Finds the k-tuples of integers from 0 to (n - 1) inclusive with
+    the given indices in lexicographic order (as given individually
+    by getIthNondecreasingKTuple() and getIthKTuple()), vectorised
+    over the indices with numpy where the number of k-tuples is less
+    than 2 ** 61 (so that the indices fit in int64), and otherwise
+    unranking each index in turn.
+
+    Args:
+        inds (iterable of ints): the indices, each between 0 and one
+                less than the number of k-tuples inclusive
+        n (int): the number of integers from which the elements of
+                the k-tuples are chosen
+        k (int): the length of the k-tuples
+        allow_repeats (bool): whether the k-tuples may contain
+                repeated elements
+        nondecreasing (bool): whether the k-tuples are restricted to
+                those whose elements are in nondecreasing order
+
+    Returns:
+    2D numpy int64 array whose rows are the k-tuples, in the order of
+    inds.
+    """
+    if nondecreasing:
+        count_func = countFunctionNondecreasing if allow_repeats else\
+                countFunctionIncreasing
+    else:
+        count_func = countFunctionAll if allow_repeats else\
+                countFunctionDistinct
+    inds = list(inds)
+    tot = count_func(n, k)
+    if any(i < 0 or i >= tot for i in inds):
+        raise ValueError("In the function unrankMany(), an index "\
+                "was outside the valid range for the given n and k.")
+    res = np.zeros((len(inds), k), dtype=np.int64)
+    if not inds or not k: return res
+    if tot >= 1 << 61:
+        if nondecreasing:
+            rows = numberedNondecreasingKTupleGenerator(inds, n, k,\
+                    allow_repeats, inds_sorted=True)
+        else:
+            rows = numberedKTupleGenerator(inds, n, k, allow_repeats,\
+                    inds_sorted=True)
+        for j, row in enumerate(rows):
+            res[j] = row
+        return res
+    i_arr = np.array(inds, dtype=np.int64)
+    if nondecreasing:
+        # As for _unrankIncreasing(), with each term of the
+        # combinatorial number system found for all the indices at
+        # once by searching the columns of Pascal's triangle
+        n2 = n + k - 1 if allow_repeats else n
+        columns = _cappedBinomialColumns(n2 - 1, k, tot)
+        j_arr = (tot - 1) - i_arr
+        for t in range(k, 0, -1):
+            col = columns[t]
+            c = np.searchsorted(col, j_arr, side="right") - 1
+            j_arr -= col[c]
+            res[:, k - t] = (n2 - 1) - c
+        if allow_repeats:
+            res -= np.arange(k, dtype=np.int64)
+        return res
+    if allow_repeats:
+        for j in reversed(range(k)):
+            i_arr, res[:, j] = np.divmod(i_arr, n)
+        return res
+    place_val = 1
+    place_vals = [1] * k
+    for j in reversed(range(k - 1)):
+        place_val *= n - j - 1
+        place_vals[j] = place_val
+    used = np.empty((len(inds), 0), dtype=np.int64)
+    for j, val in enumerate(place_vals):
+        d, i_arr = np.divmod(i_arr, val)
+        # As for _distinctFromDigits(), with the number of used
+        # integers less than the answer found by counting
+        num = d + (used - np.arange(j) <= d[:, np.newaxis]).sum(axis=1)
+        res[:, j] = num
+        used = np.sort(res[:, :j + 1], axis=1)
+    return res
+
+def randomSampleWithoutReplacement(n: int, k: int,\
+        rng: Optional[random.Random]=None) -> List[int]:
+    if rng is None: rng = random
     seen = SortedSet()
     res = []
     for i in range(k):
-        num = findKthMissing(seen, random.randrange(0, n - i))
+        num = findKthMissing(seen, rng.randrange(0, n - i))
         res.append(num)
         seen.add(num)
     return res
 
+def _floydSample(n: int, k: int, rng: random.Random) -> Set[int]:
+    # Floyd's algorithm, giving a uniformly random k-subset of
+    # range(n) with k draws and set insertions (so in O(k) expected
+    # time regardless of n, which may exceed the range of numpy ints)
+    res = set()
+    for j in range(n - k, n):
+        t = rng.randrange(j + 1)
+        res.add(j if t in res else t)
+    return res
+
+def randomKSubset(n: int, k: int,\
+        rng: Optional[random.Random]=None) -> List[int]:
+    """
+    Gives a uniformly random subset of size k of the integers 0 to
+    (n - 1) inclusive, using Floyd's algorithm (so in O(k log k) time
+    including the sorting, independent of n).
+
+    Args:
+        n (int): the number of integers from which the subset is
+                chosen
+        k (int): the size of the subset, between 0 and n inclusive
+        rng (random.Random), optional: the random number generator.
+                If not given or given as None, uses the random module
+
+    Returns:
+    List of ints giving the elements of the subset in increasing
+    order.
+    """
+    if rng is None: rng = random
+    if not 0 <= k <= n:
+        raise ValueError(f"Cannot choose {k} distinct integers from {n}")
+    return sorted(_floydSample(n, k, rng))
+
+def randomDistinctIntegers(n: int, k: int,\
+        rng: Optional[random.Random]=None) -> List[int]:
+    """
+    Gives k distinct integers chosen uniformly at random from 0 to
+    (n - 1) inclusive, in uniformly random order (with the same
+    distribution as randomSampleWithoutReplacement() but in O(k) time
+    using Floyd's algorithm followed by a shuffle).
+
+    Args:
+        n (int): the number of integers from which the integers are
+                chosen
+        k (int): the number of integers chosen, between 0 and n
+                inclusive
+        rng (random.Random), optional: the random number generator.
+                If not given or given as None, uses the random module
+
+    Returns:
+    List of ints giving the chosen integers in the order chosen.
+    """
+    if rng is None: rng = random
+    if not 0 <= k <= n:
+        raise ValueError(f"Cannot choose {k} distinct integers from {n}")
+    res = list(_floydSample(n, k, rng))
+    rng.shuffle(res)
+    return res
+
+def randomDistinctIntegersMany(n: int, k: int, n_samples: int,\
+        rng: Optional[np.random.Generator]=None, sort: bool=False)\
+        -> np.ndarray:
+    """
+    Draws n_samples independent samples, each of k distinct integers
+    chosen uniformly at random from 0 to (n - 1) inclusive, using
+    vectorised numpy draws.
+
+    When k ** 2 does not exceed 2 * n, each sample is drawn as k
+    independent integers, with the samples containing a repeated
+    integer redrawn (which, as at least a proportion of about
+    exp(-1) of the samples are accepted, takes O(n_samples * k log k)
+    expected time), and otherwise by taking the k smallest of n
+    random keys for each sample (in O(n_samples * n) time, in chunks
+    of samples so that no more than about 2 ** 22 keys are held at
+    once).
+
+    Args:
+        n (int): the number of integers from which each sample is
+                chosen, less than 2 ** 63
+        k (int): the number of integers in each sample, between 0
+                and n inclusive
+        n_samples (int): the number of samples
+        rng (numpy.random.Generator), optional: the random number
+                generator. If not given or given as None, uses
+                numpy.random.default_rng()
+        sort (bool), optional: if True, the integers in each sample
+                are given in increasing order (so that each sample is
+                a k-subset), otherwise in uniformly random order.
+                Default: False
+
+    Returns:
+    2D numpy int64 array of shape (n_samples, k) whose rows are the
+    samples.
+    """
+    if rng is None: rng = np.random.default_rng()
+    if not 0 <= k <= n:
+        raise ValueError(f"Cannot choose {k} distinct integers from {n}")
+    if not k or not n_samples:
+        return np.empty((n_samples, k), dtype=np.int64)
+    if k * k <= 2 * n:
+        res = rng.integers(0, n, size=(n_samples, k), dtype=np.int64)
+        redraw = np.arange(n_samples)
+        while True:
+            # Conditioned on its integers being distinct, each sample
+            # is uniformly random and in uniformly random order
+            res_sorted = np.sort(res[redraw], axis=1)
+            redraw = redraw[(res_sorted[:, 1:] == res_sorted[:, :-1]).any(axis=1)]
+            if not redraw.size: break
+            res[redraw] = rng.integers(0, n, size=(redraw.size, k), dtype=np.int64)
+        return np.sort(res, axis=1) if sort else res
+    chunk = max(1, (1 << 22) // n)
+    parts = []
+    for i0 in range(0, n_samples, chunk):
+        keys = rng.random((min(chunk, n_samples - i0), n))
+        if k < n:
+            part = np.argpartition(keys, k - 1, axis=1)[:, :k]
+            if not sort:
+                # The order given by argpartition() is not random
+                part = np.take_along_axis(part,\
+                        np.argsort(np.take_along_axis(keys, part, axis=1), axis=1), axis=1)
+        else:
+            part = np.argsort(keys, axis=1)
+        parts.append(part)
+    res = np.concatenate(parts).astype(np.int64, copy=False)
+    return np.sort(res, axis=1) if sort else res
+
+def randomKSubsetsMany(n: int, k: int, n_samples: int,\
+        rng: Optional[np.random.Generator]=None) -> np.ndarray:
+    """
+    Draws n_samples independent uniformly random subsets of size k of
+    the integers 0 to (n - 1) inclusive (see
+    randomDistinctIntegersMany()).
+
+    Returns:
+    2D numpy int64 array of shape (n_samples, k) whose rows give the
+    elements of the subsets in increasing order.
+    """
+    return randomDistinctIntegersMany(n, k, n_samples, rng=rng, sort=True)
+
+def randomIntegersMany(n: int, size: Union[int, Tuple[int]],\
+        rng: Optional[np.random.Generator]=None) -> np.ndarray:
+    """
+    Draws integers independently and uniformly at random from 0 to
+    (n - 1) inclusive (i.e. samples with replacement), as a numpy
+    int64 array of the given shape.
+    """
+    if rng is None: rng = np.random.default_rng()
+    return rng.integers(0, n, size=size, dtype=np.int64)
+
 def randomKTupleGenerator(n: int, k: int,\
         mx_n_samples: int, allow_index_repeats: bool,\
-        allow_tuple_repeats: bool, nondecreasing: bool)\
+        allow_tuple_repeats: bool, nondecreasing: bool,\
+        rng: Optional[random.Random]=None)\
         -> Generator[Tuple[int], None, None]:
+    if rng is None: rng = random
     
     if nondecreasing:
         count_func = countFunctionNondecreasing if allow_index_repeats\
@@ -281,10 +771,9 @@ def randomKTupleGenerator(n: int, k: int,\
     
     tot = count_func(n, k)
     #print(mx_n_samples, tot)
-    inds = [random.choice(range(tot)) for _ in range(mx_n_samples)]\
+    inds = [rng.randrange(tot) for _ in range(mx_n_samples)]\
             if allow_tuple_repeats else\
-            randomSampleWithoutReplacement(tot,\
-            min(mx_n_samples, tot))
+            randomKSubset(tot, min(mx_n_samples, tot), rng=rng)
     yield from gen_func(inds, n,\
             k, allow_index_repeats, inds_sorted=False)
 
@@ -0,0 +1,192 @@
+# library/src/anguis/vector.py
+
+from __future__ import annotations
+
+from typing import Union, Tuple, List, Set, Dict, Optional, Callable, Any
+
+import numpy as np
+
+from anguis.arena import getArena
+from anguis.engine import moves, move_codes
+
+class VectorGame:
+    """
+    Batch of n_games independent games of Anguis on arenas of the
+    same shape, stored as NumPy arrays so that all of the games can be
+    advanced simultaneously with a single call to step(). The rules
+    are the same as those of GameState.
+
+    Each move is given as an action code, being the index of the move
+    in anguis.engine.moves.
+
+    Attributes:
+        n_games (int): the number of games in the batch
+        arena_shape (2-tuple of ints): the dimensions of each arena
+        snake (2D numpy bool array): snake[i, j] is True if and only
+            if flattened position j is occupied by the snake in game i
+        fruit (2D numpy bool array): fruit[i, j] is True if and only
+            if there is a fruit at flattened position j in game i
+        body (2D numpy int array): ring buffer of the flattened
+            positions occupied by the snake in each game, with
+            body[i, head_ptr[i]] being the head in game i and the
+            preceding length[i] - 1 entries (cyclically) the tail
+        head_ptr (1D numpy int array): the index in body of the head
+            of the snake in each game
+        length (1D numpy int array): the length of the snake in each
+            game
+        score (1D numpy int array): the number of fruits eaten in each
+            game
+        done (1D numpy bool array): whether each game has finished
+        n_moves (1D numpy int array): the number of moves made in each
+            game
+    """
+    def __init__(
+        self,
+        n_games: int,
+        arena_shape: Tuple[int, int],
+        head_init_pos: Optional[Tuple[int, int]]=None,
+        n_fruit: int=1,
+        seed: Optional[int]=None,
+    ):
+        self.n_games = n_games
+        self.arena_shape = arena_shape
+        self.length_max = arena_shape[0] * arena_shape[1]
+        self.head_init_pos = tuple(x // 2 for x in arena_shape)\
+                if head_init_pos is None else head_init_pos
+        self.n_fruit = n_fruit
+        self.rng = np.random.default_rng(seed)
+        # The cell reached by each action code from each cell (see
+        # Arena.next_table)
+        self._next_table = getArena(arena_shape).next_table
+
+        idx_dtype = np.min_scalar_type(self.length_max)
+        self.snake = np.zeros((n_games, self.length_max), dtype=bool)
+        self.fruit = np.zeros((n_games, self.length_max), dtype=bool)
+        self.body = np.zeros((n_games, self.length_max), dtype=idx_dtype)
+        self.head_ptr = np.zeros(n_games, dtype=np.int64)
+        self.length = np.zeros(n_games, dtype=np.int64)
+        self.score = np.zeros(n_games, dtype=np.int64)
+        self.done = np.zeros(n_games, dtype=bool)
+        self.n_moves = np.zeros(n_games, dtype=np.int64)
+        self.reset()
+
+    @property
+    def head(self) -> np.ndarray:
+        return self.body[np.arange(self.n_games), self.head_ptr]
+
+    @property
+    def tail_end(self) -> np.ndarray:
+        return self.body[np.arange(self.n_games),\
+                (self.head_ptr - self.length + 1) % self.length_max]
+
+    def reset(self, inds: Optional[np.ndarray]=None) -> None:
+        """
+        Returns the specified games to their initial state, with the
+        snake consisting of only the head at its initial position and
+        n_fruit fruits placed at random unoccupied positions.
+
+        Args:
+            inds (1D numpy int or bool array), optional: the games to
+                be reset. If not given or given as None, resets every
+                game.
+        """
+        if inds is None:
+            inds = np.arange(self.n_games)
+        elif inds.dtype == bool:
+            inds = np.flatnonzero(inds)
+        hp = self.head_init_pos
+        hp_flat = hp[0] * self.arena_shape[1] + hp[1]
+        self.snake[inds] = False
+        self.fruit[inds] = False
+        self.snake[inds, hp_flat] = True
+        self.body[inds, 0] = hp_flat
+        self.head_ptr[inds] = 0
+        self.length[inds] = 1
+        self.score[inds] = 0
+        self.done[inds] = False
+        self.n_moves[inds] = 0
+        for _ in range(self.n_fruit):
+            self.randomSpawn(inds)
+        return
+
+    def randomSpawn(self, inds: np.ndarray) -> np.ndarray:
+        """
+        Places a single fruit in each of the specified games at an
+        unoccupied position chosen uniformly at random. Any of those
+        games with no unoccupied position are marked as done.
+
+        Args:
+            inds (1D numpy int array): the games in which a fruit
+                should be placed
+
+        Returns:
+        1D numpy bool array giving for each of the specified games
+        whether a fruit was successfully placed.
+        """
+        if not len(inds):
+            return np.zeros(0, dtype=bool)
+        free = ~(self.snake[inds] | self.fruit[inds])
+        cumul = np.cumsum(free, axis=1)
+        n_free = cumul[:, -1]
+        placed = n_free > 0
+        r = self.rng.integers(0, np.maximum(n_free, 1))
+        pos_flat = np.argmax(cumul > r[:, None], axis=1)
+        self.fruit[inds[placed], pos_flat[placed]] = True
+        self.done[inds[~placed]] = True
+        return placed
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Makes one move in every game that has not already finished.
+
+        Args:
+            actions (1D numpy int array): for each game, the action
+                code of the move to be made (ignored for games that
+                have already finished)
+
+        Returns:
+        2-tuple whose index 0 is a 1D numpy bool array giving whether
+        each game has finished and whose index 1 is a 1D numpy int
+        array giving the score in each game. These are copies, so are
+        not changed by later moves.
+        """
+        actions = np.asarray(actions)
+        act = np.flatnonzero(~self.done)
+        if not len(act):
+            return self.done.copy(), self.score.copy()
+        a = actions[act]
+        ptr = self.head_ptr[act]
+        head = self.body[act, ptr].astype(np.int64)
+
+        # Walls
+        pos2 = self._next_table[a, head]
+        in_bounds = pos2 >= 0
+        pos2 = np.where(in_bounds, pos2, head)
+
+        # Tail and fruit. The end of the tail moves out of the way at
+        # the same time as the head moves unless a fruit is eaten
+        hit_fruit = in_bounds & self.fruit[act, pos2]
+        tail_ptr = (ptr - self.length[act] + 1) % self.length_max
+        tail_end = self.body[act, tail_ptr].astype(np.int64)
+        collide = self.snake[act, pos2] & ~hit_fruit & (pos2 != tail_end)
+        alive = in_bounds & ~collide
+        self.n_moves[act] += 1
+        self.done[act[~alive]] = True
+
+        # Games continuing without eating
+        mv = alive & ~hit_fruit
+        self.snake[act[mv], tail_end[mv]] = False
+        # Games in which a fruit was eaten
+        ate = act[hit_fruit]
+        self.fruit[ate, pos2[hit_fruit]] = False
+        self.length[ate] += 1
+        self.score[ate] += 1
+        # Moving the head
+        act, pos2, ptr = act[alive], pos2[alive], ptr[alive]
+        ptr = (ptr + 1) % self.length_max
+        self.head_ptr[act] = ptr
+        self.body[act, ptr] = pos2
+        self.snake[act, pos2] = True
+
+        self.randomSpawn(ate)
+        return self.done.copy(), self.score.copy()
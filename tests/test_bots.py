@@ -0,0 +1,109 @@
+import random
+from collections import deque
+
+import numpy as np
+import pytest
+
+from anguis.engine import GameState, cell_empty, cell_body, cell_head
+from anguis.bots import TailChaserBot, BotMoveWorker
+from anguis.sim import playBotGame
+
+def assertFruitDistancesMatchRebuild(bot: TailChaserBot) -> None:
+    # The incrementally updated distances to the fruits should equal
+    # those found by a full breadth first search
+    expected = bot.createFruitDistanceField(bot.fruits)
+    np.testing.assert_array_equal(bot.fruit_dist, expected)
+
+@pytest.mark.parametrize("shares_state", [False, True])
+def test_fruit_distances_head_enters_vacated_cell(shares_state):
+    # A snake filling the top left 2x2 block of a 3x3 arena, whose head
+    # moves into the cell just vacated by the end of its tail
+    shape = (3, 3)
+    snake = [0, 1, 4, 3]
+    fruit = 8
+    if shares_state:
+        grid = bytearray(9)
+        for idx in snake:
+            grid[idx] = cell_body
+        grid[snake[-1]] = cell_head
+        grid[fruit] = 1
+        snake_qu = deque(snake)
+        bot = TailChaserBot(shape, snake[-1], head_direct=(1, -1), fruits={fruit},\
+                snake_qu=snake_qu, grid=grid)
+        grid[snake_qu[-1]] = cell_body
+        grid[snake_qu.popleft()] = cell_empty
+        grid[0] = cell_head
+        snake_qu.append(0)
+        bot.update(0, (0, -1), None, rm_tail_end=True, rm_tail_idx=0)
+    else:
+        bot = TailChaserBot(shape, snake[-1], head_direct=(1, -1), fruits={fruit},\
+                snake_qu=deque(snake))
+        bot.update(0, (0, -1), None)
+    assert bot.fruit_dist[0] == bot.dist_inf
+    assertFruitDistancesMatchRebuild(bot)
+
+@pytest.mark.parametrize("shares_state", [False, True])
+@pytest.mark.parametrize("tt_size_log2", [None, 15])
+def test_fruit_distances_match_rebuild_over_game(shares_state, tt_size_log2):
+    shape, seed = (6, 7), 1
+    state = GameState(shape, head_init_direct=(0, 0), seed=seed)
+    bot = TailChaserBot(
+        shape,
+        state.head_pos_flat,
+        head_direct=state.head_direct,
+        fruits=set(state.fruits),
+        snake_qu=state.snake_qu if shares_state else deque(state.snake_qu),
+        grid=state.grid if shares_state else None,
+        rng=random.Random(f"bot:{seed}"),
+        tt_size_log2=tt_size_log2,
+    )
+    add_fruit = None
+    n_vacated_entered = 0
+    for _ in range(2000):
+        mv = bot.addFruitFindMoveAndUpdate(add_fruit=add_fruit, search_depth=2)
+        assertFruitDistancesMatchRebuild(bot)
+        tail_end = state.snake_qu[0]
+        alive, hit_fruit, spawned = state.step(mv)
+        if not alive: break
+        n_vacated_entered += (state.head_pos_flat == tail_end)
+        add_fruit = spawned[0] if spawned else None
+    # The game should include moves into the cell just vacated by the
+    # end of the tail
+    assert n_vacated_entered
+
+@pytest.mark.parametrize("seed", [0, 2, 7])
+def test_safe_path_bot_breaks_out_of_cycles(seed):
+    # Games in which following the tail once circled without end in the
+    # endgame, so were abandoned after the maximum number of moves
+    res = playBotGame((6, 6), seed=seed, bot="safe-path")
+    assert res["outcome"] != "timeout"
+
+def test_principal_variation_is_legal_and_starts_with_move():
+    shape, seed = (6, 7), 3
+    state = GameState(shape, head_init_direct=(0, 0), seed=seed)
+    bot = TailChaserBot(shape, state.head_pos_flat, head_direct=state.head_direct,\
+            fruits=set(state.fruits), snake_qu=state.snake_qu, grid=state.grid,\
+            rng=random.Random(f"bot:{seed}"))
+    add_fruit = None
+    for _ in range(100):
+        head_idx = state.head_pos_flat
+        mv = bot.addFruitFindMoveAndUpdate(add_fruit=add_fruit, search_depth=4,\
+                time_budget_ms=1000)
+        pv = bot.principal_variation
+        assert pv[0][0] == mv
+        assert len(pv) <= bot.last_search_depth
+        # Each move of the principal variation is to a cell adjacent to
+        # the head position after the previous one
+        for _, idx in pv:
+            assert idx in bot.arena.neighbours[head_idx]
+            head_idx = idx
+        alive, hit_fruit, spawned = state.step(mv)
+        if not alive: break
+        add_fruit = spawned[0] if spawned else None
+
+def test_bot_move_worker_records_search_time():
+    state = GameState((6, 7), head_init_direct=(0, 0), seed=0)
+    with BotMoveWorker(state, rng=random.Random(0)) as worker:
+        mv = worker.getMove(timeout=10)
+    assert mv in {(0, -1), (0, 1), (1, -1), (1, 1)}
+    assert worker.last_search_ns > 0